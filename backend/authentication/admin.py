@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from bussewa_api.authentication import revoke_user_tokens
 from .models import User, UserProfile
 
 class UserProfileInline(admin.StackedInline):
@@ -47,17 +48,27 @@ class UserAdmin(BaseUserAdmin):
     actions = ['activate_users', 'deactivate_users', 'grant_seat_permissions']
     
     def activate_users(self, request, queryset):
+        users = list(queryset)
         updated = queryset.update(is_active=True)
+        # update() sends no signals: revoke the tokens issued under the old flags here
+        for user in users:
+            revoke_user_tokens(user)
         self.message_user(request, f'{updated} users activated.')
     activate_users.short_description = 'Activate selected users'
     
     def deactivate_users(self, request, queryset):
+        users = list(queryset)
         updated = queryset.update(is_active=False)
+        for user in users:
+            revoke_user_tokens(user)
         self.message_user(request, f'{updated} users deactivated.')
     deactivate_users.short_description = 'Deactivate selected users'
     
     def grant_seat_permissions(self, request, queryset):
+        users = list(queryset)
         updated = queryset.update(can_modify_seat_allocation=True, can_cancel_seats=True)
+        for user in users:
+            revoke_user_tokens(user)
         self.message_user(request, f'Seat permissions granted to {updated} users.')
     grant_seat_permissions.short_description = 'Grant seat permissions'
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from . import directory  # noqa: F401  (connects invalidation receivers)
+        from . import revocation  # noqa: F401  (connects token revocation receivers)
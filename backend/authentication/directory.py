@@ -0,0 +1,103 @@
+"""
+Cached user directory.
+
+``get_directory()`` returns every active user with their profile name, as
+served by ``list_users`` and used by ``current_user``. It is built from a
+single ``select_related('profile')`` query; users without a profile get
+one in a single ``bulk_create``. The result is cached in the default cache
+under a version number that is bumped after any committed write to a user
+or profile (logins, which only touch ``last_login``, are ignored), so a
+hit costs no queries at all.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User, UserProfile
+
+VERSION_KEY = 'user-directory-version'
+IGNORED_FIELDS = {'last_login', 'last_login_ip'}
+
+
+def version():
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # Seeded from the clock so a version lost to eviction never
+        # resurrects a directory cached under an earlier one.
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        current = cache.get(VERSION_KEY, 0)
+    return current
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def ensure_profiles(users):
+    """Give every user in ``users`` (fetched with ``select_related('profile')``) a profile."""
+    missing = []
+    for user in users:
+        try:
+            user.profile
+        except UserProfile.DoesNotExist:
+            missing.append(UserProfile(user=user, full_name=user.get_full_name() or user.username))
+    if missing:
+        UserProfile.objects.bulk_create(missing, ignore_conflicts=True)
+        for profile in missing:
+            profile.user.profile = profile
+
+
+def build_directory():
+    users = list(User.objects.filter(is_active=True).select_related('profile').order_by('username'))
+    ensure_profiles(users)
+    return [
+        {
+            'id': user.id,
+            'username': user.username,
+            'full_name': user.profile.full_name,
+            'role': user.role,
+        }
+        for user in users
+    ]
+
+
+def get_directory():
+    key = f'user-directory:{version()}'
+    directory = cache.get(key)
+    if directory is None:
+        directory = build_directory()
+        cache.set(key, directory)
+    return directory
+
+
+def full_name(user):
+    """Profile name of ``user``, from the directory when they are in it."""
+    for entry in get_directory():
+        if entry['id'] == user.id:
+            return entry['full_name']
+    profile, created = UserProfile.objects.get_or_create(
+        user_id=user.id,
+        defaults={'full_name': user.get_full_name() or user.username}
+    )
+    return profile.full_name
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=UserProfile)
+def directory_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= IGNORED_FIELDS:
+        return
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=UserProfile)
+def directory_deleted(sender, instance, **kwargs):
+    transaction.on_commit(invalidate)
@@ -0,0 +1,38 @@
+"""
+Revoke a user's API tokens when what they were issued for changes.
+
+Bearer tokens carry the role and staff flag and are trusted without a
+database lookup until they expire, so any change to those, to
+``is_active`` or to the password, and deleting the user, deny-lists every
+token issued so far. Saves are compared with the stored row in
+``pre_save``; queryset ``update()`` bypasses the signals, so callers such
+as the admin actions revoke explicitly.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from bussewa_api.authentication import revoke_user_tokens
+from .models import User
+
+TOKEN_FIELDS = ('is_active', 'role', 'is_staff', 'password')
+
+
+@receiver(pre_save, sender=User)
+def remember_token_fields(sender, instance, update_fields=None, **kwargs):
+    instance._token_fields_changed = False
+    if instance.pk is None or (update_fields is not None and not set(update_fields) & set(TOKEN_FIELDS)):
+        return  # e.g. the last_login update on every login
+    stored = User.objects.filter(pk=instance.pk).values(*TOKEN_FIELDS).first()
+    instance._token_fields_changed = stored is not None and any(stored[f] != getattr(instance, f) for f in TOKEN_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if getattr(instance, '_token_fields_changed', False):
+        revoke_user_tokens(instance)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    revoke_user_tokens(instance)
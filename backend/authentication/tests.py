@@ -1,3 +1,147 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from bussewa_api.authentication import issue_token
+from bussewa_api.testing import EndpointBudgetTestCase
+from .admin import UserAdmin
+from .models import User, UserProfile
+
+
+class EndpointBudgetTests(EndpointBudgetTestCase):
+    def test_current_user(self):
+        self.assertWithinBudget('/api/auth/current-user/')
+
+    def test_list_users(self):
+        self.assertWithinBudget('/api/auth/users/')
+
+
+class SignedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='pw', role='admin')
+        self.volunteer = User.objects.create_user('volunteer', password='pw', role='volunteer')
+
+    def login(self, username):
+        response = self.client.post('/api/auth/login/', json.dumps({'username': username, 'password': 'pw'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+        return response.json()['token']
+
+    def get(self, url, token):
+        return self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_login_returns_token(self):
+        response = self.client.post('/api/auth/login/', json.dumps({'username': 'volunteer', 'password': 'pw'}),
+                                    content_type='application/json')
+        self.assertIn('token', response.json())
+        self.assertEqual(response.json()['token_expires_in'], 28800)
+
+    def test_read_with_token_makes_no_writes_and_skips_users_and_sessions(self):
+        token = self.login('volunteer')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/api/buses/', token)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            sql = query['sql'].upper()
+            self.assertTrue(sql.startswith('SELECT'), sql)
+            self.assertNotIn('FROM "AUTHENTICATION_USER"', sql)
+            self.assertNotIn('DJANGO_SESSION', sql)
+        self.assertNotIn('sessionid', response.cookies)
+
+    def test_role_comes_from_token(self):
+        self.assertEqual(self.get('/api/_metrics', self.login('volunteer')).status_code, 403)
+        self.assertEqual(self.get('/api/_metrics', issue_token(self.admin)).status_code, 200)
+
+    def test_tampered_and_expired_tokens_are_rejected(self):
+        token = self.login('volunteer')
+        self.assertEqual(self.get('/api/buses/', token[:-2] + 'xx').status_code, 403)
+        with override_settings(API_TOKEN_MAX_AGE=60), mock.patch('time.time', return_value=10**10):
+            self.assertEqual(self.get('/api/buses/', token).status_code, 403)
+
+    def test_logout_revokes_token(self):
+        token = self.login('volunteer')
+        self.client.post('/api/auth/logout/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.get('/api/buses/', token).status_code, 403)
+        self.assertEqual(self.get('/api/buses/', self.login('volunteer')).status_code, 200)
+
+    def test_deactivation_revokes_existing_tokens(self):
+        token = self.login('volunteer')
+        admin_token = self.login('admin')
+        response = self.client.post(f'/api/auth/users/{self.volunteer.id}/toggle_status/',
+                                    HTTP_AUTHORIZATION=f'Bearer {admin_token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get('/api/buses/', token).status_code, 403)
+        self.assertEqual(self.get('/api/buses/', admin_token).status_code, 200)
+
+    def test_role_change_saved_anywhere_revokes_tokens(self):
+        token = self.login('volunteer')
+        self.volunteer.role = 'viewer'
+        self.volunteer.save()
+        self.assertEqual(self.get('/api/buses/', token).status_code, 403)
+
+    def test_unrelated_saves_keep_tokens(self):
+        token = self.login('volunteer')
+        self.volunteer.first_name = 'Asha'
+        self.volunteer.save()
+        self.login('volunteer')  # updates last_login
+        self.assertEqual(self.get('/api/buses/', token).status_code, 200)
+
+    def test_admin_actions_and_deletion_revoke_tokens(self):
+        token, admin_token = self.login('volunteer'), self.login('admin')
+        with mock.patch.object(UserAdmin, 'message_user'):
+            UserAdmin(User, admin.site).deactivate_users(None, User.objects.filter(pk=self.volunteer.pk))
+        self.assertEqual(self.get('/api/buses/', token).status_code, 403)
+
+        self.admin.delete()
+        self.assertEqual(self.get('/api/buses/', admin_token).status_code, 403)
+
+
+
+class UserDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user('admin', password='pw', role='admin')
+        UserProfile.objects.create(user=self.admin, full_name='Admin User')
+        User.objects.bulk_create(User(username=f'volunteer-{n}', role='volunteer') for n in range(30))
+        self.client.force_login(self.admin)
+
+    def test_missing_profiles_are_created_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/auth/users/')
+        self.assertEqual(len(response.json()), 31)
+        self.assertEqual(UserProfile.objects.count(), 31)
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_directory_is_served_from_cache_until_a_user_changes(self):
+        self.client.get('/api/auth/users/')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/auth/users/')
+        self.assertFalse([query for query in queries.captured_queries if 'USERPROFILE' in query['sql'].upper()])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProfile.objects.filter(user=self.admin).update(full_name='Renamed')
+            UserProfile.objects.get(user=self.admin).save()
+        names = {user['username']: user['full_name'] for user in self.client.get('/api/auth/users/').json()}
+        self.assertEqual(names['admin'], 'Renamed')
+        self.assertEqual(self.client.get('/api/auth/current-user/').json()['full_name'], 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(username='volunteer-0').delete()
+        self.assertEqual(len(self.client.get('/api/auth/users/').json()), 30)
+
+    def test_login_does_not_invalidate_directory(self):
+        self.client.get('/api/auth/users/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/login/', json.dumps({'username': 'admin', 'password': 'pw'}),
+                             content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/auth/users/')
+        self.assertFalse([query for query in queries.captured_queries if 'USERPROFILE' in query['sql'].upper()])
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.middleware.csrf import get_token
@@ -9,6 +10,8 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from bussewa_api.authentication import bearer_token, issue_token, revoke_token, revoke_user_tokens
+from . import directory
 from .models import User, UserProfile
 from .serializers import UserSerializer, UserProfileSerializer
 import json
@@ -44,6 +47,9 @@ class LoginView(View):
                 
                 response = JsonResponse({
                     'success': True,
+                    # Bearer token for API clients that don't keep a session
+                    'token': issue_token(user),
+                    'token_expires_in': settings.API_TOKEN_MAX_AGE,
                     'user': {
                         'id': user.id,
                         'username': user.username,
@@ -66,6 +72,9 @@ class LoginView(View):
 @method_decorator(csrf_exempt, name='dispatch')
 class LogoutView(View):
     def post(self, request):
+        token = bearer_token(request)
+        if token:
+            revoke_token(token)
         logout(request)
         return JsonResponse({'success': True})
 
@@ -74,16 +83,12 @@ class LogoutView(View):
 @permission_classes([IsAuthenticated])
 def current_user(request):
     user = request.user
-    profile, created = UserProfile.objects.get_or_create(
-        user=user,
-        defaults={'full_name': user.get_full_name() or user.username}
-    )
     
     return Response({
         'id': user.id,
         'username': user.username,
         'role': user.role,
-        'full_name': profile.full_name,
+        'full_name': directory.full_name(user),
         'is_staff': user.is_staff,
         'permissions': {
             'can_delete': user.role == 'admin',
@@ -138,23 +143,7 @@ def register_user(request):
 @permission_classes([IsAuthenticated])
 def list_users(request):
     """List all users for dropdown purposes"""
-    users = User.objects.filter(is_active=True).order_by('username')
-    user_data = []
-    
-    for user in users:
-        profile, created = UserProfile.objects.get_or_create(
-            user=user,
-            defaults={'full_name': user.get_full_name() or user.username}
-        )
-        
-        user_data.append({
-            'id': user.id,
-            'username': user.username,
-            'full_name': profile.full_name,
-            'role': user.role
-        })
-    
-    return Response(user_data)
+    return Response(directory.get_directory())
 
 @csrf_exempt
 @api_view(['POST'])
@@ -228,6 +217,7 @@ def toggle_user_status(request, user_id):
         user = User.objects.get(id=user_id)
         user.is_active = not user.is_active
         user.save()
+        revoke_user_tokens(user)
         
         return Response({
             'success': True,
@@ -255,6 +245,7 @@ def update_user_permissions(request, user_id):
         user.can_modify_seat_allocation = can_modify
         user.can_cancel_seats = can_cancel
         user.save()
+        revoke_user_tokens(user)
         
         return Response({'message': 'Permissions updated successfully'})
     except User.DoesNotExist:
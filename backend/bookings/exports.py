@@ -0,0 +1,127 @@
+"""
+Streaming manifest export.
+
+``manifest_zip(journey)`` yields a zip archive with one CSV per bus of the
+journey - reserved passengers by seat, then on-spot passengers - in the
+same columns as the per-bus export in ExportData.tsx. The whole journey is
+read with two queries (bookings and on-spot passengers, both ordered by
+bus) through ``.iterator()``, and zip bytes are handed on as soon as they
+are written, so memory stays flat however large the journey is.
+"""
+
+import codecs
+import csv
+import io
+import zipfile
+from itertools import groupby
+
+from django.db.models.functions import Length
+
+from .models import Booking, Bus, OnSpotPassenger
+
+CHUNK_ROWS = 2000
+CHUNK_BYTES = 64 * 1024
+COLUMNS = ['S.No.', 'Type', 'Name', 'Age', 'Mobile', 'Seat Number', 'Amount', 'Payment Status', 'Volunteer', 'Attendance']
+
+
+class _Pipe(io.RawIOBase):
+    """Write-only, unseekable file whose contents are drained by the generator."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _attendance(value):
+    return 'Present' if value is True else 'Absent' if value is False else ''
+
+
+def _csv_line(row):
+    line = io.StringIO()
+    csv.writer(line).writerow(row)
+    return line.getvalue().encode('utf-8')
+
+
+def _bus_rows(leg, bookings, onspot_passengers):
+    number = 0
+    for booking in bookings:
+        number += 1
+        amount = booking['custom_amount'] if booking['custom_amount'] else booking[f'{leg}_price']
+        yield [
+            number, 'Reserved', booking['passenger__name'], booking['passenger__age'], booking['passenger__mobile_no'],
+            booking[f'{leg}_seat_number'], f'{amount:.2f}', booking['payment_status'],
+            'Yes' if booking['is_volunteer'] else 'No', _attendance(booking[f'{leg}_attendance']),
+        ]
+    for passenger in onspot_passengers:
+        number += 1
+        yield [
+            number, 'On-Spot', passenger['name'], passenger['age'], passenger['mobile_no'],
+            'Standing', f'{passenger["calculated_price"]:.2f}', passenger['payment_status'],
+            'No', _attendance(passenger['attendance']),
+        ]
+
+
+def manifest_zip(journey):
+    """Yield the zipped per-bus manifests of ``journey`` chunk by chunk."""
+    leg = journey.journey_type.lower()
+    buses = list(Bus.objects.filter(journey=journey).order_by('id').values_list('id', 'bus_number'))
+    bookings = groupby(
+        Booking.objects.filter(**{f'{leg}_bus__journey': journey, 'status': 'Active'})
+        # Seat numbers are text: shorter first puts seat 2 before seat 10, as printing does
+        .order_by(f'{leg}_bus_id', Length(f'{leg}_seat_number'), f'{leg}_seat_number', 'id')
+        .values(
+            f'{leg}_bus_id', f'{leg}_seat_number', f'{leg}_price', f'{leg}_attendance', 'custom_amount',
+            'payment_status', 'is_volunteer', 'passenger__name', 'passenger__age', 'passenger__mobile_no',
+        )
+        .iterator(chunk_size=CHUNK_ROWS),
+        key=lambda booking: booking[f'{leg}_bus_id'],
+    )
+    onspot_passengers = groupby(
+        OnSpotPassenger.objects.filter(bus__journey=journey, journey_type=journey.journey_type)
+        .order_by('bus_id', 'id')
+        .values('bus_id', 'name', 'age', 'mobile_no', 'calculated_price', 'payment_status', 'attendance')
+        .iterator(chunk_size=CHUNK_ROWS),
+        key=lambda passenger: passenger['bus_id'],
+    )
+    next_bookings = next(bookings, (None, iter(())))
+    next_onspot = next(onspot_passengers, (None, iter(())))
+
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for bus_id, bus_number in buses:
+            bus_bookings, bus_onspot = (), ()
+            # Both streams are ordered by bus id, like ``buses``
+            if next_bookings[0] == bus_id:
+                bus_bookings = next_bookings[1]
+            if next_onspot[0] == bus_id:
+                bus_onspot = next_onspot[1]
+
+            name = (bus_number or str(bus_id)).replace('/', '-')
+            with archive.open(f'bus_{name}_passengers.csv', 'w', force_zip64=True) as entry:
+                entry.write(codecs.BOM_UTF8 + _csv_line(COLUMNS))  # BOM so Excel reads UTF-8
+                for row in _bus_rows(leg, bus_bookings, bus_onspot):
+                    entry.write(_csv_line(row))
+                    if len(pipe.buffer) >= CHUNK_BYTES:
+                        yield pipe.drain()
+
+            if next_bookings[0] == bus_id:
+                next_bookings = next(bookings, (None, iter(())))
+            if next_onspot[0] == bus_id:
+                next_onspot = next(onspot_passengers, (None, iter(())))
+    yield pipe.drain()  # the rest of the last entry and the central directory
@@ -0,0 +1,363 @@
+import math
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from authentication.models import User
+from bookings import manifest_cache
+from bookings.models import Booking, Bus, Journey, OnSpotPassenger, Payment, PickupPoint, SeatCancellation
+from passengers.models import Passenger
+
+MALE_NAMES = ['Ramesh', 'Suresh', 'Arjun', 'Vikas', 'Rahul', 'Amit', 'Sanjay', 'Manoj', 'Deepak', 'Harish',
+              'Gopal', 'Mohan', 'Prakash', 'Anil', 'Ravi', 'Kishore', 'Naveen', 'Sunil', 'Ajay', 'Rohit']
+FEMALE_NAMES = ['Sita', 'Lakshmi', 'Priya', 'Anita', 'Sunita', 'Kavita', 'Meena', 'Pooja', 'Rekha', 'Asha',
+                'Geeta', 'Radha', 'Savita', 'Neha', 'Usha', 'Shobha', 'Nirmala', 'Komal', 'Jyoti', 'Kiran']
+SURNAMES = ['Kumar', 'Sharma', 'Patil', 'Singh', 'Jadhav', 'Deshmukh', 'Gupta', 'Verma', 'Pawar', 'Kulkarni',
+            'Shinde', 'Yadav', 'Joshi', 'More', 'Chavan', 'Rao', 'Naik', 'Gaikwad', 'Bhosale', 'Mishra']
+PICKUP_POINTS = [('Main Gate', 'Temple Main Entrance'), ('Side Gate', 'Temple Side Entrance'),
+                 ('Station Road', 'Railway Station Parking'), ('Bus Stand', 'City Bus Stand'), ('Market', 'Old Market Square')]
+
+# (weight, value) tables for the mix of the generated event
+AGE_BANDS = [(12, (3, 12)), (63, (13, 64)), (15, (65, 74)), (10, (75, 90))]
+FAMILY_SIZES = [(55, 1), (20, 2), (12, 3), (9, 4), (4, 5)]
+CATEGORIES = [(75, 'Satsang'), (25, 'Sewadal')]
+JOURNEY_TYPES = [(80, 'BOTH'), (12, 'ONWARD'), (8, 'RETURN')]
+PAYMENT_STATUSES = [(70, 'Paid'), (5, 'Partial'), (25, 'Pending')]
+PAYMENT_METHODS = [(50, 'Cash'), (35, 'GPay'), (15, 'Online')]
+VERIFICATION_STATUSES = [(60, 'Verified'), (35, 'Pending'), (5, 'Rejected')]
+CANCELLATION_RATE = 0.03
+SEWADAL_VOLUNTEER_RATE = 0.1
+
+
+class Weighted:
+    """Fast repeated weighted choice from a (weight, value) table."""
+
+    def __init__(self, rng, table):
+        self.rng = rng
+        self.values = [value for _, value in table]
+        self.cum_weights = []
+        total = 0
+        for weight, _ in table:
+            total += weight
+            self.cum_weights.append(total)
+
+    def __call__(self):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights)[0]
+
+
+class TableWriter:
+    """
+    Insert plain rows with multi-row INSERT statements.
+
+    At hundreds of thousands of rows bulk_create() spends most of its time
+    compiling every value through the ORM; here defaults are prepared once
+    per column and rows go straight to the cursor. Primary keys are
+    assigned up front so later rows can reference them, and the table's
+    sequence is reset once the command is done.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        now = timezone.now()
+        self.defaults = {}
+        for field in self.fields:
+            value = now if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False) else field.get_default()
+            self.defaults[field.attname] = field.get_db_prep_save(value, connection)
+        self.next_id = (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        self.batch_size = connection.ops.bulk_batch_size(self.fields, [])
+        qn = connection.ops.quote_name
+        self.insert_sql = 'INSERT INTO %s (%s) VALUES ' % (
+            qn(model._meta.db_table), ', '.join(qn(field.column) for field in self.fields)
+        )
+        self.placeholders = '(%s)' % ', '.join(['%s'] * len(self.fields))
+        self.count = 0
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def insert(self, rows):
+        """Insert dicts of attname -> value; rows without an ``id`` get one."""
+        attnames = [field.attname for field in self.fields]
+        params = []
+        for row in rows:
+            if 'id' not in row:
+                row['id'] = self.new_id()
+            params.append([row[name] if name in row else self.defaults[name] for name in attnames])
+        with connection.cursor() as cursor:
+            for start in range(0, len(params), self.batch_size):
+                batch = params[start:start + self.batch_size]
+                cursor.execute(
+                    self.insert_sql + ', '.join([self.placeholders] * len(batch)),
+                    [value for row in batch for value in row],
+                )
+        self.count += len(rows)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic event (journeys, buses, passengers, bookings, payments) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--journeys', type=int, default=1, help='Number of round trips (an onward and a return journey each)')
+        parser.add_argument('--buses-per-journey', type=int, help='Defaults to enough buses to seat everyone, with 5%% spare')
+        parser.add_argument('--bus-capacity', type=int, default=50)
+        parser.add_argument('--passengers', type=int, default=50000)
+        parser.add_argument('--onspot-per-bus', type=int, default=3)
+        parser.add_argument('--volunteers', type=int, default=40, help='Volunteer accounts buses and bookings are assigned to')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date.today() + timedelta(days=30))
+        parser.add_argument('--seed', type=int, default=1, help='Random seed; the same seed generates the same event')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Passengers generated and written per round')
+
+    def handle(self, *args, **options):
+        if options['buses_per_journey'] is None:
+            per_journey = options['passengers'] / max(options['journeys'], 1)
+            options['buses_per_journey'] = math.ceil(per_journey * 1.05 / options['bus_capacity'])
+        if options['passengers'] < 1 or options['journeys'] < 1 or options['buses_per_journey'] < 1:
+            raise CommandError('--passengers, --journeys and --buses-per-journey must be positive')
+
+        started = time.monotonic()
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.choose = {
+            name: Weighted(self.rng, table) for name, table in {
+                'age_band': AGE_BANDS, 'family_size': FAMILY_SIZES, 'category': CATEGORIES,
+                'journey_type': JOURNEY_TYPES, 'payment_status': PAYMENT_STATUSES,
+                'payment_method': PAYMENT_METHODS, 'verification_status': VERIFICATION_STATUSES,
+            }.items()
+        }
+        # Passenger's own rules, evaluated once per (gender, age)
+        self.age_rules = {}
+        for gender in 'MF':
+            for age in range(0, 100):
+                passenger = Passenger(gender=gender, age=age)
+                passenger.age_criteria = passenger.calculate_age_criteria()
+                self.age_rules[gender, age] = (passenger.age_criteria, passenger.calculate_aadhar_required())
+
+        # Rows are written directly, bypassing save(): they are not in the
+        # change log and the manifest cache is invalidated explicitly below.
+        with transaction.atomic():
+            self.setup_event()
+            self.writers = {model: TableWriter(model) for model in (Passenger, Booking, Payment, SeatCancellation, OnSpotPassenger)}
+            remaining = options['passengers']
+            while remaining > 0:
+                families = self.make_families(min(options['batch_size'], remaining))
+                remaining -= sum(len(family) for family in families)
+                self.write_batch(families)
+                self.stdout.write(f'  {self.writers[Passenger].count} passengers...')
+            self.write_onspot_passengers()
+
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), list(self.writers)):
+                    cursor.execute(sql)
+
+        for bus in self.buses:
+            manifest_cache.invalidate(bus.id, bus.journey.journey_type)
+
+        counts = {model._meta.verbose_name_plural: writer.count for model, writer in self.writers.items()}
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(f'{count} {name}' for name, count in counts.items())
+            + f' on {len(self.buses)} buses in {time.monotonic() - started:.1f}s'
+        ))
+
+    def setup_event(self):
+        options = self.options
+        self.pickup_point_ids = [
+            PickupPoint.objects.get_or_create(name=name, defaults={'location': location})[0].id
+            for name, location in PICKUP_POINTS
+        ]
+
+        volunteer_names = [f'volunteer{n:03d}' for n in range(1, options['volunteers'] + 1)]
+        existing = set(User.objects.filter(username__in=volunteer_names).values_list('username', flat=True))
+        User.objects.bulk_create(
+            User(username=name, role='volunteer', can_modify_seat_allocation=True, password=make_password(None))
+            for name in volunteer_names if name not in existing
+        )
+        self.volunteers = dict(User.objects.filter(username__in=volunteer_names).order_by('id').values_list('id', 'username'))
+        self.volunteer_ids = list(self.volunteers) or [None]
+
+        # One (onward journey, return journey) pair per round trip
+        self.trips = []
+        self.buses = []
+        self.seating = {}
+        for trip in range(options['journeys']):
+            onward_date = options['start_date'] + timedelta(days=3 * trip)
+            legs = (
+                Journey.objects.get_or_create(journey_type='ONWARD', journey_date=onward_date)[0],
+                Journey.objects.get_or_create(journey_type='RETURN', journey_date=onward_date + timedelta(days=2))[0],
+            )
+            self.trips.append(legs)
+            for journey in legs:
+                self.seating[journey.id] = self.create_buses(journey)
+
+        # Booking's own pricing rules, evaluated once per leg and age criteria
+        self.prices = {}
+        for journey_type in ('ONWARD', 'RETURN'):
+            for criteria, _ in Passenger.AGE_CATEGORIES:
+                booking = Booking(passenger=Passenger(age_criteria=criteria))
+                self.prices[journey_type, criteria] = Decimal(str(booking.calculate_journey_price(journey_type)))
+
+    def create_buses(self, journey):
+        options = self.options
+        existing = set(Bus.objects.filter(journey=journey).values_list('bus_number', flat=True))
+        Bus.objects.bulk_create(
+            Bus(
+                bus_number=str(number),
+                capacity=options['bus_capacity'],
+                route_name=f'Route {number}',
+                journey=journey,
+                assigned_volunteer_id=self.volunteer_ids[number % len(self.volunteer_ids)],
+            )
+            for number in range(1, options['buses_per_journey'] + 1)
+            if str(number) not in existing
+        )
+        buses = list(Bus.objects.filter(journey=journey).select_related('journey').order_by('id'))
+        self.buses += buses
+        # Seat cursor for the leg: [buses, index of the bus being filled, seats taken on it]
+        return [buses, 0, 0]
+
+    def take_seats(self, journey, count):
+        """Seat a family together; returns (bus id, [seat numbers]) or (None, [''] * count)."""
+        cursor = self.seating[journey.id]
+        buses, index, taken = cursor
+        while index < len(buses) and taken + count > buses[index].capacity:
+            index, taken = index + 1, 0
+        if index == len(buses):
+            cursor[1:] = [index, taken]
+            return None, [''] * count
+        cursor[1:] = [index, taken + count]
+        return buses[index].id, [str(taken + n + 1) for n in range(count)]
+
+    def make_person(self, gender=None, ages=None, surname=None):
+        rng = self.rng
+        gender = gender or rng.choice('MF')
+        age = rng.randint(*(ages or self.choose['age_band']()))
+        age_criteria, aadhar_required = self.age_rules[gender, age]
+        person = {
+            'name': f'{rng.choice(MALE_NAMES if gender == "M" else FEMALE_NAMES)} {surname or rng.choice(SURNAMES)}',
+            'gender': gender,
+            'age': age,
+            'age_criteria': age_criteria,
+            'mobile_no': f'{rng.randint(6, 9)}{rng.randrange(10 ** 9):09d}',
+            'category': 'Bal Sewadal' if age <= 12 else self.choose['category'](),
+            'aadhar_required': aadhar_required,
+        }
+        if aadhar_required:
+            person['aadhar_number'] = f'{rng.randint(2, 9)}{rng.randrange(10 ** 11):011d}'
+            person['aadhar_received'] = rng.random() < 0.8
+            person['verification_status'] = self.choose['verification_status']()
+        return person
+
+    def make_families(self, size):
+        """Families (head first) totalling ``size`` passengers."""
+        rng = self.rng
+        families = []
+        total = 0
+        while total < size:
+            family_size = min(self.choose['family_size'](), size - total)
+            surname = rng.choice(SURNAMES)
+            head = self.make_person(ages=(25, 70), surname=surname)
+            head['id'] = self.writers[Passenger].new_id()
+            family = [head]
+            for n in range(family_size - 1):
+                if n == 0 and rng.random() < 0.7:
+                    member = self.make_person('F' if head['gender'] == 'M' else 'M', (max(head['age'] - 8, 18), head['age'] + 5), surname)
+                    member['relationship'] = 'Spouse'
+                else:
+                    member = self.make_person(ages=(3, max(head['age'] - 20, 3)), surname=surname)
+                    member['relationship'] = 'Son' if member['gender'] == 'M' else 'Daughter'
+                member['id'] = self.writers[Passenger].new_id()
+                member['related_to_id'] = head['id']
+                family.append(member)
+            families.append(family)
+            total += family_size
+        return families
+
+    def write_batch(self, families):
+        rng = self.rng
+        bookings, payments, cancellations = [], [], []
+        for family in families:
+            onward, returning = rng.choice(self.trips)
+            journey_type = self.choose['journey_type']()
+            legs = []
+            if journey_type in ('BOTH', 'ONWARD'):
+                legs.append(('onward', onward, *self.take_seats(onward, len(family))))
+            if journey_type in ('BOTH', 'RETURN'):
+                legs.append(('return', returning, *self.take_seats(returning, len(family))))
+            pickup_point_id = rng.choice(self.pickup_point_ids)
+            volunteer_id = rng.choice(self.volunteer_ids)
+
+            for position, passenger in enumerate(family):
+                booking = {
+                    'id': self.writers[Booking].new_id(),
+                    'passenger_id': passenger['id'],
+                    'journey_type': journey_type,
+                    'pickup_point_id': pickup_point_id,
+                    'assigned_volunteer_id': volunteer_id,
+                    'is_volunteer': passenger['category'] == 'Sewadal' and rng.random() < SEWADAL_VOLUNTEER_RATE,
+                }
+                total = Decimal('0')
+                for prefix, journey, bus_id, seats in legs:
+                    price = self.prices[journey.journey_type, passenger['age_criteria']]
+                    booking.update({
+                        f'{prefix}_journey_id': journey.id,
+                        f'{prefix}_bus_id': bus_id,
+                        f'{prefix}_seat_number': seats[position],
+                        f'{prefix}_price': price,
+                    })
+                    total += price
+                booking['total_price'] = total
+                payment_status = self.choose['payment_status']() if total else 'Paid'
+                booking['payment_status'] = payment_status
+                paid = total if payment_status == 'Paid' else (total / 2).quantize(Decimal('1')) if payment_status == 'Partial' else 0
+                if paid:
+                    payments.append({
+                        'booking_id': booking['id'],
+                        'amount': paid,
+                        'payment_method': self.choose['payment_method'](),
+                        'collected_by': self.volunteers.get(volunteer_id, ''),
+                    })
+                if rng.random() < CANCELLATION_RATE:
+                    # Cancelled bookings give their seats up
+                    cancellations.append({
+                        'booking_id': booking['id'],
+                        'cancelled_by_id': volunteer_id,
+                        'reason': rng.choice(SeatCancellation.CANCELLATION_REASONS)[0],
+                        'journey_type': journey_type,
+                        'original_onward_seat': booking.get('onward_seat_number', ''),
+                        'original_return_seat': booking.get('return_seat_number', ''),
+                        'original_amount_paid': paid,
+                    })
+                    booking.update(status='Cancelled', onward_bus_id=None, return_bus_id=None, onward_seat_number='', return_seat_number='')
+                bookings.append(booking)
+
+        self.writers[Passenger].insert([passenger for family in families for passenger in family])
+        self.writers[Booking].insert(bookings)
+        self.writers[Payment].insert(payments)
+        self.writers[SeatCancellation].insert(cancellations)
+
+    def write_onspot_passengers(self):
+        rows = []
+        for bus in self.buses:
+            journey_type = bus.journey.journey_type
+            for _ in range(self.options['onspot_per_bus']):
+                person = self.make_person()
+                rows.append({
+                    'name': person['name'],
+                    'age': person['age'],
+                    'gender': person['gender'],
+                    'mobile_no': person['mobile_no'],
+                    'bus_id': bus.id,
+                    'journey_type': journey_type,
+                    'calculated_price': self.prices[journey_type, person['age_criteria']],
+                    'payment_status': self.rng.choice(['Paid', 'Pending']),
+                })
+        self.writers[OnSpotPassenger].insert(rows)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.models import Journey
+from bookings.printing import render_journey
+
+
+class Command(BaseCommand):
+    help = 'Render the printable manifests of every bus of a journey ahead of departure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('journey_id', type=int)
+        parser.add_argument('--workers', type=int, help='Worker processes (defaults to the number of CPUs; 1 renders in-process)')
+
+    def handle(self, *args, **options):
+        if not Journey.objects.filter(pk=options['journey_id']).exists():
+            raise CommandError(f"Journey {options['journey_id']} does not exist")
+
+        started = time.perf_counter()
+        results = render_journey(options['journey_id'], options['workers'])
+        rendered = sum(1 for _, _, was_rendered in results if was_rendered)
+        for bus_id, path, was_rendered in results:
+            self.stdout.write(f"bus {bus_id}: {'rendered' if was_rendered else 'unchanged'} {path}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(results)} manifests ({rendered} rendered, {len(results) - rendered} unchanged) '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
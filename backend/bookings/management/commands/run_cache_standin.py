@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bussewa_api.cache import RespStandInServer
+
+
+class Command(BaseCommand):
+    help = 'Run an in-memory Redis-protocol stand-in for local development (not for production)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        server = RespStandInServer((options['host'], options['port']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Cache stand-in listening; set MANIFEST_CACHE_URL=redis://{options['host']}:{options['port']}/0"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
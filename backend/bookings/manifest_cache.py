@@ -0,0 +1,186 @@
+"""
+Cache for rendered bus manifests.
+
+A manifest is cached per (bus, journey leg) in the ``manifests`` cache alias
+(see ``MANIFEST_CACHE_URL`` in settings). The key embeds a generation number
+that is bumped when a committed write touches that bus and leg, so a reader
+racing a write can only ever store under the generation that is about to be
+abandoned. Only writes to fields a manifest shows invalidate it.
+Manifests are always built from the primary: a lagging replica would
+otherwise store a manifest from before the write under the new generation.
+
+Hit/miss counts and lookup latency are kept per process and exposed by
+``BusViewSet.manifest_cache_stats``.
+"""
+
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.dispatch import receiver
+
+from passengers.models import Passenger
+from sync.tracking import change_recorded
+from .models import Booking, OnSpotPassenger
+
+CACHE_ALIAS = 'manifests'
+LEGS = ('ONWARD', 'RETURN')
+LEG_FIELDS = {
+    'ONWARD': {'onward_bus', 'onward_seat_number', 'onward_price', 'onward_attendance'},
+    'RETURN': {'return_bus', 'return_seat_number', 'return_price', 'return_attendance'},
+}
+BOOKING_FIELDS = {'status', 'payment_status', 'custom_amount', 'assigned_volunteer', 'passenger'}
+PASSENGER_FIELDS = {'name', 'mobile_no', 'age', 'age_criteria'}
+
+
+class ManifestCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+            self.hit_seconds = self.miss_seconds = 0.0
+            self.max_hit_seconds = self.max_miss_seconds = 0.0
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+                self.max_hit_seconds = max(self.max_hit_seconds, seconds)
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+                self.max_miss_seconds = max(self.max_miss_seconds, seconds)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': caches[CACHE_ALIAS].__class__.__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'avg_hit_ms': round(self.hit_seconds / self.hits * 1000, 3) if self.hits else None,
+                'avg_miss_ms': round(self.miss_seconds / self.misses * 1000, 3) if self.misses else None,
+                'max_hit_ms': round(self.max_hit_seconds * 1000, 3),
+                'max_miss_ms': round(self.max_miss_seconds * 1000, 3),
+            }
+
+
+stats = ManifestCacheStats()
+
+
+def _generation_key(bus_id, leg):
+    return f'manifest-gen:{bus_id}:{leg}'
+
+
+def _generation(cache, bus_id, leg):
+    key = _generation_key(bus_id, leg)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so a generation lost to eviction never
+        # resurrects manifests cached under an earlier one.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def invalidate(bus_id, leg):
+    cache = caches[CACHE_ALIAS]
+    key = _generation_key(bus_id, leg)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def build_manifest(bus_id, leg):
+    """Render one leg of a bus manifest straight from the database."""
+    prefix = leg.lower()
+    bookings = Booking.objects.using(DEFAULT_DB_ALIAS).filter(
+        **{f'{prefix}_bus_id': bus_id, 'status': 'Active'}
+    ).select_related('passenger', 'assigned_volunteer')
+
+    passengers = [
+        {
+            'id': booking.id,
+            'passenger_details': {
+                'name': booking.passenger.name,
+                'mobile_no': booking.passenger.mobile_no,
+                'age': booking.passenger.age,
+                'age_criteria': booking.passenger.age_criteria
+            },
+            'seat_number': getattr(booking, f'{prefix}_seat_number'),
+            'journey_type': leg,
+            'calculated_price': float(getattr(booking, f'{prefix}_price')),
+            'custom_amount': float(booking.custom_amount) if booking.custom_amount else None,
+            'payment_status': booking.payment_status,
+            'attendance': getattr(booking, f'{prefix}_attendance'),
+            'assigned_volunteer_details': {
+                'username': booking.assigned_volunteer.username if booking.assigned_volunteer else ''
+            }
+        }
+        for booking in bookings
+    ]
+
+    onspot_passengers = [
+        {**row, 'calculated_price': float(row['calculated_price'])}
+        for row in OnSpotPassenger.objects.using(DEFAULT_DB_ALIAS).filter(bus_id=bus_id, journey_type=leg).values(
+            'id', 'name', 'age', 'gender', 'mobile_no', 'journey_type',
+            'calculated_price', 'payment_status', 'attendance', 'notes',
+        )
+    ]
+    return {'passengers': passengers, 'onspot_passengers': onspot_passengers}
+
+
+def get_manifest(bus_id, leg):
+    started = time.perf_counter()
+    cache = caches[CACHE_ALIAS]
+    key = f'manifest:{bus_id}:{leg}:{_generation(cache, bus_id, leg)}'
+    manifest = cache.get(key)
+    hit = manifest is not None
+    if not hit:
+        manifest = build_manifest(bus_id, leg)
+        cache.set(key, manifest)
+    stats.record(hit, time.perf_counter() - started)
+    return manifest
+
+
+def _invalidate_on_commit(pairs):
+    pairs = {(bus_id, leg) for bus_id, leg in pairs if bus_id}
+    if pairs:
+        transaction.on_commit(lambda: [invalidate(bus_id, leg) for bus_id, leg in pairs])
+
+
+@receiver(change_recorded, sender=Booking)
+def booking_changed(sender, instance, operation, fields, previous, **kwargs):
+    changed = set(fields)
+    pairs = []
+    for leg, leg_fields in LEG_FIELDS.items():
+        if operation == 'update' and not changed & (leg_fields | BOOKING_FIELDS):
+            continue
+        attname = f'{leg.lower()}_bus_id'
+        pairs += [(previous.get(attname), leg), (getattr(instance, attname), leg)]
+    _invalidate_on_commit(pairs)
+
+
+@receiver(change_recorded, sender=OnSpotPassenger)
+def onspot_changed(sender, instance, operation, fields, previous, **kwargs):
+    _invalidate_on_commit([
+        (previous.get('bus_id'), previous.get('journey_type')),
+        (instance.bus_id, instance.journey_type),
+    ])
+
+
+@receiver(change_recorded, sender=Passenger)
+def passenger_changed(sender, instance, operation, fields, previous, **kwargs):
+    if operation != 'update' or not set(fields) & PASSENGER_FIELDS:
+        return
+    pairs = []
+    for onward_bus_id, return_bus_id in Booking.objects.filter(passenger=instance).values_list('onward_bus_id', 'return_bus_id'):
+        pairs += [(onward_bus_id, 'ONWARD'), (return_bus_id, 'RETURN')]
+    _invalidate_on_commit(pairs)
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('bookings', '0011_onspotpassenger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='assigned_volunteer',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='onward_bus',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='onward_bookings', to='bookings.bus'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='return_bus',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='return_bookings', to='bookings.bus'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['onward_bus', 'status'], name='booking_onward_bus_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['return_bus', 'status'], name='booking_return_bus_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['assigned_volunteer', 'status'], name='booking_volunteer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['payment_status'], name='booking_payment_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-created_at'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['-created_at'], name='booking_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'Active')), fields=['payment_status'], name='booking_active_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='journey',
+            index=models.Index(fields=['journey_date'], name='journey_date_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
 from passengers.models import Passenger
+from sync.tracking import TrackedModelMixin
 
 class PickupPoint(models.Model):
     name = models.CharField(max_length=100)
@@ -24,6 +25,9 @@ class Journey(models.Model):
     class Meta:
         unique_together = ['journey_type', 'journey_date']
         ordering = ['journey_date', 'journey_type']
+        indexes = [
+            models.Index(fields=['journey_date'], name='journey_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_journey_type_display()} - {self.journey_date}"
@@ -55,7 +59,7 @@ class JourneyPricing(models.Model):
     def __str__(self):
         return f"{self.get_journey_type_display()} - {self.age_criteria}: ₹{self.amount}"
 
-class Bus(models.Model):
+class Bus(TrackedModelMixin, models.Model):
     bus_number = models.CharField(max_length=20, blank=True)
     capacity = models.IntegerField(default=40)
     route_name = models.CharField(max_length=100, blank=True)
@@ -68,7 +72,7 @@ class Bus(models.Model):
     def __str__(self):
         return f"Bus {self.bus_number or 'TBD'} - {self.journey}"
 
-class Booking(models.Model):
+class Booking(TrackedModelMixin, models.Model):
     STATUS_CHOICES = [
         ('Active', 'Active'),
         ('Cancelled', 'Cancelled'),
@@ -93,8 +97,8 @@ class Booking(models.Model):
     pickup_point = models.ForeignKey(PickupPoint, on_delete=models.SET_NULL, null=True, blank=True)
     
     # Bus Assignment
-    onward_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, blank=True, related_name='onward_bookings')
-    return_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, blank=True, related_name='return_bookings')
+    onward_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, blank=True, related_name='onward_bookings', db_index=False)
+    return_bus = models.ForeignKey(Bus, on_delete=models.SET_NULL, null=True, blank=True, related_name='return_bookings', db_index=False)
     onward_seat_number = models.CharField(max_length=10, blank=True, default='')
     return_seat_number = models.CharField(max_length=10, blank=True, default='')
     
@@ -110,7 +114,7 @@ class Booking(models.Model):
     allow_unpaid_allocation = models.BooleanField(default=False)
     
     # Volunteer Assignment
-    assigned_volunteer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_bookings')
+    assigned_volunteer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_bookings', db_index=False)
     is_volunteer = models.BooleanField(default=False, help_text="Is this passenger a volunteer?")
 
     # Attendance
@@ -165,8 +169,20 @@ class Booking(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        # Designed from the hot query shapes (see QueryPlanTests). The
+        # (bus, status) and (volunteer, status) composites replace the plain
+        # FK indexes, which would only be redundant prefixes of them.
+        indexes = [
+            models.Index(fields=['onward_bus', 'status'], name='booking_onward_bus_status_idx'),
+            models.Index(fields=['return_bus', 'status'], name='booking_return_bus_status_idx'),
+            models.Index(fields=['assigned_volunteer', 'status'], name='booking_volunteer_status_idx'),
+            models.Index(fields=['payment_status'], name='booking_payment_status_idx'),
+            models.Index(fields=['-created_at'], name='booking_created_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(status='Active'), name='booking_active_created_idx'),
+            models.Index(fields=['payment_status'], condition=models.Q(status='Active'), name='booking_active_payment_idx'),
+        ]
 
-class Payment(models.Model):
+class Payment(TrackedModelMixin, models.Model):
     PAYMENT_METHODS = [
         ('Cash', 'Cash'),
         ('GPay', 'GPay'),
@@ -213,7 +229,7 @@ class SeatCancellation(models.Model):
         return f"Cancelled: {self.booking.passenger.name} - {self.journey_type}"
 
 
-class OnSpotPassenger(models.Model):
+class OnSpotPassenger(TrackedModelMixin, models.Model):
     """Passengers who show up on-the-spot without prior reservation (standing passengers)"""
     GENDER_CHOICES = [
         ('M', 'Male'),
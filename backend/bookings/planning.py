@@ -0,0 +1,597 @@
+"""
+Fleet planning: how many buses a journey needs and who rides which.
+
+The active bookings of a journey are grouped by pickup point. The plan
+uses the fewest buses whose seats cover every booking - the journey's
+existing buses, largest first, then new buses of ``capacity`` seats - and
+spreads the pickup-point groups over them so that each pickup point is on
+as few buses as possible (fewest group *pieces*). A group is only split
+between families - a passenger and the relatives whose ``related_to`` is
+them ride on one bus - so this is bin packing with items splittable at
+family boundaries. On-spot passengers cannot be moved: a bus carrying
+some is always used, with that many fewer seats to fill.
+
+* ``pack_heuristic`` - groups largest first; a group goes whole onto the
+  bus it fits most tightly, otherwise the emptiest bus is filled with its
+  largest families and the rest carries on. Linear in the number of
+  groups times buses.
+* ``pack_exact`` - depth-first search with bound over the same moves,
+  started from the heuristic's answer; used for up to
+  ``EXACT_MAX_GROUPS`` groups on up to ``EXACT_MAX_BUSES`` buses and
+  stopped after ``EXACT_NODE_LIMIT`` nodes.
+
+``apply_plan`` then creates the missing buses and moves bookings with
+bulk writes: ``{leg}_bus`` and ``{leg}_seat_number`` are rewritten only
+where they change, with one ``UPDATE ... FROM (VALUES ...)`` per batch of
+bookings. Seats are numbered per bus by pickup point with families
+(``Passenger.related_to``) next to each other. Plans are made without
+locks; ``apply_plan`` locks the journey's bookings and buses and raises
+``StalePlan`` if any of them, or the on-spot passengers of a bus, changed
+in the meantime, e.g. a volunteer seated or cancelled a passenger.
+
+``rebalance_journey`` is the same packing for a journey already on its
+buses, e.g. after cancellations: it keeps the fullest buses that can still
+seat everyone (and any bus with on-spot passengers), leaves their riders
+in their seats, and moves the riders of the other buses into the free
+seats - a pickup-point group joins a kept bus that already stops there
+when it fits, the rest are packed as above. The result is applied by
+``apply_plan`` too and lists every move as a diff. A relative moved off an
+emptied bus joins the family's kept bus when it has room, and arriving
+families are given consecutive free seats where there are some.
+"""
+
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from sync.tracking import record_bulk_changes
+from . import manifest_cache
+from .models import Booking, Bus, OnSpotPassenger, PickupPoint
+
+DEFAULT_CAPACITY = 40
+EXACT_MAX_GROUPS = 10
+EXACT_MAX_BUSES = 30
+EXACT_NODE_LIMIT = 200_000
+WRITE_BATCH = 1000
+
+
+class StalePlan(Exception):
+    """The journey's bookings or buses changed between planning and applying."""
+
+
+def _total(units):
+    return sum(size * count for size, count in units.items())
+
+
+def _fill(units, seats):
+    """Whole families of ``units`` filling as many of ``seats`` as they can, largest first."""
+    taken = {}
+    for size in sorted(units, reverse=True):
+        count = min(units[size], seats // size)
+        if count:
+            taken[size] = count
+            seats -= size * count
+    return taken
+
+
+def _without(units, taken):
+    return {size: count - taken.get(size, 0) for size, count in units.items() if count > taken.get(size, 0)}
+
+
+def pack_heuristic(groups, capacities):
+    """``[[(group, {size: count}), ...] per bin]`` packing ``groups`` into bins of ``capacities``.
+
+    A group is a ``{family size: count}`` of the families at one pickup
+    point; it is only ever split between families. Raises ``ValueError``
+    when a family fits in no bin.
+    """
+    free = list(capacities)
+    bins = [[] for _ in capacities]
+    for group in sorted(range(len(groups)), key=lambda g: (-_total(groups[g]), g)):
+        left = dict(groups[group])
+        while left:
+            need = _total(left)
+            fitting = [b for b in range(len(free)) if free[b] >= need]
+            if fitting:
+                target = min(fitting, key=lambda b: (free[b], b))
+                take = left
+            else:
+                target = max(range(len(free)), key=lambda b: (free[b], -b), default=None)
+                take = _fill(left, free[target]) if target is not None else {}
+            if not take:
+                raise ValueError('Not enough seats to keep every family together')
+            bins[target].append((group, take))
+            free[target] -= _total(take)
+            left = _without(left, take)
+    return bins
+
+
+def _pieces(bins):
+    return sum(len(pieces) for pieces in bins)
+
+
+def pack_exact(groups, capacities, node_limit=EXACT_NODE_LIMIT):
+    """Packing with the fewest pieces, and whether the search finished (proving it optimal)."""
+    best = pack_heuristic(groups, capacities)
+    best_pieces = _pieces(best)
+    order = sorted(range(len(groups)), key=lambda g: (-_total(groups[g]), g))
+    free = list(capacities)
+    bins = [[] for _ in capacities]
+    nodes = 0
+
+    def search(position, left, pieces):
+        nonlocal best, best_pieces, nodes
+        nodes += 1
+        if nodes > node_limit:
+            return False
+        if position == len(order):
+            if pieces < best_pieces:
+                best, best_pieces = [list(b) for b in bins], pieces
+            return True
+        # Every remaining group needs at least one more piece
+        if pieces + len(order) - position >= best_pieces:
+            return True
+        group = order[position]
+        need = _total(left)
+        # Bins with equal free seats are interchangeable: try one of each
+        choices = {}
+        for b, seats in enumerate(free):
+            choices.setdefault(seats, b)
+        # Whole: onto any bin with room
+        for seats in sorted(choices):
+            b = choices[seats]
+            if seats >= need:
+                free[b] -= need
+                bins[b].append((group, left))
+                finished = search(position + 1, dict(groups[order[position + 1]]) if position + 1 < len(order) else {}, pieces + 1)
+                bins[b].pop()
+                free[b] += need
+                if not finished:
+                    return False
+        # Split: fill a bin that is too small with whole families and carry the rest
+        for seats in sorted(choices, reverse=True):
+            b = choices[seats]
+            take = _fill(left, seats) if seats < need else None
+            if take:
+                used = _total(take)
+                free[b] -= used
+                bins[b].append((group, take))
+                finished = search(position, _without(left, take), pieces + 1)
+                bins[b].pop()
+                free[b] += used
+                if not finished:
+                    return False
+        return True
+
+    complete = search(0, dict(groups[order[0]]), 0) if order else True
+    return best, complete
+
+
+def buses_needed(total, existing_capacities, capacity, pinned=0):
+    """Capacities of the fewest buses seating ``total``: existing ones largest first, then new ones.
+
+    The first ``pinned`` existing capacities are always used.
+    """
+    chosen = list(existing_capacities[:pinned])
+    seats = sum(chosen)
+    for existing in sorted(existing_capacities[pinned:], reverse=True):
+        if seats >= total:
+            break
+        chosen.append(existing)
+        seats += existing
+    while seats < total:
+        chosen.append(capacity)
+        seats += capacity
+    return chosen
+
+
+@dataclass
+class Plan:
+    journey: object
+    leg: str
+    buses: list  # [{'bus_id', 'bus_number', 'capacity', 'bookings': [ids in seat order], 'pickup_points': [...]}]
+    unused_bus_ids: list
+    groups: int
+    pieces: int
+    optimal: bool
+    mode: str
+    seconds: float
+    changes: dict = field(default_factory=dict)  # booking id -> (bus index, seat)
+    # What the plan was made from, checked again under lock by apply_plan()
+    seen_bookings: dict = field(default_factory=dict)  # booking id -> (bus id, seat)
+    seen_buses: dict = field(default_factory=dict)  # bus id -> (bus number, capacity)
+    seen_onspot: dict = field(default_factory=dict)  # bus id -> on-spot passengers
+
+    def as_dict(self):
+        return {
+            'journey_id': self.journey.id,
+            'mode': self.mode,
+            'optimal': self.optimal,
+            'bus_count': len(self.buses),
+            'pickup_points': self.groups,
+            'splits': self.pieces - self.groups,
+            'bookings_moved': len(self.changes),
+            'unused_bus_ids': self.unused_bus_ids,
+            'elapsed_ms': round(self.seconds * 1000, 1),
+            'buses': [
+                {**{key: bus[key] for key in ('bus_id', 'bus_number', 'capacity', 'pickup_points')}, 'passengers': len(bus['bookings'])}
+                for bus in self.buses
+            ],
+        }
+
+
+def _seen(bookings, buses):
+    return (
+        {booking[0]: (booking[4], booking[5]) for booking in bookings},
+        {bus['id']: (bus['bus_number'], bus['capacity']) for bus in buses},
+    )
+
+
+def _onspot_by_bus(journey):
+    """On-spot passengers per bus of ``journey``; they hold seats without a number and cannot be moved."""
+    return dict(Counter(
+        OnSpotPassenger.objects.filter(bus__journey=journey, journey_type=journey.journey_type).values_list('bus_id', flat=True)
+    ))
+
+
+def _next_bus_numbers(taken, count):
+    numbers, n = [], 1
+    while len(numbers) < count:
+        if str(n) not in taken:
+            numbers.append(str(n))
+        n += 1
+    return numbers
+
+
+def _group_by_pickup(bookings, largest):
+    """Families of bookings (``id, pickup_point_id, related_to_id, passenger_id, ...`` tuples) by pickup point.
+
+    A family is the head of the family (``Passenger.related_to``) and the
+    relatives at the same pickup point, head first; one bigger than
+    ``largest`` seats rides as individuals.
+    """
+    by_pickup = defaultdict(dict)
+    for booking in sorted(bookings, key=lambda b: (b[2] or b[3], b[2] is not None, b[3], b[0])):
+        by_pickup[booking[1]].setdefault(booking[2] or booking[3], []).append(booking)
+    families = {
+        pickup: [part for family in heads.values() for part in ([family] if len(family) <= largest else [[b] for b in family])]
+        for pickup, heads in by_pickup.items()
+    }
+    return families, sorted(families, key=lambda p: (p is None, p))
+
+
+def _units(families):
+    """The ``{family size: count}`` a packer sees for a list of families."""
+    return dict(Counter(len(family) for family in families))
+
+
+def _queues(families):
+    queues = defaultdict(deque)
+    for position, family in enumerate(families):
+        queues[len(family)].append((position, family))
+    return queues
+
+
+def _take(queues, taken):
+    """The families of a piece ``taken`` from ``queues``, in family order."""
+    chosen = sorted(queues[size].popleft() for size, count in taken.items() for _ in range(count))
+    return [family for _, family in chosen]
+
+
+def plan_journey(journey, capacity=None, mode='auto'):
+    """Plan buses for ``journey``; ``mode`` is ``auto``, ``heuristic`` or ``exact``."""
+    started = time.perf_counter()
+    leg = journey.journey_type.lower()
+    capacity = capacity or DEFAULT_CAPACITY
+    bookings = list(
+        Booking.objects.filter(**{f'{leg}_journey': journey, 'status': 'Active'})
+        .order_by('id')
+        .values_list('id', 'pickup_point_id', 'passenger__related_to_id', 'passenger_id', f'{leg}_bus_id', f'{leg}_seat_number')
+    )
+    onspot = _onspot_by_bus(journey)
+    # Buses with on-spot passengers first: they are always used
+    existing = sorted(
+        Bus.objects.filter(journey=journey).order_by('-capacity', 'id').values('id', 'bus_number', 'capacity'),
+        key=lambda bus: bus['id'] not in onspot,
+    )
+    seen_bookings, seen_buses = _seen(bookings, existing)
+
+    by_pickup, pickup_ids = _group_by_pickup(bookings, capacity)
+    groups = [_units(by_pickup[p]) for p in pickup_ids]
+
+    free = [max(bus['capacity'] - onspot.get(bus['id'], 0), 0) for bus in existing]
+    pinned = sum(1 for bus in existing if bus['id'] in onspot)
+    capacities = buses_needed(len(bookings), free, capacity, pinned)
+    spare = free[len(capacities):]
+    # Seats in total may not be enough to keep families whole: add buses until they are
+    while True:
+        use_exact = mode == 'exact' or (mode == 'auto' and len(groups) <= EXACT_MAX_GROUPS and len(capacities) <= EXACT_MAX_BUSES)
+        try:
+            if use_exact:
+                bins, optimal = pack_exact(groups, capacities)
+            else:
+                bins, optimal = pack_heuristic(groups, capacities), False
+            break
+        except ValueError:
+            if len(capacities) > len(bookings) + pinned:
+                raise
+            capacities.append(spare.pop(0) if spare else capacity)
+
+    names = dict(PickupPoint.objects.filter(pk__in=[p for p in pickup_ids if p]).values_list('id', 'name'))
+    new_numbers = iter(_next_bus_numbers({bus['bus_number'] for bus in existing}, len(capacities) - len(existing)))
+    queues = [_queues(by_pickup[p]) for p in pickup_ids]
+    buses, changes = [], {}
+    for index, (seats, pieces) in enumerate(zip(capacities, bins)):
+        bus = existing[index] if index < len(existing) else {'id': None, 'bus_number': next(new_numbers), 'capacity': seats}
+        riders = [booking for group, taken in pieces for family in _take(queues[group], taken) for booking in family]
+        for seat, booking in enumerate(riders, start=1):
+            if booking[4] != bus['id'] or booking[5] != str(seat):
+                changes[booking[0]] = (index, str(seat))
+        stops = Counter()
+        for group, taken in pieces:
+            stops[group] += _total(taken)
+        buses.append({
+            'bus_id': bus['id'],
+            'bus_number': bus['bus_number'],
+            'capacity': bus['capacity'],
+            'bookings': [booking[0] for booking in riders],
+            'pickup_points': [
+                {'id': pickup_ids[group], 'name': names.get(pickup_ids[group], 'No pickup point'), 'passengers': count}
+                for group, count in stops.items()
+            ],
+        })
+    return Plan(
+        journey=journey, leg=leg, buses=buses,
+        unused_bus_ids=[bus['id'] for bus in existing[len(capacities):]],
+        groups=len(groups), pieces=sum(len(bus['pickup_points']) for bus in buses), optimal=optimal,
+        mode='exact' if use_exact else 'heuristic', seconds=time.perf_counter() - started, changes=changes,
+        seen_bookings=seen_bookings, seen_buses=seen_buses, seen_onspot=onspot,
+    )
+
+
+def _move_bookings(leg, rows, now):
+    """Set bus and seat of ``rows`` (``(booking id, bus id, seat)``) with one ``UPDATE ... FROM (VALUES ...)`` per batch."""
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        Booking.objects.bulk_update(
+            [Booking(pk=pk, updated_at=now, **{f'{leg}_bus_id': bus_id, f'{leg}_seat_number': seat}) for pk, bus_id, seat in rows],
+            [f'{leg}_bus', f'{leg}_seat_number', 'updated_at'], batch_size=WRITE_BATCH,
+        )
+        return
+    quote = connection.ops.quote_name
+    now = Booking._meta.get_field('updated_at').get_db_prep_value(now, connection)
+    # VALUES columns are named column1, column2, ... on both backends
+    limit = connection.features.max_query_params
+    batch = min(WRITE_BATCH, (limit - 1) // 3) if limit else WRITE_BATCH
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch):
+            chunk = rows[start:start + batch]
+            cursor.execute(
+                f'UPDATE {quote(Booking._meta.db_table)} SET {quote(f"{leg}_bus_id")} = v.column2, '
+                f'{quote(f"{leg}_seat_number")} = v.column3, {quote("updated_at")} = %s '
+                f'FROM (VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))}) AS v WHERE {quote("id")} = v.column1',
+                [now] + [value for row in chunk for value in row],
+            )
+
+
+def apply_plan(plan):
+    """Create the plan's new buses and move its bookings, in one transaction.
+
+    Raises ``StalePlan`` if a booking or bus of the journey changed since the plan was made.
+    """
+    leg = plan.leg
+    now = timezone.now()
+    with transaction.atomic():
+        current = dict(
+            (pk, (bus_id, seat)) for pk, bus_id, seat in
+            Booking.objects.select_for_update().filter(**{f'{leg}_journey': plan.journey, 'status': 'Active'})
+            .values_list('id', f'{leg}_bus_id', f'{leg}_seat_number')
+        )
+        buses = {
+            pk: (number, capacity) for pk, number, capacity in
+            Bus.objects.select_for_update().filter(journey=plan.journey).values_list('id', 'bus_number', 'capacity')
+        }
+        if current != plan.seen_bookings or buses != plan.seen_buses or _onspot_by_bus(plan.journey) != plan.seen_onspot:
+            raise StalePlan('Bookings, buses or on-spot passengers of the journey changed while planning; plan again')
+
+        new = [bus for bus in plan.buses if bus['bus_id'] is None]
+        created = Bus.objects.bulk_create(
+            Bus(
+                journey=plan.journey, bus_number=bus['bus_number'], capacity=bus['capacity'],
+                route_name=' / '.join(p['name'] for p in bus['pickup_points'])[:100],
+            )
+            for bus in new
+        )
+        for bus, row in zip(new, created):
+            bus['bus_id'] = row.id
+        record_bulk_changes(Bus, [row.id for row in created], ['bus_number', 'capacity', 'route_name', 'journey'], operation='create')
+
+        rows = [(pk, plan.buses[index]['bus_id'], seat) for pk, (index, seat) in plan.changes.items()]
+        _move_bookings(leg, rows, now)
+        record_bulk_changes(Booking, plan.changes, [f'{leg}_bus', f'{leg}_seat_number'])
+
+        touched = {bus_id for _, bus_id, _ in rows} | {current[pk][0] for pk in plan.changes}
+        touched.discard(None)
+        transaction.on_commit(lambda: [manifest_cache.invalidate(bus_id, leg.upper()) for bus_id in touched])
+    return plan
+
+
+@dataclass
+class Rebalance(Plan):
+    buses_before: int = 0
+    moves: list = field(default_factory=list)  # the diff, one dict per booking that changes bus or seat
+
+    def as_dict(self):
+        return {**super().as_dict(), 'buses_before': self.buses_before, 'moves': self.moves}
+
+
+def _buses_to_keep(buses, load, pinned, total, minimum=0):
+    """The fewest buses, at least ``minimum``, fullest first, seating ``total``; buses in ``pinned`` are always kept."""
+    order = sorted(buses, key=lambda b: (b['id'] not in pinned, -load[b['id']], -b['capacity'], b['id']))
+    for count in range(max(len(pinned), minimum), len(order) + 1):
+        keep, rest = order[:count], order[count:]
+        # Trade the smallest kept bus for a bigger one until everyone fits
+        while sum(bus['capacity'] for bus in keep) < total:
+            small = min((b for b in keep if b['id'] not in pinned), key=lambda b: (b['capacity'], load[b['id']]), default=None)
+            big = max(rest, key=lambda b: (b['capacity'], load[b['id']]), default=None)
+            if small is None or big is None or big['capacity'] <= small['capacity']:
+                break
+            keep[keep.index(small)], rest[rest.index(big)] = big, small
+        if sum(bus['capacity'] for bus in keep) >= total:
+            return keep
+    return order
+
+
+def _free_run(free, size):
+    """``size`` free seat numbers for one family: the first run of consecutive ones, else the lowest."""
+    for start in range(len(free) - size + 1):
+        if free[start + size - 1] - free[start] == size - 1:
+            return free[start:start + size]
+    return free[:size]
+
+
+def _consolidate(keep, buses, riders, load, mode):
+    """Where the riders of the buses not in ``keep`` go: ``(arrivals per kept bus, seated per kept bus, optimal, exact)``.
+
+    Raises ``ValueError`` when the families do not fit in the free seats of ``keep``.
+    """
+    kept = {bus['id'] for bus in keep}
+    # Riders of kept buses stay in their seats; a missing, repeated or out-of-range seat is renumbered on the same bus
+    seated, arrivals = [], [[] for _ in keep]
+    for index, bus in enumerate(keep):
+        taken = {}
+        for booking in riders[bus['id']]:
+            seat = booking[5] or ''
+            if seat.isdigit() and 1 <= int(seat) <= bus['capacity'] and seat not in taken:
+                taken[seat] = booking
+            else:
+                arrivals[index].append([booking])
+        seated.append(taken)
+
+    movers = [booking for bus in buses if bus['id'] not in kept for booking in riders[bus['id']]]
+    room = [bus['capacity'] - load[bus['id']] for bus in keep]
+    by_pickup, pickup_ids = _group_by_pickup(movers, max(room, default=0))
+    # A relative follows the family onto the kept bus it is already on, when there is room
+    family_bus = {booking[2] or booking[3]: index for index, bus in enumerate(keep) for booking in riders[bus['id']]}
+    for pickup in pickup_ids:
+        staying = []
+        for family in by_pickup[pickup]:
+            home = family_bus.get(family[0][2] or family[0][3])
+            if home is not None and room[home] >= len(family):
+                arrivals[home].append(family)
+                room[home] -= len(family)
+            else:
+                staying.append(family)
+        by_pickup[pickup] = staying
+    pickup_ids = [pickup for pickup in pickup_ids if by_pickup[pickup]]
+    groups = [_units(by_pickup[pickup]) for pickup in pickup_ids]
+
+    serving = [{booking[1] for booking in riders[bus['id']]} for bus in keep]
+    pieces = [[] for _ in keep]
+    homeless = []
+    # A group joins whole a bus that already stops at its pickup point, when one has room
+    for group in sorted(range(len(groups)), key=lambda g: (-_total(groups[g]), g)):
+        size = _total(groups[group])
+        homes = [i for i in range(len(keep)) if pickup_ids[group] in serving[i] and room[i] >= size]
+        if homes:
+            home = min(homes, key=lambda i: (room[i], i))
+            pieces[home].append((group, groups[group]))
+            room[home] -= size
+        else:
+            homeless.append(group)
+    units = [groups[group] for group in homeless]
+    free = [max(seats, 0) for seats in room]
+    use_exact = mode == 'exact' or (mode == 'auto' and len(units) <= EXACT_MAX_GROUPS and len(free) <= EXACT_MAX_BUSES)
+    if use_exact:
+        bins, optimal = pack_exact(units, free)
+    else:
+        bins, optimal = pack_heuristic(units, free), False
+    for index, packed in enumerate(bins):
+        pieces[index] += [(homeless[group], taken) for group, taken in packed]
+
+    queues = [_queues(by_pickup[pickup]) for pickup in pickup_ids]
+    for index, packed in enumerate(pieces):
+        for group, taken in packed:
+            arrivals[index] += _take(queues[group], taken)
+    return arrivals, seated, optimal, use_exact
+
+
+def rebalance_journey(journey, mode='auto'):
+    """Empty the least-filled buses of ``journey`` into the free seats of the rest; ``mode`` as for ``plan_journey``.
+
+    Raises ``ValueError`` if a bus that must stay carries more passengers than its capacity.
+    """
+    started = time.perf_counter()
+    leg = journey.journey_type.lower()
+    buses = list(Bus.objects.filter(journey=journey).order_by('id').values('id', 'bus_number', 'capacity'))
+    bookings = list(
+        Booking.objects.filter(**{f'{leg}_journey': journey, 'status': 'Active'})
+        .order_by('id')
+        .values_list('id', 'pickup_point_id', 'passenger__related_to_id', 'passenger_id', f'{leg}_bus_id',
+                     f'{leg}_seat_number', 'passenger__name', 'pickup_point__name')
+    )
+    onspot = Counter(_onspot_by_bus(journey))
+    seen_bookings, seen_buses = _seen(bookings, buses)
+    # Bookings not on one of the journey's buses stay where they are
+    bookings = [booking for booking in bookings if booking[4] in seen_buses]
+    riders = defaultdict(list)
+    for booking in bookings:
+        riders[booking[4]].append(booking)
+    load = {bus['id']: len(riders[bus['id']]) + onspot[bus['id']] for bus in buses}
+
+    minimum = 0
+    while True:
+        keep = sorted(_buses_to_keep(buses, load, set(onspot), sum(load.values()), minimum), key=lambda b: b['id'])
+        for bus in keep:
+            if load[bus['id']] > bus['capacity']:
+                raise ValueError(f"Bus {bus['bus_number']} carries {load[bus['id']]} passengers on {bus['capacity']} seats")
+        try:
+            arrivals, seated, optimal, use_exact = _consolidate(keep, buses, riders, load, mode)
+            break
+        except ValueError:
+            # The families do not fit the free seats: keep one more bus
+            if len(keep) == len(buses):
+                raise
+            minimum = len(keep) + 1
+
+    numbers = {bus['id']: bus['bus_number'] for bus in buses}
+    kept = {bus['id'] for bus in keep}
+    planned, changes, moves, pieces = [], {}, [], set()
+    for index, bus in enumerate(keep):
+        free = [n for n in range(1, bus['capacity'] + 1) if str(n) not in seated[index]]
+        for family in arrivals[index]:
+            seats = _free_run(free, len(family))
+            for seat in seats:
+                free.remove(seat)
+            for booking, seat in zip(family, map(str, seats)):
+                seated[index][seat] = booking
+                changes[booking[0]] = (index, seat)
+                if booking[4] not in kept:
+                    pieces.add((index, booking[1]))
+                moves.append({
+                    'booking_id': booking[0], 'passenger': booking[6], 'pickup_point': booking[7],
+                    'from_bus': numbers[booking[4]], 'from_seat': booking[5], 'to_bus': bus['bus_number'], 'to_seat': seat,
+                })
+        in_seat_order = [seated[index][seat] for seat in sorted(seated[index], key=int)]
+        stops = Counter(booking[1] for booking in in_seat_order)
+        names = {booking[1]: booking[7] for booking in in_seat_order}
+        planned.append({
+            'bus_id': bus['id'],
+            'bus_number': bus['bus_number'],
+            'capacity': bus['capacity'],
+            'bookings': [booking[0] for booking in in_seat_order],
+            'pickup_points': [
+                {'id': pickup, 'name': names[pickup] or 'No pickup point', 'passengers': count}
+                for pickup, count in sorted(stops.items(), key=lambda item: (item[0] is None, item[0]))
+            ],
+        })
+    return Rebalance(
+        journey=journey, leg=leg, buses=planned,
+        unused_bus_ids=[bus['id'] for bus in buses if bus['id'] not in kept],
+        groups=len({booking[1] for booking in bookings if booking[4] not in kept}), pieces=len(pieces), optimal=optimal,
+        mode='exact' if use_exact else 'heuristic', seconds=time.perf_counter() - started, changes=changes,
+        seen_bookings=seen_bookings, seen_buses=seen_buses, seen_onspot=dict(onspot),
+        buses_before=sum(1 for bus in buses if load[bus['id']]), moves=moves,
+    )
@@ -0,0 +1,143 @@
+"""
+Print-ready bus manifests and seat charts.
+
+``open_bus(bus_id)`` renders ``bookings/print_manifest.html`` - the
+passenger list with a boarding column, on-spot passengers and a seat chart
+on its own page - from the bus's (cached) manifest. The output is stored in
+``PRINT_CACHE_DIR`` under a hash of everything it shows plus the template
+source, so a bus whose data has not changed is served from disk without
+rendering. ``render_journey`` renders every bus of a journey in a pool of
+worker processes (``manage.py render_manifests``).
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+
+from . import manifest_cache
+from .models import Bus
+
+TEMPLATE = 'bookings/print_manifest.html'
+SEATS_PER_ROW = 4  # 2 + 2 with an aisle
+
+
+def _cache_dir():
+    return str(getattr(settings, 'PRINT_CACHE_DIR', settings.BASE_DIR / 'print_cache'))
+
+
+def seat_chart(capacity, passengers):
+    """Rows of seats 1..capacity (``None`` marks the aisle) and any seats outside that range."""
+    names = {str(p['seat_number']): p['passenger_details']['name'] for p in passengers if p['seat_number']}
+    rows = []
+    for first in range(1, capacity + 1, SEATS_PER_ROW):
+        row = [{'number': n, 'name': names.pop(str(n), '')} for n in range(first, min(first + SEATS_PER_ROW, capacity + 1))]
+        row.insert(SEATS_PER_ROW // 2, None)
+        rows.append(row)
+    other = [{'number': number, 'name': name} for number, name in sorted(names.items())]
+    return rows, other
+
+
+def print_context(bus):
+    legs = [bus.journey.journey_type] if bus.journey else manifest_cache.LEGS
+    passengers, onspot_passengers = [], []
+    for leg in legs:
+        manifest = manifest_cache.get_manifest(bus.id, leg)
+        passengers += manifest['passengers']
+        onspot_passengers += manifest['onspot_passengers']
+    passengers.sort(key=lambda p: (len(p['seat_number']), p['seat_number'], p['id']))
+    seat_rows, other_seats = seat_chart(bus.capacity, passengers)
+    return {
+        'bus': {
+            'id': bus.id,
+            'bus_number': bus.bus_number,
+            'route_name': bus.route_name,
+            'capacity': bus.capacity,
+            'journey': str(bus.journey) if bus.journey else '',
+            'volunteer': bus.assigned_volunteer.username if bus.assigned_volunteer else '',
+        },
+        'passengers': passengers,
+        'onspot_passengers': onspot_passengers,
+        'seat_rows': seat_rows,
+        'other_seats': other_seats,
+    }
+
+
+def content_hash(context, template):
+    digest = hashlib.sha256(template.template.source.encode())
+    digest.update(json.dumps(context, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def _open(bus_id):
+    bus = Bus.objects.select_related('journey', 'assigned_volunteer').get(pk=bus_id)
+    template = get_template(TEMPLATE)
+    context = print_context(bus)
+    directory = _cache_dir()
+    path = os.path.join(directory, f'bus-{bus_id}-{content_hash(context, template)}.html')
+    try:
+        return path, open(path, 'rb'), False
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(template.render(context))
+    # Opened before it is published, so a later render removing it as stale
+    # cannot pull it out from under the reader
+    rendered = open(tmp_path, 'rb')
+    os.replace(tmp_path, path)
+    for stale in glob.glob(os.path.join(directory, f'bus-{bus_id}-*.html')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return path, rendered, True
+
+
+def open_bus(bus_id):
+    """Open the printable manifest of ``bus_id`` and whether it had to be rendered.
+
+    The file stays readable to the end even if a render of newer data removes
+    it meanwhile; serve it from this handle rather than reopening its path.
+    """
+    _, f, rendered = _open(bus_id)
+    return f, rendered
+
+
+def render_bus(bus_id):
+    """Path of the printable manifest of ``bus_id`` and whether it had to be rendered."""
+    path, f, rendered = _open(bus_id)
+    f.close()
+    return path, rendered
+
+
+def _render_in_worker(bus_id):
+    path, rendered = render_bus(bus_id)
+    return bus_id, path, rendered
+
+
+def render_journey(journey_id, workers=None):
+    """Render every bus of a journey; returns ``[(bus_id, path, rendered), ...]``.
+
+    With more than one worker the buses are spread over a process pool;
+    ``workers=1`` renders them one by one in this process.
+    """
+    bus_ids = list(Bus.objects.filter(journey_id=journey_id).order_by('id').values_list('id', flat=True))
+    workers = min(workers or os.cpu_count() or 1, len(bus_ids))
+    if workers <= 1:
+        return [_render_in_worker(bus_id) for bus_id in bus_ids]
+
+    # Worker processes open their own connections; never share the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return list(pool.map(_render_in_worker, bus_ids))
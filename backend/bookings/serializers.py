@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Journey, JourneyPricing, Bus, Booking, Payment, SeatCancellation, PickupPoint, OnSpotPassenger
 from passengers.models import Passenger
@@ -18,6 +19,30 @@ class PassengerSerializer(serializers.ModelSerializer):
         model = Passenger
         fields = '__all__'
 
+def volunteer_booking_prefetches(prefix=''):
+    """Prefetches that let BusSerializer.get_volunteer_passengers skip its queries"""
+    volunteers = Booking.objects.filter(is_volunteer=True).select_related('passenger')
+    return [
+        Prefetch(f'{prefix}onward_bookings', queryset=volunteers, to_attr='volunteer_onward_bookings'),
+        Prefetch(f'{prefix}return_bookings', queryset=volunteers, to_attr='volunteer_return_bookings'),
+    ]
+
+def optimize_bus_queryset(queryset, prefix=''):
+    """Load everything BusSerializer renders in a constant number of queries"""
+    return queryset.select_related(
+        f'{prefix}journey', f'{prefix}assigned_volunteer'
+    ).prefetch_related(*volunteer_booking_prefetches(prefix))
+
+def optimize_booking_queryset(queryset, prefix=''):
+    """Load everything BookingSerializer renders in a constant number of queries"""
+    related = ['passenger', 'onward_journey', 'return_journey', 'pickup_point', 'assigned_volunteer']
+    for bus in ('onward_bus', 'return_bus'):
+        related += [bus, f'{bus}__journey', f'{bus}__assigned_volunteer']
+    queryset = queryset.select_related(*[prefix + name for name in related])
+    for bus in ('onward_bus', 'return_bus'):
+        queryset = queryset.prefetch_related(*volunteer_booking_prefetches(f'{prefix}{bus}__'))
+    return queryset
+
 class BusSerializer(serializers.ModelSerializer):
     journey_details = JourneySerializer(source='journey', read_only=True)
     assigned_volunteer_details = UserSerializer(source='assigned_volunteer', read_only=True)
@@ -30,8 +55,15 @@ class BusSerializer(serializers.ModelSerializer):
 
     def get_volunteer_passengers(self, obj):
         volunteers = []
+        # Use the prefetched lists when the view loaded them (see optimize_bus_queryset)
+        onward = getattr(obj, 'volunteer_onward_bookings', None)
+        if onward is None:
+            onward = obj.onward_bookings.filter(is_volunteer=True).select_related('passenger')
+        returning = getattr(obj, 'volunteer_return_bookings', None)
+        if returning is None:
+            returning = obj.return_bookings.filter(is_volunteer=True).select_related('passenger')
         # Check onward bookings
-        for booking in obj.onward_bookings.filter(is_volunteer=True):
+        for booking in onward:
             volunteers.append({
                 'booking_id': booking.id,
                 'passenger_name': booking.passenger.name,
@@ -39,7 +71,7 @@ class BusSerializer(serializers.ModelSerializer):
                 'type': 'ONWARD'
             })
         # Check return bookings
-        for booking in obj.return_bookings.filter(is_volunteer=True):
+        for booking in returning:
             volunteers.append({
                 'booking_id': booking.id,
                 'passenger_name': booking.passenger.name,
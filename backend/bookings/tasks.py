@@ -0,0 +1,31 @@
+import tempfile
+
+from django.core.files import File
+
+from jobs.queue import register
+from .exports import manifest_zip
+from .models import Bus, Journey
+from .printing import render_bus
+
+
+@register('manifest_export', roles=('admin', 'volunteer'))
+def manifest_export(ctx):
+    """Zip of per-bus manifest CSVs for a journey (params: journey_id)"""
+    journey = Journey.objects.get(pk=ctx.params['journey_id'])
+    with tempfile.TemporaryFile('w+b') as f:
+        for chunk in manifest_zip(journey):
+            f.write(chunk)
+        f.seek(0)
+        ctx.save_artifact(f'manifests_{journey.journey_type.lower()}_{journey.journey_date}.zip', File(f))
+    return {'journey_id': journey.id}
+
+
+@register('render_manifests', roles=('admin', 'volunteer'))
+def render_manifests(ctx):
+    """Pre-render the printable manifests of every bus of a journey (params: journey_id)"""
+    bus_ids = list(Bus.objects.filter(journey_id=ctx.params['journey_id']).order_by('id').values_list('id', flat=True))
+    rendered = 0
+    for n, bus_id in enumerate(bus_ids):
+        ctx.progress(n / len(bus_ids) * 100, f'Bus {n + 1} of {len(bus_ids)}')
+        rendered += render_bus(bus_id)[1]
+    return {'buses': len(bus_ids), 'rendered': rendered}
@@ -1,3 +1,517 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import re
+import tempfile
+import zipfile
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from bussewa_api import db_router
+from bussewa_api.cache import RespStandInServer
+from authentication.models import User
+from bussewa_api.testing import EndpointBudgetTestCase, seed_event
+from passengers.models import Passenger
+from sync.models import ChangeLogEntry
+from . import manifest_cache, planning, printing
+from .models import Booking, Bus, Journey, OnSpotPassenger, Payment, PickupPoint
+from .views_enhanced import BookingViewSet
+
+
+class ManifestCacheTests(TestCase):
+    def setUp(self):
+        caches['manifests'].clear()
+        manifest_cache.stats.reset()
+        journey = Journey.objects.create(journey_type='ONWARD', journey_date='2026-01-10')
+        self.bus = Bus.objects.create(bus_number='1', journey=journey)
+        self.other_bus = Bus.objects.create(bus_number='2', journey=journey)
+        passenger = Passenger.objects.create(name='Asha', gender='F', age=30, category='Satsang')
+        self.booking = Booking.objects.create(passenger=passenger, onward_journey=journey, onward_bus=self.bus, onward_seat_number='1')
+
+    def manifest(self, bus=None):
+        return self.client.get(f'/api/buses/{(bus or self.bus).id}/passenger_list/').json()
+
+    def test_repeat_reads_are_served_from_cache(self):
+        self.manifest()
+        with self.assertNumQueries(1):  # only the bus lookup
+            data = self.manifest()
+        self.assertEqual([p['seat_number'] for p in data['passengers']], ['1'])
+        self.assertEqual(manifest_cache.stats.hits, 2)
+
+    def test_seat_move_invalidates_both_buses_but_remarks_do_not(self):
+        self.manifest()
+        self.manifest(self.other_bus)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.remarks = 'window seat please'
+            self.booking.save()
+        with self.assertNumQueries(1):
+            self.manifest()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.onward_bus = self.other_bus
+            self.booking.onward_seat_number = '7'
+            self.booking.save()
+        self.assertEqual(self.manifest()['passengers'], [])
+        self.assertEqual(self.manifest(self.other_bus)['passengers'][0]['seat_number'], '7')
+
+    def test_onspot_passenger_invalidates_its_leg(self):
+        self.manifest()
+        with self.captureOnCommitCallbacks(execute=True):
+            OnSpotPassenger.objects.create(name='Ravi', age=40, gender='M', bus=self.bus, journey_type='ONWARD')
+        self.assertEqual([p['name'] for p in self.manifest()['onspot_passengers']], ['Ravi'])
+
+
+    @override_settings(DATABASE_REPLICAS=['replica1'], DATABASE_ROUTERS=['bussewa_api.db_router.PrimaryReplicaRouter'])
+    def test_manifests_are_built_from_the_primary(self):
+        replicas = db_router._use_replicas.set(True)  # a GET that would read from a replica
+        self.addCleanup(db_router._use_replicas.reset, replicas)
+        manifest = manifest_cache.build_manifest(self.bus.id, 'ONWARD')
+        self.assertEqual([p['seat_number'] for p in manifest['passengers']], ['1'])
+
+class RespStandInTests(TestCase):
+    def test_django_redis_cache_against_stand_in(self):
+        server = RespStandInServer(('127.0.0.1', 0))
+        url = server.start()
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': url}}):
+                cache = caches.create_connection('default')
+                cache.set('manifest', {'passengers': [1, 2]})
+                cache.add('gen', 5, timeout=None)
+                self.assertEqual(cache.incr('gen'), 6)
+                self.assertEqual(cache.get('manifest'), {'passengers': [1, 2]})
+                self.assertEqual(cache.get_many(['gen', 'missing']), {'gen': 6})
+                cache.delete('manifest')
+                self.assertIsNone(cache.get('manifest'))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class QueryPlanTests(TestCase):
+    """Fail when a hot Booking query falls back to a full table scan.
+
+    Each query is built the way the views build it and run through EXPLAIN
+    (``EXPLAIN QUERY PLAN`` on SQLite; on Postgres sequential scans are
+    disabled first so a missing index still shows up as ``Seq Scan``).
+    """
+    TABLES = ('bookings_booking', 'bookings_journey')
+
+    def booking_list(self, **params):
+        view = BookingViewSet()
+        view.request = Request(APIRequestFactory().get('/api/bookings/', params))
+        return view.get_queryset()
+
+    def hot_queries(self):
+        return {
+            'manifest onward': Booking.objects.filter(onward_bus_id=1, status='Active').select_related('passenger', 'assigned_volunteer'),
+            'manifest return': Booking.objects.filter(return_bus_id=1, status='Active').select_related('passenger', 'assigned_volunteer'),
+            'seat map': Booking.objects.filter(onward_bus_id=1, status='Active').exclude(onward_seat_number=''),
+            'volunteer passengers': Booking.objects.filter(onward_bus_id=1, is_volunteer=True),
+            'by volunteer': Booking.objects.filter(assigned_volunteer_id=1, status='Active'),
+            'unpaid': Booking.objects.filter(payment_status='Pending'),
+            'active unpaid': Booking.objects.filter(payment_status='Pending', status='Active'),
+            'list': self.booking_list()[:50],
+            'active list': self.booking_list(status='Active')[:50],
+            'journey date list': self.booking_list(journey_date='2026-01-10'),
+        }
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def full_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            pattern = r'Seq Scan on (%s)\b' % '|'.join(self.TABLES)
+        else:
+            pattern = r'SCAN (%s)\b(?! USING (COVERING )?INDEX)' % '|'.join(self.TABLES)
+        return re.findall(pattern, plan)
+
+    def test_hot_queries_use_indexes(self):
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(name):
+                plan = self.explain(queryset)
+                self.assertFalse(self.full_scans(plan), f'{name} does a full scan:\n{plan}')
+
+
+class EndpointBudgetTests(EndpointBudgetTestCase):
+    def test_bookings(self):
+        self.assertWithinBudget('/api/bookings/')
+        self.assertWithinBudget('/api/bookings/?status=Active&journey_date=2026-01-10')
+
+    def test_booking_detail(self):
+        self.assertWithinBudget('/api/bookings/{booking}/')
+
+    def test_bookings_by_volunteer(self):
+        self.assertWithinBudget(f'/api/bookings/by_volunteer/?volunteer_id={self.event["volunteers"][0].id}')
+
+    def test_buses(self):
+        self.assertWithinBudget('/api/buses/')
+
+    def test_passenger_list(self):
+        self.assertWithinBudget('/api/buses/{bus}/passenger_list/')
+
+    def test_seat_allocation(self):
+        self.assertWithinBudget('/api/buses/{bus}/seat_allocation/')
+
+    def test_payments(self):
+        self.assertWithinBudget('/api/payments/')
+
+    def test_seat_cancellations(self):
+        self.assertWithinBudget('/api/seat-cancellations/')
+
+    def test_onspot_passengers(self):
+        self.assertWithinBudget('/api/onspot-passengers/')
+        self.assertWithinBudget('/api/onspot-passengers/by_bus/?bus_id={bus}')
+
+    def test_journeys_and_pickup_points(self):
+        self.assertWithinBudget('/api/journeys/')
+        self.assertWithinBudget('/api/pickup-points/')
+
+
+class GenerateEventDataTests(TestCase):
+    def generate(self):
+        call_command('generate_event_data', passengers=300, bus_capacity=20, seed=7, stdout=StringIO())
+        return (
+            list(Passenger.objects.order_by('id').values_list('name', 'age', 'gender', 'category', 'related_to__name')),
+            list(Booking.objects.order_by('id').values_list('onward_bus__bus_number', 'onward_seat_number', 'payment_status', 'status')),
+        )
+
+    def test_generates_a_consistent_event(self):
+        passengers, bookings = self.generate()
+        self.assertEqual(len(passengers), 300)
+        self.assertEqual(len(bookings), 300)
+        self.assertTrue(Passenger.objects.filter(related_to__isnull=False).exists())
+        self.assertEqual(set(Payment.objects.values_list('payment_method', flat=True)), {'Cash', 'GPay', 'Online'})
+        self.assertTrue(OnSpotPassenger.objects.exists())
+        for bus in Bus.objects.all():
+            seats = Booking.objects.filter(onward_bus=bus, status='Active').values_list('onward_seat_number', flat=True)
+            self.assertLessEqual(len(seats), bus.capacity)
+            self.assertEqual(len(seats), len(set(seats)))
+        # Sequences were reset past the generated ids
+        Passenger.objects.create(name='Walk-in', gender='M', age=30, category='Satsang')
+
+    def test_same_seed_generates_the_same_event(self):
+        first = self.generate()
+        Passenger.objects.all().delete()
+        OnSpotPassenger.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+
+class ManifestExportTests(TestCase):
+    def setUp(self):
+        self.event = seed_event(buses=3, bookings_per_bus=4)
+        self.client.force_login(User.objects.create_user('exporter', role='volunteer'))
+
+    def export(self, journey):
+        response = self.client.get(f'/api/journeys/{journey.id}/manifest_export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_one_csv_per_bus_with_reserved_then_onspot_passengers(self):
+        journey = self.event['journey']
+        archive = self.export(journey)
+        buses = Bus.objects.filter(journey=journey).order_by('id')
+        self.assertEqual(archive.namelist(), [f'bus_{bus.bus_number}_passengers.csv' for bus in buses])
+
+        bus = buses[0]
+        rows = list(csv.reader(io.StringIO(archive.read(f'bus_{bus.bus_number}_passengers.csv').decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:3], ['S.No.', 'Type', 'Name'])
+        reserved = Booking.objects.filter(onward_bus=bus, status='Active').order_by('onward_seat_number')
+        self.assertEqual([row[2] for row in rows[1:-1]], [booking.passenger.name for booking in reserved])
+        self.assertEqual(rows[-1][1:3], ['On-Spot', OnSpotPassenger.objects.get(bus=bus).name])
+        self.assertEqual(rows[-1][0], str(len(rows) - 1))
+
+    def test_reserved_passengers_are_in_numeric_seat_order(self):
+        journey = self.event['journey']
+        bus = Bus.objects.filter(journey=journey).order_by('id')[0]
+        for booking, seat in zip(Booking.objects.filter(onward_bus=bus).order_by('id'), ['10', '9', '2', '1']):
+            Booking.objects.filter(pk=booking.pk).update(onward_seat_number=seat)
+        archive = self.export(journey)
+        rows = list(csv.reader(io.StringIO(archive.read(f'bus_{bus.bus_number}_passengers.csv').decode('utf-8-sig'))))
+        self.assertEqual([row[5] for row in rows[1:-1]], ['1', '2', '9', '10'])
+
+    def test_query_count_does_not_grow_with_the_journey(self):
+        journey = self.event['journey']
+        with CaptureQueriesContext(connection) as small:
+            self.export(journey)
+        seed_event(buses=6, bookings_per_bus=10)
+        with CaptureQueriesContext(connection) as large:
+            archive = self.export(journey)
+        self.assertEqual(len(archive.namelist()), 9)
+        self.assertEqual(len(small), len(large))
+
+    def test_viewers_cannot_export(self):
+        self.client.force_login(User.objects.create_user('viewer', role='viewer'))
+        response = self.client.get(f'/api/journeys/{self.event["journey"].id}/manifest_export/')
+        self.assertEqual(response.status_code, 403)
+
+
+class PrintManifestTests(TestCase):
+    def setUp(self):
+        caches['manifests'].clear()
+        self.print_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.print_dir.cleanup)
+        settings_override = override_settings(PRINT_CACHE_DIR=self.print_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.event = seed_event(buses=2, bookings_per_bus=3)
+        self.bus = self.event['buses'][0]
+        self.client.force_login(User.objects.create_user('printer', role='volunteer'))
+
+    def test_renders_once_until_the_bus_changes(self):
+        first = self.client.get(f'/api/buses/{self.bus.id}/print_manifest/')
+        self.assertEqual(first['X-Print-Cache'], 'miss')
+        html = b''.join(first.streaming_content).decode()
+        booking = Booking.objects.filter(onward_bus=self.bus).first()
+        self.assertIn(booking.passenger.name, html)
+        self.assertIn('Seat chart', html)
+
+        self.assertEqual(self.client.get(f'/api/buses/{self.bus.id}/print_manifest/')['X-Print-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.payment_status = 'Paid' if booking.payment_status != 'Paid' else 'Pending'
+            booking.save()
+        self.assertEqual(self.client.get(f'/api/buses/{self.bus.id}/print_manifest/')['X-Print-Cache'], 'miss')
+        self.assertEqual(len(os.listdir(self.print_dir.name)), 1)  # the stale render was removed
+
+    def test_a_served_manifest_survives_a_re_render(self):
+        response = self.client.get(f'/api/buses/{self.bus.id}/print_manifest/')
+        booking = Booking.objects.filter(onward_bus=self.bus).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.payment_status = 'Paid' if booking.payment_status != 'Paid' else 'Pending'
+            booking.save()
+        printing.render_bus(self.bus.id)  # removes the file being streamed
+        self.assertIn(booking.passenger.name, b''.join(response.streaming_content).decode())
+
+    def test_seat_chart_places_passengers_and_lists_other_seats(self):
+        passengers = [
+            {'seat_number': '2', 'passenger_details': {'name': 'Two'}},
+            {'seat_number': 'A1', 'passenger_details': {'name': 'Extra'}},
+        ]
+        rows, other = printing.seat_chart(6, passengers)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0][1], {'number': 2, 'name': 'Two'})
+        self.assertIsNone(rows[0][2])  # aisle
+        self.assertEqual(other, [{'number': 'A1', 'name': 'Extra'}])
+
+    def test_render_manifests_command(self):
+        out = StringIO()
+        call_command('render_manifests', self.event['journey'].id, workers=1, stdout=out)
+        self.assertIn('2 manifests (2 rendered, 0 unchanged)', out.getvalue())
+        out = StringIO()
+        call_command('render_manifests', self.event['journey'].id, workers=1, stdout=out)
+        self.assertIn('(0 rendered, 2 unchanged)', out.getvalue())
+
+
+class FleetPlanningTests(TestCase):
+    def setUp(self):
+        self.journey = Journey.objects.create(journey_type='ONWARD', journey_date='2026-01-10')
+        self.pickup_points = PickupPoint.objects.bulk_create(PickupPoint(name=f'Point {n}', location='') for n in range(12))
+        self.admin = User.objects.create_user('planner', role='admin')
+        self.client.force_login(self.admin)
+
+    def book(self, counts):
+        passengers = Passenger.objects.bulk_create(
+            Passenger(name=f'P{n}', gender='M', age=30, age_criteria='M-Above 12 & Below 65', category='Satsang')
+            for n in range(sum(counts))
+        )
+        pickups = [point for point, count in zip(self.pickup_points, counts) for _ in range(count)]
+        return Booking.objects.bulk_create(
+            Booking(passenger=passenger, onward_journey=self.journey, pickup_point=pickup, onward_price=550, total_price=550)
+            for passenger, pickup in zip(passengers, pickups)
+        )
+
+    def test_exact_search_beats_heuristic_when_it_can(self):
+        groups, capacities = [{1: 25}, {1: 20}, {1: 15}, {1: 10}, {1: 10}], [40, 40]
+        heuristic = planning.pack_heuristic(groups, capacities)
+        exact, optimal = planning.pack_exact(groups, capacities)
+        for bins in (heuristic, exact):
+            self.assertEqual([sum(sum(size * n for size, n in taken.items()) for _, taken in b) for b in bins], [40, 40])
+        self.assertTrue(optimal)
+        self.assertEqual(sum(map(len, exact)), 5)  # 25+15 and 20+10+10: no pickup point split
+        self.assertGreaterEqual(sum(map(len, heuristic)), 5)
+        self.assertEqual(planning.buses_needed(81, [50, 30], 40), [50, 30, 40])
+
+    def test_plan_creates_fewest_buses_and_keeps_pickup_points_together(self):
+        bookings = self.book([45, 30, 10, 10, 5])
+        family_head, relative = bookings[1].passenger, bookings[44].passenger
+        Passenger.objects.filter(pk=relative.pk).update(related_to=family_head)
+        Bus.objects.create(journey=self.journey, bus_number='1', capacity=50)
+
+        dry = self.client.post(f'/api/journeys/{self.journey.id}/plan_fleet/', {'dry_run': True}, content_type='application/json').json()
+        self.assertEqual(Bus.objects.count(), 1)
+        response = self.client.post(f'/api/journeys/{self.journey.id}/plan_fleet/', {}, content_type='application/json').json()
+
+        self.assertEqual(response['bus_count'], 3)  # 100 passengers: the existing 50-seater and two 40-seaters
+        self.assertEqual((response['mode'], response['optimal'], response['splits']), ('exact', True, 0))
+        self.assertTrue(dry['dry_run'])
+        for key in ('bus_count', 'splits', 'bookings_moved'):
+            self.assertEqual(dry[key], response[key])
+        self.assertEqual([bus['bus_id'] for bus in dry['buses']][1:], [None, None])
+        self.assertEqual(Bus.objects.filter(journey=self.journey).count(), 3)
+        for bus in Bus.objects.filter(journey=self.journey):
+            seats = list(Booking.objects.filter(onward_bus=bus).values_list('onward_seat_number', flat=True))
+            self.assertLessEqual(len(seats), bus.capacity)
+            self.assertEqual(sorted(seats, key=int), [str(n) for n in range(1, len(seats) + 1)])
+        self.assertFalse(Booking.objects.filter(onward_bus__isnull=True).exists())
+        family = Booking.objects.filter(passenger__in=[family_head, relative]).values_list('onward_bus_id', 'onward_seat_number')
+        (bus_a, seat_a), (bus_b, seat_b) = family
+        self.assertEqual(bus_a, bus_b)
+        self.assertEqual(abs(int(seat_a) - int(seat_b)), 1)
+
+        again = self.client.post(f'/api/journeys/{self.journey.id}/plan_fleet/', {}, content_type='application/json').json()
+        self.assertEqual(again['bookings_moved'], 0)
+
+    def test_five_thousand_passengers_plan_in_batched_queries(self):
+        self.book([417] * 12)
+        with CaptureQueriesContext(connection) as queries:
+            plan = planning.apply_plan(planning.plan_journey(self.journey, 45))
+
+        self.assertEqual(len(plan.buses), 112)  # ceil(5004 / 45)
+        self.assertEqual(plan.mode, 'heuristic')  # too many buses for the exact search
+        self.assertLess(len(queries), 5004 // 25, 'bookings are written in batches, not one by one')
+        self.assertEqual(Booking.objects.filter(onward_bus__isnull=False).count(), 5004)
+
+    def test_a_plan_is_not_applied_over_changes_made_meanwhile(self):
+        bookings = self.book([10])
+        bus = Bus.objects.create(journey=self.journey, bus_number='1', capacity=40)
+        plan = planning.plan_journey(self.journey)
+        # A volunteer seats a passenger before the plan is applied
+        Booking.objects.filter(pk=bookings[0].pk).update(onward_bus=bus, onward_seat_number='7')
+
+        with self.assertRaises(planning.StalePlan):
+            planning.apply_plan(plan)
+        self.assertEqual(Booking.objects.filter(onward_bus=bus).count(), 1)
+        self.assertEqual(planning.apply_plan(planning.plan_journey(self.journey)).buses[0]['bus_id'], bus.id)
+
+    def test_on_spot_passengers_keep_their_bus_and_seats(self):
+        self.book([30])
+        big = Bus.objects.create(journey=self.journey, bus_number='1', capacity=50)
+        small = Bus.objects.create(journey=self.journey, bus_number='2', capacity=20)
+        OnSpotPassenger.objects.bulk_create(
+            OnSpotPassenger(name=f'S{n}', age=40, gender='M', bus=small, journey_type='ONWARD') for n in range(18)
+        )
+        plan = planning.plan_journey(self.journey)
+        self.assertEqual(plan.unused_bus_ids, [])
+        seated = {bus['bus_id']: len(bus['bookings']) for bus in plan.buses}
+        self.assertEqual(set(seated), {small.id, big.id})
+        self.assertLessEqual(seated[small.id], 2)
+        self.assertEqual(sum(seated.values()), 30)
+
+        OnSpotPassenger.objects.create(name='Late', age=40, gender='M', bus=small, journey_type='ONWARD')
+        with self.assertRaises(planning.StalePlan):
+            planning.apply_plan(plan)
+
+    def test_only_admins_plan(self):
+        self.client.force_login(User.objects.create_user('helper', role='volunteer'))
+        self.assertEqual(self.client.post(f'/api/journeys/{self.journey.id}/plan_fleet/').status_code, 403)
+
+    def seat(self, bus, bookings):
+        for seat, booking in enumerate(bookings, start=1):
+            Booking.objects.filter(pk=booking.pk).update(onward_bus=bus, onward_seat_number=str(seat))
+
+    def test_rebalance_empties_the_least_filled_buses(self):
+        bookings = self.book([25, 25, 10, 3])
+        buses = [Bus.objects.create(journey=self.journey, bus_number=str(n), capacity=40) for n in range(1, 5)]
+        point0, point1, point2, point3 = (bookings[:25], bookings[25:50], bookings[50:60], bookings[60:])
+        self.seat(buses[0], point0[:20] + point1[:10])
+        self.seat(buses[1], point1[10:] + point2[:10])
+        self.seat(buses[2], point0[20:] + point3)
+        seats_before = dict(Booking.objects.filter(onward_bus__in=buses[:2]).values_list('id', 'onward_seat_number'))
+
+        url = f'/api/journeys/{self.journey.id}/rebalance/'
+        dry = self.client.post(url, {'dry_run': True}, content_type='application/json').json()
+        self.assertEqual(Booking.objects.filter(onward_bus=buses[2]).count(), 8)
+        response = self.client.post(url, {}, content_type='application/json').json()
+
+        self.assertEqual(dry['moves'], response['moves'])
+        self.assertEqual((response['buses_before'], response['bus_count'], response['splits']), (3, 2, 0))
+        self.assertEqual(response['unused_bus_ids'], [buses[2].id, buses[3].id])
+        self.assertEqual(len(response['moves']), 8)
+        self.assertEqual({move['from_bus'] for move in response['moves']}, {'3'})
+        # The point 0 passengers join the bus that already stops there
+        self.assertEqual(set(Booking.objects.filter(pk__in=[b.pk for b in point0]).values_list('onward_bus', flat=True)), {buses[0].id})
+        self.assertEqual(dict(Booking.objects.filter(pk__in=seats_before).values_list('id', 'onward_seat_number')), seats_before)
+        for bus in buses[:2]:
+            seats = list(Booking.objects.filter(onward_bus=bus).values_list('onward_seat_number', flat=True))
+            self.assertEqual(len(seats), len(set(seats)))
+            self.assertLessEqual(len(seats), bus.capacity)
+        self.assertEqual(ChangeLogEntry.objects.filter(model='bookings.booking', object_id__in=[b.pk for b in point3]).count(), 3)
+
+        again = self.client.post(url, {}, content_type='application/json').json()
+        self.assertEqual(again['moves'], [])
+
+    def test_rebalance_keeps_buses_with_onspot_passengers(self):
+        bookings = self.book([35, 5, 3])
+        full, light, spare = (Bus.objects.create(journey=self.journey, bus_number=str(n), capacity=40) for n in (1, 2, 3))
+        self.seat(full, bookings[:35])
+        self.seat(light, bookings[35:40])
+        self.seat(spare, bookings[40:])
+        OnSpotPassenger.objects.create(name='Walk-in', age=40, gender='M', bus=light, journey_type='ONWARD')
+
+        plan = planning.rebalance_journey(self.journey)
+
+        # The lightest bus has a walk-in and stays; the other light one is emptied into the tightest fit
+        self.assertEqual(plan.unused_bus_ids, [spare.id])
+        self.assertEqual({move['to_bus'] for move in plan.moves}, {'1'})
+        self.assertEqual(sorted(move['to_seat'] for move in plan.moves), ['36', '37', '38'])
+
+    def test_families_are_never_split_between_buses(self):
+        bookings = self.book([5])
+        head = bookings[2].passenger
+        Passenger.objects.filter(pk__in=[bookings[3].passenger_id, bookings[4].passenger_id]).update(related_to=head)
+        Bus.objects.create(journey=self.journey, bus_number='1', capacity=2)
+        Bus.objects.create(journey=self.journey, bus_number='2', capacity=3)
+
+        planning.apply_plan(planning.plan_journey(self.journey))
+
+        family = Booking.objects.filter(pk__in=[b.pk for b in bookings[2:]]).values_list('onward_bus__capacity', 'onward_seat_number')
+        self.assertEqual(sorted(family), [(3, '1'), (3, '2'), (3, '3')])
+
+    def test_rebalance_moves_a_relative_onto_the_family_bus(self):
+        bookings = self.book([12, 2])
+        roomy, tight, emptied = (Bus.objects.create(journey=self.journey, bus_number=str(n), capacity=10) for n in (1, 2, 3))
+        self.seat(roomy, bookings[:5])
+        self.seat(tight, bookings[5:11])
+        self.seat(emptied, bookings[11:])
+        Passenger.objects.filter(pk=bookings[11].passenger_id).update(related_to=bookings[0].passenger)
+
+        plan = planning.rebalance_journey(self.journey)
+
+        # Without the family the relative would take the tighter fit on bus 2
+        self.assertEqual(plan.unused_bus_ids, [emptied.id])
+        self.assertEqual({move['booking_id']: move['to_bus'] for move in plan.moves}[bookings[11].pk], '1')
+
+    def test_rebalance_refuses_an_overloaded_bus(self):
+        bookings = self.book([4])
+        self.seat(Bus.objects.create(journey=self.journey, bus_number='1', capacity=3), bookings)
+
+        response = self.client.post(f'/api/journeys/{self.journey.id}/rebalance/', {}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('4 passengers on 3 seats', response.json()['error'])
+
+    def test_rebalance_five_thousand_passengers_in_batched_queries(self):
+        self.book([417] * 12)
+        planning.apply_plan(planning.plan_journey(self.journey, 30))
+        Bus.objects.update(capacity=50)
+
+        with CaptureQueriesContext(connection) as queries:
+            plan = planning.apply_plan(planning.rebalance_journey(self.journey))
+
+        self.assertEqual((plan.buses_before, len(plan.buses)), (167, 101))
+        self.assertLess(len(queries), len(plan.changes) // 25, 'bookings are moved in batches, not one by one')
+        counts = Booking.objects.values('onward_bus').annotate(n=Count('id')).values_list('n', flat=True)
+        self.assertLessEqual(max(counts), 50)
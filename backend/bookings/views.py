@@ -5,6 +5,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.utils import timezone
 from .models import Booking, Payment, PickupPoint, Bus, SeatCancellation, OnSpotPassenger
 from .serializers import BookingSerializer, PaymentSerializer, PickupPointSerializer, BusSerializer, SeatCancellationSerializer, OnSpotPassengerSerializer
+from .serializers import optimize_booking_queryset, optimize_bus_queryset
 
 class PickupPointViewSet(viewsets.ModelViewSet):
     queryset = PickupPoint.objects.all()
@@ -91,6 +92,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
     permission_classes = [AllowAny]  # Temporarily allow all for testing
     
+    def get_queryset(self):
+        return optimize_booking_queryset(Payment.objects.all(), prefix='booking__')
+    
     def perform_create(self, serializer):
         """Update booking payment status when payment is created"""
         payment = serializer.save()
@@ -131,6 +135,10 @@ class SeatCancellationViewSet(viewsets.ModelViewSet):
     serializer_class = SeatCancellationSerializer
     permission_classes = [AllowAny]  # Temporarily allow all for testing
     
+    def get_queryset(self):
+        queryset = SeatCancellation.objects.select_related('cancelled_by')
+        return optimize_booking_queryset(queryset, prefix='booking__')
+    
     @action(detail=True, methods=['post'])
     def process_refund(self, request, pk=None):
         """Mark refund as processed"""
@@ -153,6 +161,9 @@ class OnSpotPassengerViewSet(viewsets.ModelViewSet):
     serializer_class = OnSpotPassengerSerializer
     permission_classes = [AllowAny]  # Temporarily allow all for testing
     
+    def get_queryset(self):
+        return optimize_bus_queryset(OnSpotPassenger.objects.all(), prefix='bus__')
+    
     @action(detail=False, methods=['get'])
     def by_bus(self, request):
         """Get on-spot passengers for a specific bus and journey type"""
@@ -162,7 +173,7 @@ class OnSpotPassengerViewSet(viewsets.ModelViewSet):
         if not bus_id:
             return Response({'error': 'bus_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        passengers = OnSpotPassenger.objects.filter(bus_id=bus_id)
+        passengers = self.get_queryset().filter(bus_id=bus_id)
         if journey_type:
             passengers = passengers.filter(journey_type=journey_type)
         
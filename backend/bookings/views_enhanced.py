@@ -2,10 +2,14 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.db import models
 from .models import Journey, JourneyPricing, Bus, Booking
 from .serializers import JourneySerializer, JourneyPricingSerializer, BusSerializer, BookingSerializer
+from .serializers import optimize_booking_queryset, optimize_bus_queryset
+from . import manifest_cache, planning, printing
+from .exports import manifest_zip
 
 class JourneyViewSet(viewsets.ModelViewSet):
     queryset = Journey.objects.all()
@@ -23,6 +27,61 @@ class JourneyViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_active=is_active.lower() == 'true')
             
         return queryset.order_by('journey_date', 'journey_type')
+    
+    @action(detail=True, methods=['get'])
+    def manifest_export(self, request, pk=None):
+        """Zip of per-bus manifest CSVs for the whole journey, streamed as it is built"""
+        if not request.user.is_authenticated or request.user.role not in ['admin', 'volunteer']:
+            return Response({'error': 'Export access required'}, status=status.HTTP_403_FORBIDDEN)
+        journey = self.get_object()
+        response = StreamingHttpResponse(manifest_zip(journey), content_type='application/zip')
+        filename = f'manifests_{journey.journey_type.lower()}_{journey.journey_date}.zip'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=True, methods=['post'])
+    def plan_fleet(self, request, pk=None):
+        """Fewest buses for the journey and which pickup points ride which (``{"capacity", "mode", "dry_run"}``)"""
+        if not request.user.is_authenticated or request.user.role != 'admin':
+            return Response({'error': 'Only admins can plan the fleet'}, status=status.HTTP_403_FORBIDDEN)
+        journey = self.get_object()
+        try:
+            capacity = int(request.data.get('capacity') or planning.DEFAULT_CAPACITY)
+        except (TypeError, ValueError):
+            return Response({'error': 'capacity must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        mode = request.data.get('mode', 'auto')
+        if capacity < 1 or mode not in ('auto', 'heuristic', 'exact'):
+            return Response({'error': 'capacity must be positive and mode auto, heuristic or exact'}, status=status.HTTP_400_BAD_REQUEST)
+        plan = planning.plan_journey(journey, capacity, mode)
+        dry_run = request.data.get('dry_run') in (True, 'true', '1')
+        if not dry_run:
+            try:
+                planning.apply_plan(plan)
+            except planning.StalePlan as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({**plan.as_dict(), 'dry_run': dry_run})
+
+    @action(detail=True, methods=['post'])
+    def rebalance(self, request, pk=None):
+        """Consolidate the journey's passengers into fewer buses (``{"mode", "dry_run"}``); returns every move"""
+        if not request.user.is_authenticated or request.user.role != 'admin':
+            return Response({'error': 'Only admins can rebalance buses'}, status=status.HTTP_403_FORBIDDEN)
+        journey = self.get_object()
+        mode = request.data.get('mode', 'auto')
+        if mode not in ('auto', 'heuristic', 'exact'):
+            return Response({'error': 'mode must be auto, heuristic or exact'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            plan = planning.rebalance_journey(journey, mode)
+        except ValueError as e:
+            # A bus already carries more passengers than its capacity
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        dry_run = request.data.get('dry_run') in (True, 'true', '1')
+        if not dry_run:
+            try:
+                planning.apply_plan(plan)
+            except planning.StalePlan as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({**plan.as_dict(), 'dry_run': dry_run})
 
 class JourneyPricingViewSet(viewsets.ModelViewSet):
     queryset = JourneyPricing.objects.all()
@@ -44,7 +103,7 @@ class BusViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        queryset = Bus.objects.all()
+        queryset = optimize_bus_queryset(Bus.objects.all())
         journey_id = self.request.query_params.get('journey_id', None)
         journey_type = self.request.query_params.get('journey_type', None)
         journey_date = self.request.query_params.get('journey_date', None)
@@ -60,60 +119,15 @@ class BusViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def passenger_list(self, request, pk=None):
-        """Get passenger list for a specific bus"""
-        bus = get_object_or_404(Bus, pk=pk)
+        """Get passenger list for a specific bus (served from the manifest cache)"""
+        bus = get_object_or_404(Bus.objects.select_related('journey'), pk=pk)
         
-        # Get bookings for this bus (both onward and return)
-        onward_bookings = Booking.objects.filter(
-            onward_bus=bus,
-            status='Active'
-        ).select_related('passenger', 'assigned_volunteer')
-        
-        return_bookings = Booking.objects.filter(
-            return_bus=bus,
-            status='Active'
-        ).select_related('passenger', 'assigned_volunteer')
-        
-        # Combine and format passenger data
         passengers = []
-        
-        for booking in onward_bookings:
-            passengers.append({
-                'id': booking.id,
-                'passenger_details': {
-                    'name': booking.passenger.name,
-                    'mobile_no': booking.passenger.mobile_no,
-                    'age': booking.passenger.age,
-                    'age_criteria': booking.passenger.age_criteria
-                },
-                'seat_number': booking.onward_seat_number,
-                'journey_type': 'ONWARD',
-                'calculated_price': float(booking.onward_price),
-                'custom_amount': float(booking.custom_amount) if booking.custom_amount else None,
-                'payment_status': booking.payment_status,
-                'assigned_volunteer_details': {
-                    'username': booking.assigned_volunteer.username if booking.assigned_volunteer else ''
-                }
-            })
-        
-        for booking in return_bookings:
-            passengers.append({
-                'id': booking.id,
-                'passenger_details': {
-                    'name': booking.passenger.name,
-                    'mobile_no': booking.passenger.mobile_no,
-                    'age': booking.passenger.age,
-                    'age_criteria': booking.passenger.age_criteria
-                },
-                'seat_number': booking.return_seat_number,
-                'journey_type': 'RETURN',
-                'calculated_price': float(booking.return_price),
-                'custom_amount': float(booking.custom_amount) if booking.custom_amount else None,
-                'payment_status': booking.payment_status,
-                'assigned_volunteer_details': {
-                    'username': booking.assigned_volunteer.username if booking.assigned_volunteer else ''
-                }
-            })
+        onspot_passengers = []
+        for leg in manifest_cache.LEGS:
+            manifest = manifest_cache.get_manifest(bus.id, leg)
+            passengers += manifest['passengers']
+            onspot_passengers += manifest['onspot_passengers']
         
         return Response({
             'bus': {
@@ -122,9 +136,26 @@ class BusViewSet(viewsets.ModelViewSet):
                 'journey': str(bus.journey),
                 'capacity': bus.capacity
             },
-            'passengers': passengers
+            'passengers': passengers,
+            'onspot_passengers': onspot_passengers
         })
     
+    @action(detail=True, methods=['get'])
+    def print_manifest(self, request, pk=None):
+        """Print-ready manifest and seat chart for a bus (HTML, re-rendered only when its data changed)"""
+        bus = get_object_or_404(Bus, pk=pk)
+        f, rendered = printing.open_bus(bus.id)
+        response = FileResponse(f, content_type='text/html; charset=utf-8')
+        response['X-Print-Cache'] = 'miss' if rendered else 'hit'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def manifest_cache_stats(self, request):
+        """Hit rate and latency of the manifest cache in this process - Admin only"""
+        if not request.user.is_authenticated or request.user.role != 'admin':
+            return Response({'error': 'Admin access required'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(manifest_cache.stats.as_dict())
+    
     @action(detail=True, methods=['get'])
     def seat_allocation(self, request, pk=None):
         """Get seat allocation status for a specific bus"""
@@ -184,7 +215,7 @@ class BookingViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        queryset = Booking.objects.all()
+        queryset = optimize_booking_queryset(Booking.objects.all())
         journey_type = self.request.query_params.get('journey_type', None)
         journey_date = self.request.query_params.get('journey_date', None)
         status_filter = self.request.query_params.get('status', None)
@@ -196,9 +227,12 @@ class BookingViewSet(viewsets.ModelViewSet):
                 queryset = queryset.filter(return_journey__isnull=False)
         
         if journey_date:
+            # Match journey ids via a subquery rather than joining Journey
+            # twice; each side of the OR can then use its FK index.
+            journey_ids = Journey.objects.filter(journey_date=journey_date).values('id')
             queryset = queryset.filter(
-                models.Q(onward_journey__journey_date=journey_date) |
-                models.Q(return_journey__journey_date=journey_date)
+                models.Q(onward_journey_id__in=journey_ids) |
+                models.Q(return_journey_id__in=journey_ids)
             )
         
         if status_filter:
@@ -214,10 +248,10 @@ class BookingViewSet(viewsets.ModelViewSet):
             return Response({'error': 'volunteer_id parameter required'}, 
                           status=status.HTTP_400_BAD_REQUEST)
         
-        bookings = Booking.objects.filter(
+        bookings = optimize_booking_queryset(Booking.objects.filter(
             assigned_volunteer_id=volunteer_id,
             status='Active'
-        ).select_related('passenger', 'onward_journey', 'return_journey', 'onward_bus', 'return_bus')
+        ))
         
         serializer = self.get_serializer(bookings, many=True)
         return Response(serializer.data)
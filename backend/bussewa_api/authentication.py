@@ -1,5 +1,112 @@
-from rest_framework.authentication import SessionAuthentication
+"""
+API authentication.
+
+Two modes sit side by side in ``DEFAULT_AUTHENTICATION_CLASSES``:
+
+* ``SignedTokenAuthentication`` - ``Authorization: Bearer <token>``. The
+  token is issued by ``LoginView`` and signed with ``SECRET_KEY``; it
+  carries the user id, username and role and expires after
+  ``API_TOKEN_MAX_AGE`` seconds. Verifying it needs no database access
+  and never touches the session, so a read-only request makes no writes.
+  Revocation (logout, deactivation, permission changes) goes through a
+  small deny-list in the cache, keyed by token id or user.
+* ``CsrfExemptSessionAuthentication`` - the browser session, as before.
+  It stays first in the list, so unauthenticated requests still get 403.
+"""
+
+import secrets
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, SessionAuthentication, get_authorization_header
+
+TOKEN_SALT = 'bussewa.api-token'
+KEYWORD = b'bearer'
+
 
 class CsrfExemptSessionAuthentication(SessionAuthentication):
     def enforce_csrf(self, request):
         return  # To not perform the csrf check previously happening
+
+
+def _max_age():
+    return getattr(settings, 'API_TOKEN_MAX_AGE', settings.SESSION_COOKIE_AGE)
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def issue_token(user):
+    """Signed bearer token for ``user``."""
+    return signing.dumps(
+        {'uid': user.pk, 'u': user.username, 'r': user.role, 's': user.is_staff,
+         'iat': _now_ms(), 'jti': secrets.token_urlsafe(8)},
+        salt=TOKEN_SALT,
+        compress=True,
+    )
+
+
+def read_token(token):
+    """Claims of a valid, unexpired and unrevoked token, else ``AuthenticationFailed``."""
+    try:
+        claims = signing.loads(token, salt=TOKEN_SALT, max_age=_max_age())
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed('Token has expired')
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed('Invalid token')
+
+    revoked = cache.get_many([f'api-token-revoked:{claims["jti"]}', f'api-token-user-revoked:{claims["uid"]}'])
+    if f'api-token-revoked:{claims["jti"]}' in revoked:
+        raise exceptions.AuthenticationFailed('Token has been revoked')
+    if claims['iat'] <= revoked.get(f'api-token-user-revoked:{claims["uid"]}', -1):
+        raise exceptions.AuthenticationFailed('Token has been revoked')
+    return claims
+
+
+def revoke_token(token):
+    """Deny-list one token until it would have expired anyway."""
+    try:
+        claims = signing.loads(token, salt=TOKEN_SALT, max_age=_max_age())
+    except signing.BadSignature:
+        return
+    remaining = (claims['iat'] - _now_ms()) // 1000 + _max_age()
+    if remaining > 0:
+        cache.set(f'api-token-revoked:{claims["jti"]}', True, timeout=remaining)
+
+
+def revoke_user_tokens(user):
+    """Invalidate every token issued to ``user`` so far (e.g. on deactivation or a role change)."""
+    cache.set(f'api-token-user-revoked:{user.pk}', _now_ms(), timeout=_max_age())
+
+
+def bearer_token(request):
+    """The raw token from an ``Authorization: Bearer`` header, if any."""
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != KEYWORD:
+        return None
+    return auth[1].decode()
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if token is None:
+            return None
+        claims = read_token(token)
+
+        # Built from the token alone; enough for role checks and foreign keys.
+        user = get_user_model()(id=claims['uid'], username=claims['u'], role=claims['r'], is_staff=claims['s'], is_active=True)
+        user._state.adding = False
+        user._state.db = 'default'
+        template = user.get_permission_template()
+        user.can_modify_seat_allocation = template['can_modify_seat_allocation']
+        user.can_cancel_seats = template['can_cancel_seats']
+        return user, claims
+
+    def authenticate_header(self, request):
+        return 'Bearer'
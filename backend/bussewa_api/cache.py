@@ -0,0 +1,186 @@
+"""
+Cache configuration helpers and a local Redis stand-in.
+
+``cache_config_from_url`` turns a URL into a ``CACHES`` entry:
+
+    locmem://[name]            per-process memory (default)
+    file:///var/cache/bussewa  shared between processes on one host
+    redis://host:6379/0        shared between hosts (needs the redis package)
+
+``RespStandInServer`` speaks enough of the Redis protocol for Django's
+``RedisCache`` backend, so the redis:// path can be exercised on a laptop
+or in tests without installing Redis (``manage.py run_cache_standin``).
+It keeps everything in memory and is not meant for production.
+"""
+
+import socketserver
+import threading
+import time
+from urllib.parse import urlparse
+
+
+def cache_config_from_url(url, timeout=3600):
+    parsed = urlparse(url)
+    if parsed.scheme == 'locmem':
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': parsed.netloc or 'bussewa',
+            'TIMEOUT': timeout,
+        }
+    if parsed.scheme == 'file':
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': parsed.path,
+            'TIMEOUT': timeout,
+        }
+    if parsed.scheme in ('redis', 'rediss'):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': url,
+            'TIMEOUT': timeout,
+        }
+    raise ValueError(f'Unsupported cache URL: {url}')
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            name, args = command[0].upper(), command[1:]
+            handler = getattr(self.server, f'cmd_{name.decode().lower()}', None)
+            if handler is None:
+                self._write(ValueError(f"unknown command '{name.decode()}'"))
+            else:
+                self._write(handler(*args))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def _encode(self, value):
+        if value is None:
+            return b'$-1\r\n'
+        if value is True:
+            return b'+OK\r\n'
+        if isinstance(value, ValueError):
+            return f'-ERR {value}\r\n'.encode()
+        if isinstance(value, int):
+            return f':{value}\r\n'.encode()
+        if isinstance(value, list):
+            return f'*{len(value)}\r\n'.encode() + b''.join(self._encode(v) for v in value)
+        if isinstance(value, str):
+            return f'+{value}\r\n'.encode()
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _write(self, value):
+        self.wfile.write(self._encode(value))
+
+
+class RespStandInServer(socketserver.ThreadingTCPServer):
+    """In-memory server for the subset of Redis commands Django's cache uses."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 6379)):
+        super().__init__(address, _RespHandler)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Serve on a background thread; returns ``redis://`` URL for it."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    # Commands -------------------------------------------------------------
+
+    def cmd_ping(self, *args):
+        return 'PONG'
+
+    def cmd_select(self, db):
+        return True
+
+    def cmd_client(self, *args):
+        return True
+
+    def cmd_get(self, key):
+        with self._lock:
+            item = self._live(key)
+        return item[0] if item else None
+
+    def cmd_mget(self, *keys):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        options = [o.upper() for o in options]
+        expires = None
+        for flag, scale in ((b'EX', 1), (b'PX', 0.001)):
+            if flag in options:
+                expires = time.monotonic() + int(options[options.index(flag) + 1]) * scale
+        with self._lock:
+            if b'NX' in options and self._live(key):
+                return None
+            self._data[key] = (value, expires)
+        return True
+
+    def cmd_del(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._live(key) and self._data.pop(key))
+
+    def cmd_exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._live(key))
+
+    def cmd_incrby(self, key, delta):
+        with self._lock:
+            item = self._live(key)
+            try:
+                value = int(item[0] if item else 0) + int(delta)
+            except ValueError:
+                return ValueError('value is not an integer or out of range')
+            self._data[key] = (str(value).encode(), item[1] if item else None)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_expire(self, key, seconds):
+        with self._lock:
+            item = self._live(key)
+            if not item:
+                return 0
+            self._data[key] = (item[0], time.monotonic() + int(seconds))
+        return 1
+
+    def cmd_persist(self, key):
+        with self._lock:
+            item = self._live(key)
+            if not item or item[1] is None:
+                return 0
+            self._data[key] = (item[0], None)
+        return 1
+
+    def cmd_flushdb(self, *args):
+        with self._lock:
+            self._data.clear()
+        return True
@@ -0,0 +1,78 @@
+"""
+Primary/replica database routing.
+
+Enabled from settings_prod.py when ``DATABASE_REPLICA_URLS`` is set.
+
+* Requests with a safe method (GET/HEAD/OPTIONS) read from a replica.
+* Everything else - writes, reads inside unsafe requests, management
+  commands and background workers - uses the primary.
+* Once a request writes, it is pinned to the primary for the rest of the
+  request, and the client gets a short-lived cookie that keeps its next
+  requests on the primary too, so it reads its own writes while the
+  replicas catch up.
+* Sessions always live on the primary, so a fresh login is never read back
+  from a lagging replica.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PRIMARY_ONLY_APPS = {'sessions'}
+PIN_COOKIE = 'db_primary_pin'
+
+_use_replicas = contextvars.ContextVar('db_use_replicas', default=False)
+_wrote = contextvars.ContextVar('db_wrote', default=False)
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = _replicas()
+        if not replicas or not _use_replicas.get() or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Session writes happen on every request (SESSION_SAVE_EVERY_REQUEST)
+        # and must not pin the client away from the replicas.
+        if model._meta.app_label not in PRIMARY_ONLY_APPS:
+            _wrote.set(True)
+            _use_replicas.set(False)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class PrimaryPinningMiddleware:
+    """Decide per request whether reads may go to a replica."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        read_only = request.method in ('GET', 'HEAD', 'OPTIONS') and PIN_COOKIE not in request.COOKIES
+        replicas_token = _use_replicas.set(read_only)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                response.set_cookie(
+                    PIN_COOKIE, '1',
+                    max_age=getattr(settings, 'DATABASE_REPLICA_LAG_SECONDS', 5),
+                    httponly=True, samesite='Lax',
+                )
+            return response
+        finally:
+            _use_replicas.reset(replicas_token)
+            _wrote.reset(wrote_token)
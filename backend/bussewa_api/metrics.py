@@ -0,0 +1,239 @@
+"""
+Request-level performance metrics in Prometheus text format.
+
+``RequestMetricsMiddleware`` records, per view and method:
+
+* request latency (histogram) and requests by status code (counter),
+* SQL queries per request (histogram) and time spent in SQL (counter),
+* response size (histogram).
+
+Totals live in-process. With several gunicorn workers set ``METRICS_DIR``
+to a directory shared by the workers: each one snapshots its totals to its
+own file there at most every ``METRICS_FLUSH_SECONDS``, and the scrape view
+merges all files. Files of exited workers are kept so counters never go
+backwards; clear the directory when the service is redeployed.
+
+The middleware also counts the time spent in its own bookkeeping
+(``bussewa_metrics_overhead_seconds_total``), so the overhead can be read
+straight off the metrics next to the request time it is added to.
+"""
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+UNMATCHED = '<unmatched>'
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def _new_series():
+    return {
+        'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+        'latency_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'sql_seconds': 0.0,
+        'size': [0] * (len(SIZE_BUCKETS) + 1),
+        'size_sum': 0,
+    }
+
+
+class MetricsRegistry:
+    """Per-process totals; ``merged()`` adds in other workers' snapshots."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.series = defaultdict(_new_series)  # (view, method) -> totals
+            self.statuses = defaultdict(int)  # (view, method, status) -> count
+            self.overhead_seconds = 0.0
+            self.last_flush = 0.0
+            self.file_name = f'metrics-{os.getpid()}-{time.time_ns()}.json'
+
+    def observe(self, view, method, status, seconds, queries, sql_seconds, size):
+        with self.lock:
+            series = self.series[view, method]
+            series['latency'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            series['latency_sum'] += seconds
+            series['queries'][bisect_left(QUERY_BUCKETS, queries)] += 1
+            series['queries_sum'] += queries
+            series['sql_seconds'] += sql_seconds
+            if size is not None:
+                series['size'][bisect_left(SIZE_BUCKETS, size)] += 1
+                series['size_sum'] += size
+            self.statuses[view, method, status] += 1
+
+    def add_overhead(self, seconds):
+        with self.lock:
+            self.overhead_seconds += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'series': [[view, method, dict(totals, latency=list(totals['latency']), queries=list(totals['queries']), size=list(totals['size']))]
+                           for (view, method), totals in self.series.items()],
+                'statuses': [[view, method, status, count] for (view, method, status), count in self.statuses.items()],
+                'overhead_seconds': self.overhead_seconds,
+            }
+
+    def maybe_flush(self, directory, interval):
+        """Write this worker's snapshot if ``interval`` has passed since the last one."""
+        now = time.monotonic()
+        if now - self.last_flush < interval:
+            return
+        self.last_flush = now
+        self.flush(directory)
+
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, self.file_name))
+
+    def merged(self, directory=None):
+        """This process's totals plus every other worker's last snapshot."""
+        snapshots = [self.snapshot()]
+        if directory:
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                if os.path.basename(path) == self.file_name:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # being replaced right now; picked up on the next scrape
+
+        series = defaultdict(_new_series)
+        statuses = defaultdict(int)
+        overhead = 0.0
+        for snapshot in snapshots:
+            for view, method, totals in snapshot['series']:
+                merged = series[view, method]
+                for key, value in totals.items():
+                    if isinstance(value, list):
+                        merged[key] = [a + b for a, b in zip(merged[key], value)]
+                    else:
+                        merged[key] += value
+            for view, method, status, count in snapshot['statuses']:
+                statuses[view, method, status] += count
+            overhead += snapshot['overhead_seconds']
+        return series, statuses, overhead
+
+
+registry = MetricsRegistry()
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram(lines, name, labels, buckets, counts, total):
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    cumulative += counts[-1]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def render():
+    """All workers' metrics in the Prometheus text exposition format."""
+    series, statuses, overhead = registry.merged(_metrics_dir())
+    lines = [
+        '# HELP bussewa_requests_total Requests by view, method and status code.',
+        '# TYPE bussewa_requests_total counter',
+    ]
+    for (view, method, status), count in sorted(statuses.items()):
+        lines.append(f'bussewa_requests_total{{view="{_label(view)}",method="{method}",status="{status}"}} {count}')
+
+    histograms = [
+        ('bussewa_request_duration_seconds', 'Request latency.', 'latency', LATENCY_BUCKETS),
+        ('bussewa_request_queries', 'SQL queries per request.', 'queries', QUERY_BUCKETS),
+        ('bussewa_response_size_bytes', 'Response body size.', 'size', SIZE_BUCKETS),
+    ]
+    for name, help_text, key, buckets in histograms:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), totals in sorted(series.items()):
+            _histogram(lines, name, f'view="{_label(view)}",method="{method}"', buckets, totals[key], totals[f'{key}_sum'])
+
+    lines += [
+        '# HELP bussewa_request_sql_seconds_total Time spent executing SQL.',
+        '# TYPE bussewa_request_sql_seconds_total counter',
+    ]
+    for (view, method), totals in sorted(series.items()):
+        lines.append(f'bussewa_request_sql_seconds_total{{view="{_label(view)}",method="{method}"}} {totals["sql_seconds"]}')
+
+    lines += [
+        '# HELP bussewa_metrics_overhead_seconds_total Time spent recording these metrics.',
+        '# TYPE bussewa_metrics_overhead_seconds_total counter',
+        f'bussewa_metrics_overhead_seconds_total {overhead}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+class _QueryTimer:
+    """``execute_wrapper`` that counts queries and the time they take."""
+
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class RequestMetricsMiddleware:
+    """Record latency, SQL and response size for every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        setup_started = time.perf_counter()
+        timer = _QueryTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            started = time.perf_counter()
+            response = self.get_response(request)
+            seconds = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else (match.route if match else UNMATCHED)
+        size = None if response.streaming else len(response.content)
+        method = request.method if request.method in METHODS else 'OTHER'
+        registry.observe(view, method, response.status_code, seconds, timer.queries, timer.seconds, size)
+        directory = _metrics_dir()
+        if directory:
+            registry.maybe_flush(directory, getattr(settings, 'METRICS_FLUSH_SECONDS', 5))
+        registry.add_overhead(time.perf_counter() - setup_started - seconds)
+        return response
@@ -0,0 +1,138 @@
+"""
+On-demand profiling of single API requests.
+
+An admin adds ``?_profile=1`` (or the ``X-Profile: 1`` header) to any
+``/api/`` request and gets a profile back instead of the normal body:
+
+* ``1`` / ``sample`` - a sampling profiler: a background thread records the
+  request thread's stack every ``PROFILE_SAMPLE_INTERVAL`` seconds. The
+  result is in collapsed-stack format (``frame;frame;frame count``), which
+  flamegraph.pl, speedscope and inferno read directly.
+* ``cprofile`` - deterministic cProfile, rendered as the top functions by
+  cumulative time.
+
+Only admins (by session) can profile; anyone else gets the normal
+response. Profiles are rate-limited to ``PROFILE_RATE_LIMIT`` per minute
+across the process's cache, and only one request per process is profiled
+at a time, so the hook is safe to leave enabled in production. A request
+that is refused gets its normal body with an ``X-Profile`` header saying
+why.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+MODES = {'1': 'sample', 'sample': 'sample', 'cprofile': 'cprofile'}
+
+_profiling = threading.Lock()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)  # co_qualname is new in Python 3.11
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Sample one thread's stack from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _allowed(request):
+    """None if this request may be profiled, otherwise why not."""
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated or getattr(user, 'role', None) != 'admin':
+        return 'forbidden'
+    key = f'profile-rate:{int(time.time() // 60)}'
+    cache.add(key, 0, timeout=120)
+    try:
+        if cache.incr(key) > getattr(settings, 'PROFILE_RATE_LIMIT', 10):
+            return 'rate-limited'
+    except ValueError:  # evicted between add() and incr()
+        pass
+    return None
+
+
+class ProfilingMiddleware:
+    """Profile admin ``/api/`` requests that ask for it; must run after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = request.GET.get('_profile') or request.headers.get('X-Profile')
+        if not requested or not request.path.startswith('/api/'):
+            return self.get_response(request)
+
+        mode = MODES.get(requested.lower())
+        refused = 'unknown-mode' if mode is None else _allowed(request)
+        if refused is None and not _profiling.acquire(blocking=False):
+            refused = 'busy'
+        if refused:
+            response = self.get_response(request)
+            response['X-Profile'] = refused
+            return response
+
+        try:
+            started = time.perf_counter()
+            if mode == 'sample':
+                with StackSampler(threading.get_ident(), getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.001)) as sampler:
+                    response = self.get_response(request)
+                body = sampler.collapsed()
+                samples = sum(sampler.stacks.values())
+            else:
+                profiler = cProfile.Profile()
+                response = profiler.runcall(self.get_response, request)
+                output = io.StringIO()
+                pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(60)
+                body = output.getvalue()
+                samples = None
+            elapsed = time.perf_counter() - started
+        finally:
+            _profiling.release()
+
+        profile = HttpResponse(body, content_type='text/plain; charset=utf-8')
+        profile['X-Profile'] = mode
+        profile['X-Profile-Status'] = response.status_code
+        profile['X-Profile-Elapsed-Ms'] = f'{elapsed * 1000:.1f}'
+        if samples is not None:
+            profile['X-Profile-Samples'] = samples
+        return profile
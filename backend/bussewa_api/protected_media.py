@@ -0,0 +1,137 @@
+"""
+Authorised delivery of files under ``MEDIA_ROOT``.
+
+Media is never served as public static files. A view decides whether the
+user may see a file and then calls ``serve()``, which - depending on
+``PROTECTED_MEDIA_SERVER`` - hands the transfer to the web server:
+
+* ``nginx`` - ``X-Accel-Redirect`` to ``PROTECTED_MEDIA_INTERNAL_URL``.
+  nginx sends the bytes, including range requests, from an internal
+  location::
+
+      location /protected-media/ {
+          internal;
+          alias /srv/bussewa/backend/media/;
+      }
+
+* ``sendfile`` - ``X-Sendfile`` with the absolute path (Apache mod_xsendfile,
+  lighttpd).
+* ``django`` - the worker sends the file itself; for development only.
+
+``signed_url(name)`` makes a short-lived URL for ``/api/media/`` that is
+checked with an HMAC of the name and expiry time, without the database or
+the session, so an ``<img>`` in a verification list costs no queries.
+Expiry times are rounded up to a bucket of half ``PROTECTED_MEDIA_URL_MAX_AGE``,
+which keeps a file's URL stable across page loads and lets the browser
+cache it. Blobs are named by their digest (passengers/storage.py), so their
+digest is a strong ETag and they are cached as immutable.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import content_disposition_header
+
+SIGNING_SALT = 'bussewa.protected-media'
+BLOB_NAME = re.compile(r'^documents/[0-9a-f]{2}/([0-9a-f]{64})\.\w+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _max_age():
+    return getattr(settings, 'PROTECTED_MEDIA_URL_MAX_AGE', 300)
+
+
+def _signature(name, expires):
+    return salted_hmac(SIGNING_SALT, f'{name}:{expires}', algorithm='sha256').hexdigest()[:32]
+
+
+def signed_url(name, max_age=None):
+    """URL of the media file ``name`` that anyone holding it can fetch until it expires."""
+    bucket = max((max_age or _max_age()) // 2, 1)
+    expires = (int(time.time()) // bucket + 2) * bucket
+    query = urlencode({'expires': expires, 'signature': _signature(name, expires)})
+    return f'/api/media/{quote(name)}?{query}'
+
+
+def verify(name, expires, signature):
+    """Whether ``signature`` is valid for ``name`` and has not expired."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    return expires >= time.time() and constant_time_compare(_signature(name, expires), signature or '')
+
+
+def safe_name(name):
+    """``name`` if it stays inside ``MEDIA_ROOT``, else ``None``."""
+    name = os.path.normpath(name).replace('\\', '/')
+    if name.startswith(('../', '/')) or name in ('.', '..'):
+        return None
+    return name
+
+
+def _ranged(path, header, size):
+    """A 206 response for a single ``bytes=`` range, 416 if unsatisfiable, or ``None`` to send it all."""
+    match = RANGE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    with open(path, 'rb') as f:
+        f.seek(start)
+        response = HttpResponse(f.read(end - start + 1), status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def serve(request, name, cache_seconds=None, as_attachment=False, filename=None):
+    """Hand ``name`` (relative to ``MEDIA_ROOT``) to the web server, or send it in development.
+
+    ``cache_seconds`` lets browsers keep the file that long; without it the
+    response must be revalidated.
+    """
+    blob = BLOB_NAME.match(name)
+    etag = f'"{blob.group(1)}"' if blob else None
+    if etag and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        mode = getattr(settings, 'PROTECTED_MEDIA_SERVER', 'django')
+        if mode == 'nginx':
+            response = HttpResponse()
+            response['X-Accel-Redirect'] = getattr(settings, 'PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/') + quote(name)
+        elif mode == 'sendfile':
+            response = HttpResponse()
+            response['X-Sendfile'] = os.path.abspath(path)
+        elif not os.path.isfile(path):
+            return HttpResponse(status=404)
+        else:
+            size = os.path.getsize(path)
+            response = _ranged(path, request.META.get('HTTP_RANGE'), size)
+            if response is None:
+                response = FileResponse(open(path, 'rb'))
+        if response.status_code != 416:
+            # Clear what Django guessed; the web server sends the body
+            response['Content-Type'] = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename or os.path.basename(name))
+        response['Accept-Ranges'] = 'bytes'
+    if etag:
+        response['ETag'] = etag
+    if cache_seconds:
+        response['Cache-Control'] = f'private, max-age={int(cache_seconds)}' + (', immutable' if etag else '')
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
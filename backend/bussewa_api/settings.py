@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .cache import cache_config_from_url
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,15 +50,20 @@ INSTALLED_APPS = [
     'passengers',
     'bookings',
     'volunteers',
+    'jobs',
+    'sync',
 ]
 
 MIDDLEWARE = [
+    'bussewa_api.metrics.RequestMetricsMiddleware',
+    'bussewa_api.slow_queries.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bussewa_api.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -92,6 +100,37 @@ DATABASES = {
 }
 
 
+# Caches
+# Rendered bus manifests get their own alias so the backend can be switched
+# without touching anything else: locmem:// (default), file:///path/to/dir or
+# redis://host:6379/0 (run `manage.py run_cache_standin` for a local stand-in).
+MANIFEST_CACHE_URL = os.environ.get('MANIFEST_CACHE_URL', 'locmem://manifests')
+
+# The default cache also holds the API token deny-list, so in production
+# with several workers point CACHE_URL at a cache they share.
+CACHE_URL = os.environ.get('CACHE_URL', 'locmem://default')
+
+CACHES = {
+    'default': cache_config_from_url(CACHE_URL),
+    'manifests': cache_config_from_url(MANIFEST_CACHE_URL),
+}
+
+# Request metrics (bussewa_api/metrics.py, served at /api/_metrics). With
+# several gunicorn workers point METRICS_DIR at a directory they share so
+# the scrape sees every worker; unset keeps the totals in-process only.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 5
+
+# Queries slower than this are fingerprinted, explained and logged to the
+# bussewa.slow_queries logger (bussewa_api/slow_queries.py).
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_EXPLAIN_SECONDS = 300
+
+# Admin-only ?_profile=1 on /api/ requests (bussewa_api/profiling.py)
+PROFILE_RATE_LIMIT = 10  # profiles per minute
+PROFILE_SAMPLE_INTERVAL = 0.001  # seconds between stack samples
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -132,6 +171,37 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# How media files are sent once a view has authorised them
+# (bussewa_api/protected_media.py): 'nginx' (X-Accel-Redirect to the internal
+# PROTECTED_MEDIA_INTERNAL_URL location), 'sendfile' (X-Sendfile) or 'django'
+# (the worker streams the file; development only). Signed media URLs stay
+# valid for up to PROTECTED_MEDIA_URL_MAX_AGE seconds.
+PROTECTED_MEDIA_SERVER = os.environ.get('PROTECTED_MEDIA_SERVER', 'django')
+PROTECTED_MEDIA_INTERNAL_URL = os.environ.get('PROTECTED_MEDIA_INTERNAL_URL', '/protected-media/')
+PROTECTED_MEDIA_URL_MAX_AGE = 300
+
+# Background jobs (jobs/queue.py, manage.py run_jobs): a running job whose
+# worker has not heartbeated for JOB_STALE_SECONDS is re-queued, up to
+# JOB_MAX_ATTEMPTS runs in total
+JOB_STALE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+
+# Google Sheets sync worker (sync/sheets.py, manage.py sync_sheets)
+SHEETS_CLIENT = os.environ.get('SHEETS_CLIENT', 'sync.sheets.GoogleSheetsClient')
+SHEETS_SPREADSHEET_ID = os.environ.get('SHEETS_SPREADSHEET_ID', '')
+SHEETS_CREDENTIALS_FILE = os.environ.get('SHEETS_CREDENTIALS_FILE', '')
+
+# Rendered print manifests, keyed by a hash of their content (bookings/printing.py)
+PRINT_CACHE_DIR = os.environ.get('PRINT_CACHE_DIR', BASE_DIR / 'print_cache')
+
+# Part files of resumable Aadhar uploads (passengers/uploads.py); uploads
+# idle for UPLOAD_EXPIRY_SECONDS are removed
+UPLOAD_TMP_DIR = os.environ.get('UPLOAD_TMP_DIR', BASE_DIR / 'upload_tmp')
+UPLOAD_EXPIRY_SECONDS = 86400
+
+# A reviewer's claim on passengers in the verification queue lapses after this
+VERIFICATION_CLAIM_SECONDS = 900
+
 # File upload settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880   # 5MB
@@ -151,6 +221,7 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'bussewa_api.authentication.CsrfExemptSessionAuthentication',
+        'bussewa_api.authentication.SignedTokenAuthentication',
     ],
 }
 
@@ -187,6 +258,9 @@ SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_DOMAIN = None  # Allow localhost
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
+# Lifetime of the bearer tokens LoginView issues (bussewa_api/authentication.py)
+API_TOKEN_MAX_AGE = SESSION_COOKIE_AGE
+
 # CSRF Configuration
 CSRF_COOKIE_HTTPONLY = False
 CSRF_COOKIE_SAMESITE = None  # Allow cross-origin
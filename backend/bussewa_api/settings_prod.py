@@ -4,6 +4,8 @@ Production settings for BusSewa
 
 from .settings import *
 import os
+import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = False
@@ -45,15 +47,68 @@ STATIC_URL = '/django_static/'
 # Media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# nginx sends authorised media from an internal location (see bussewa_api/protected_media.py)
+PROTECTED_MEDIA_SERVER = os.environ.get('PROTECTED_MEDIA_SERVER', 'nginx')
+
+# Caches
+# Every gunicorn worker must see the same caches: the default one holds the
+# API token deny-list (logout and revocation) and the versioned user
+# directory. Without CACHE_URL / MANIFEST_CACHE_URL production uses file
+# caches on this host; locmem:// is only accepted when a single worker is
+# configured (WEB_CONCURRENCY=1).
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 0))
+
+
+def shared_cache_url(setting, default):
+    url = os.environ.get(setting, default)
+    if url.startswith('locmem:') and WEB_CONCURRENCY != 1:
+        raise ImproperlyConfigured(
+            f'{setting}={url} is private to each worker; use file:// or redis://, or set WEB_CONCURRENCY=1'
+        )
+    return url
+
+
+CACHE_URL = shared_cache_url('CACHE_URL', f"file://{BASE_DIR / 'cache' / 'default'}")
+CACHES['default'] = cache_config_from_url(CACHE_URL)
+# Manifest invalidation must reach every worker too, or the others serve
+# stale manifests until the entries expire
+MANIFEST_CACHE_URL = shared_cache_url('MANIFEST_CACHE_URL', f"file://{BASE_DIR / 'cache' / 'manifests'}")
+CACHES['manifests'] = cache_config_from_url(MANIFEST_CACHE_URL)
+
+# Database
+# DATABASE_URL selects the primary (defaults to the local SQLite file).
+# DATABASE_REPLICA_URLS is an optional comma-separated list of read replicas;
+# safe-method requests read from them (see bussewa_api/db_router.py).
+# Connections are kept open per worker for DB_CONN_MAX_AGE seconds and
+# health-checked before reuse; put PgBouncer in front of Postgres if the
+# number of gunicorn workers outgrows max_connections.
+# Local test with two files: DATABASE_URL=sqlite:////abs/path/db.sqlite3
+# DATABASE_REPLICA_URLS=sqlite:////abs/path/replica.sqlite3 (refresh the
+# copy with `sqlite3 db.sqlite3 ".backup replica.sqlite3"`).
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
 
-# Database - keeping SQLite for simplicity
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': dj_database_url.config(
+        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True,
+    ),
 }
 
+DATABASE_REPLICAS = []
+for index, url in enumerate(u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()):
+    alias = f'replica{index + 1}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=DB_CONN_MAX_AGE, conn_health_checks=True)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# How long a client that just wrote keeps reading from the primary
+DATABASE_REPLICA_LAG_SECONDS = int(os.environ.get('DATABASE_REPLICA_LAG_SECONDS', 5))
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['bussewa_api.db_router.PrimaryReplicaRouter']
+    MIDDLEWARE = ['bussewa_api.db_router.PrimaryPinningMiddleware'] + MIDDLEWARE
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -64,6 +119,13 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': os.path.join(BASE_DIR, 'django_errors.log'),
         },
+        'slow_queries': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'slow_queries.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+        },
     },
     'loggers': {
         'django': {
@@ -71,5 +133,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'bussewa.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
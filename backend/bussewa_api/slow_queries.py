@@ -0,0 +1,223 @@
+"""
+Slow-query sampler.
+
+``SlowQueryMiddleware`` wraps every database call made while serving a
+request. A query slower than ``SLOW_QUERY_MS`` is
+
+* reduced to a fingerprint (literals, placeholders and IN-lists collapsed,
+  so the same query shape always lands in the same bucket),
+* counted against that fingerprint (calls, total and max time, views),
+* explained - ``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on Postgres -
+  at most once per fingerprint every ``SLOW_QUERY_EXPLAIN_SECONDS``,
+* logged as one JSON line to the ``bussewa.slow_queries`` logger (a
+  rotating file in production, see settings_prod.LOGGING).
+
+``/api/_slow_queries`` lists the top fingerprints by total time. Like the
+request metrics, each worker snapshots its totals into ``METRICS_DIR`` so
+the view sees all gunicorn workers.
+"""
+
+import contextvars
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger('bussewa.slow_queries')
+
+_explaining = contextvars.ContextVar('slow_query_explaining', default=False)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_LIST = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\1)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalized SQL and a short id for it."""
+    normalized = _STRING.sub('?', sql)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _VALUES_LIST.sub(r'\1, ...', normalized)
+    normalized = _IN_LIST.sub('(?+)', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+class SlowQueryRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.fingerprints = {}
+            self.last_flush = 0.0
+            self.file_name = f'slow-queries-{os.getpid()}-{time.time_ns()}.json'
+
+    def record(self, key, normalized, view, seconds):
+        """Count one slow call; returns the fingerprint's totals and whether it wants a fresh plan."""
+        explain_every = getattr(settings, 'SLOW_QUERY_EXPLAIN_SECONDS', 300)
+        now = time.time()
+        with self.lock:
+            entry = self.fingerprints.get(key)
+            if entry is None:
+                entry = self.fingerprints[key] = {
+                    'fingerprint': key, 'sql': normalized, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'views': [], 'plan': None, 'plan_at': None, 'last_seen': None,
+                }
+            entry['calls'] += 1
+            entry['total_ms'] += seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], seconds * 1000)
+            entry['last_seen'] = now
+            if view not in entry['views'] and len(entry['views']) < 10:
+                entry['views'].append(view)
+            wants_plan = entry['plan_at'] is None or now - entry['plan_at'] >= explain_every
+            if wants_plan:
+                entry['plan_at'] = now  # claim the sample before running EXPLAIN
+            return dict(entry), wants_plan
+
+    def set_plan(self, key, plan):
+        with self.lock:
+            self.fingerprints[key]['plan'] = plan
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(entry, views=list(entry['views'])) for entry in self.fingerprints.values()]
+
+    def maybe_flush(self, directory, interval):
+        now = time.monotonic()
+        if now - self.last_flush < interval:
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, self.file_name))
+
+    def merged(self, directory=None):
+        """Fingerprints from this process and every other worker's last snapshot."""
+        snapshots = [self.snapshot()]
+        if directory:
+            for path in glob.glob(os.path.join(directory, 'slow-queries-*.json')):
+                if os.path.basename(path) == self.file_name:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {}
+        for snapshot in snapshots:
+            for entry in snapshot:
+                total = merged.get(entry['fingerprint'])
+                if total is None:
+                    merged[entry['fingerprint']] = dict(entry, views=list(entry['views']))
+                    continue
+                total['calls'] += entry['calls']
+                total['total_ms'] += entry['total_ms']
+                total['max_ms'] = max(total['max_ms'], entry['max_ms'])
+                total['last_seen'] = max(total['last_seen'], entry['last_seen'])
+                total['views'] += [view for view in entry['views'] if view not in total['views']]
+                if entry['plan'] and (total['plan_at'] or 0) <= (entry['plan_at'] or 0):
+                    total['plan'], total['plan_at'] = entry['plan'], entry['plan_at']
+        return merged
+
+
+registry = SlowQueryRegistry()
+
+
+def top_fingerprints(limit=20):
+    entries = registry.merged(getattr(settings, 'METRICS_DIR', None)).values()
+    return sorted(entries, key=lambda entry: entry['total_ms'], reverse=True)[:limit]
+
+
+def explain(connection, sql, params):
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    token = _explaining.set(True)
+    try:
+        # In a savepoint, so a failing EXPLAIN cannot abort the request's transaction
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as e:  # never let diagnostics break the request
+        return f'EXPLAIN failed: {e}'
+    finally:
+        _explaining.reset(token)
+
+
+class _SlowQueryWatcher:
+    """``execute_wrapper`` that hands queries over the threshold to the registry."""
+
+    def __init__(self, view_name, threshold):
+        self.view_name = view_name
+        self.threshold = threshold
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        seconds = time.perf_counter() - started
+        if seconds >= self.threshold:
+            self.slow(sql, params, many, context['connection'], seconds)
+        return result
+
+    def slow(self, sql, params, many, connection, seconds):
+        view = self.view_name()
+        key, normalized = fingerprint(sql)
+        entry, wants_plan = registry.record(key, normalized, view, seconds)
+        plan = None
+        # EXPLAIN only plain reads; it needs the parameters of a single execution
+        if wants_plan and not many and sql.lstrip()[:6].upper() == 'SELECT' and not connection.needs_rollback:
+            plan = explain(connection, sql, params)
+            registry.set_plan(key, plan)
+        logger.warning(json.dumps({
+            'fingerprint': key,
+            'ms': round(seconds * 1000, 1),
+            'view': view,
+            'calls': entry['calls'],
+            'total_ms': round(entry['total_ms'], 1),
+            'sql': normalized,
+            'plan': plan,
+        }))
+
+
+class SlowQueryMiddleware:
+    """Watch every query made while serving a request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = getattr(settings, 'SLOW_QUERY_MS', 200) / 1000
+
+        def view_name():
+            match = getattr(request, 'resolver_match', None)
+            if match:
+                return match.view_name or match.route
+            return f'{request.method} {request.path}'
+
+        watcher = _SlowQueryWatcher(view_name, threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(watcher))
+            response = self.get_response(request)
+
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and registry.fingerprints:
+            registry.maybe_flush(directory, getattr(settings, 'METRICS_FLUSH_SECONDS', 5))
+        return response
@@ -0,0 +1,197 @@
+"""
+Query-count and latency budgets for API endpoints.
+
+``EndpointBudgetTestCase.assertWithinBudget(url)`` requests ``url`` twice:
+once against a small seeded event and again after ``seed_event`` has added
+several times as many rows. It fails when
+
+* the number of SQL queries changes with the row count (an N+1 in a view
+  or nested serializer),
+* the query count exceeds ``max_queries``, or
+* the median response time on the larger dataset exceeds ``max_ms``.
+
+Each URL gets one warm-up request, and caches are cleared before every
+request so the cold path is measured. A per-endpoint report is printed
+when the test class finishes. Everything runs against the test database,
+so no external services are needed.
+"""
+
+import itertools
+import statistics
+import sys
+import time
+from datetime import date
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import User, UserProfile
+from bookings.models import Booking, Bus, Journey, OnSpotPassenger, Payment, PickupPoint, SeatCancellation
+from passengers.models import Passenger
+
+DEFAULT_MAX_QUERIES = 12
+DEFAULT_MAX_MS = 500
+TIMED_RUNS = 3
+
+_serial = itertools.count(1)
+
+
+def seed_event(buses=2, bookings_per_bus=5, journey_date=date(2026, 1, 10)):
+    """
+    Add a slice of a realistic event: buses on the onward and return
+    journeys, each with a volunteer, booked passengers (some of them
+    volunteers), payments, cancellations and on-spot passengers.
+
+    Rows are bulk-created, so repeated calls simply grow the dataset.
+    Returns the objects created, keyed by kind.
+    """
+    batch = next(_serial)
+    onward, _ = Journey.objects.get_or_create(journey_type='ONWARD', journey_date=journey_date)
+    returning, _ = Journey.objects.get_or_create(journey_type='RETURN', journey_date=journey_date)
+    pickup_point = PickupPoint.objects.create(name=f'Pickup {batch}', location='Main gate')
+
+    volunteers = [
+        User.objects.create_user(username=f'volunteer-{batch}-{n}', role='volunteer')
+        for n in range(buses)
+    ]
+    UserProfile.objects.bulk_create(UserProfile(user=volunteer, full_name=volunteer.username) for volunteer in volunteers)
+    onward_buses = Bus.objects.bulk_create(
+        Bus(bus_number=f'{batch}-{n}', journey=onward, assigned_volunteer=volunteer)
+        for n, volunteer in enumerate(volunteers)
+    )
+    return_buses = Bus.objects.bulk_create(
+        Bus(bus_number=f'{batch}-{n}', journey=returning, assigned_volunteer=volunteer)
+        for n, volunteer in enumerate(volunteers)
+    )
+
+    passengers = Passenger.objects.bulk_create(
+        Passenger(
+            name=f'Passenger {batch}-{n}',
+            gender='MF'[n % 2],
+            age=20 + n % 50,
+            age_criteria='M-Above 12 & Below 65' if n % 2 == 0 else 'F-Above 12 & Below 75',
+            mobile_no=f'98{batch:04d}{n:04d}',
+            category='Satsang',
+        )
+        for n in range(buses * bookings_per_bus)
+    )
+    bookings = Booking.objects.bulk_create(
+        Booking(
+            passenger=passenger,
+            onward_journey=onward,
+            return_journey=returning,
+            pickup_point=pickup_point,
+            onward_bus=onward_buses[n % buses],
+            return_bus=return_buses[n % buses],
+            onward_seat_number=str(n // buses + 1),
+            return_seat_number=str(n // buses + 1),
+            onward_price=550,
+            return_price=550,
+            total_price=1100,
+            payment_status='Paid' if n % 3 else 'Pending',
+            assigned_volunteer=volunteers[n % buses],
+            is_volunteer=n % bookings_per_bus == 0,
+        )
+        for n, passenger in enumerate(passengers)
+    )
+    payments = Payment.objects.bulk_create(
+        Payment(booking=booking, amount=booking.total_price, collected_by=booking.assigned_volunteer.username)
+        for booking in bookings if booking.payment_status == 'Paid'
+    )
+    cancellations = SeatCancellation.objects.bulk_create(
+        SeatCancellation(booking=booking, cancelled_by=booking.assigned_volunteer, journey_type='BOTH')
+        for booking in bookings[::bookings_per_bus]
+    )
+    onspot_passengers = OnSpotPassenger.objects.bulk_create(
+        OnSpotPassenger(name=f'On-spot {batch}-{n}', age=30, gender='M', bus=bus, journey_type='ONWARD')
+        for n, bus in enumerate(onward_buses)
+    )
+    return {
+        'journey': onward,
+        'pickup_point': pickup_point,
+        'volunteers': volunteers,
+        'buses': onward_buses + return_buses,
+        'passengers': passengers,
+        'bookings': bookings,
+        'payments': payments,
+        'cancellations': cancellations,
+        'onspot_passengers': onspot_passengers,
+    }
+
+
+class EndpointBudgetTestCase(TestCase):
+    """Base class for endpoint budget tests; see the module docstring."""
+
+    SMALL = {'buses': 2, 'bookings_per_bus': 3}
+    LARGE = {'buses': 6, 'bookings_per_bus': 15}
+    max_queries = DEFAULT_MAX_QUERIES
+    max_ms = DEFAULT_MAX_MS
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budget_report = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.budget_report:
+            sys.stdout.write(format_report(cls.__name__, cls.budget_report))
+        super().tearDownClass()
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='budget-admin', role='admin')
+        self.client.force_login(self.admin)
+        self.event = seed_event(**self.SMALL)
+
+    def measure(self, url):
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200, f'GET {url} returned {response.status_code}')
+        return len(queries), elapsed * 1000, [query['sql'] for query in queries]
+
+    def assertWithinBudget(self, url, max_queries=None, max_ms=None):
+        """``url`` may use ``{bus}``, ``{booking}`` and ``{passenger}`` placeholders."""
+        max_queries = max_queries or self.max_queries
+        max_ms = max_ms or self.max_ms
+        url = url.format(
+            bus=self.event['buses'][0].id,
+            booking=self.event['bookings'][0].id,
+            passenger=self.event['passengers'][0].id,
+        )
+
+        self.measure(url)  # warm-up: first-request side effects such as get_or_create
+        small_queries, _, small_sql = self.measure(url)
+        seed_event(**self.LARGE)
+        runs = [self.measure(url) for _ in range(TIMED_RUNS)]
+        large_queries, _, large_sql = runs[0]
+        median_ms = statistics.median(ms for _, ms, _ in runs)
+
+        self.budget_report.append((url, small_queries, large_queries, max_queries, median_ms, max_ms))
+        self.assertEqual(
+            small_queries, large_queries,
+            f'GET {url}: query count grows with the data ({small_queries} -> {large_queries}).\n'
+            + '\n'.join(large_sql),
+        )
+        self.assertLessEqual(
+            large_queries, max_queries,
+            f'GET {url}: {large_queries} queries, budget is {max_queries}.\n' + '\n'.join(large_sql),
+        )
+        self.assertLessEqual(median_ms, max_ms, f'GET {url}: {median_ms:.1f}ms, budget is {max_ms}ms')
+
+
+def format_report(title, rows):
+    lines = [
+        '',
+        f'{title} endpoint budgets',
+        f'{"endpoint":<56} {"queries":>9} {"budget":>7} {"median ms":>10} {"budget":>7}',
+    ]
+    for url, small, large, max_queries, median_ms, max_ms in rows:
+        queries = f'{small}->{large}' if small != large else str(large)
+        lines.append(f'{url:<56} {queries:>9} {max_queries:>7} {median_ms:>10.1f} {max_ms:>7}')
+    return '\n'.join(lines) + '\n'
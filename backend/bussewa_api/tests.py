@@ -0,0 +1,262 @@
+import base64
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, override_settings
+
+import loadtest
+from authentication.models import User
+from bookings.models import Booking
+from passengers.models import Passenger
+from . import metrics, protected_media, slow_queries
+from .db_router import PIN_COOKIE, PrimaryPinningMiddleware, PrimaryReplicaRouter
+from .testing import seed_event
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_request(self, request, view):
+        seen = []
+        response = PrimaryPinningMiddleware(lambda r: view(seen) or HttpResponse())(request)
+        return seen, response
+
+    def test_safe_requests_read_from_replica(self):
+        seen, response = self.run_request(self.factory.get('/api/bookings/'), lambda seen: seen.append(self.router.db_for_read(Booking)))
+        self.assertEqual(seen, ['replica1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_rest_of_request_and_next_requests(self):
+        def view(seen):
+            seen.append(self.router.db_for_read(Booking))
+            self.router.db_for_write(Booking)
+            seen.append(self.router.db_for_read(Booking))
+
+        seen, response = self.run_request(self.factory.get('/api/bookings/'), view)
+        self.assertEqual(seen, ['replica1', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get('/api/bookings/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        seen, _ = self.run_request(request, lambda seen: seen.append(self.router.db_for_read(Booking)))
+        self.assertEqual(seen, ['default'])
+
+    def test_unsafe_requests_sessions_and_background_work_use_primary(self):
+        seen, _ = self.run_request(self.factory.post('/api/payments/'), lambda seen: seen.append(self.router.db_for_read(Booking)))
+        self.assertEqual(seen, ['default'])
+
+        def view(seen):
+            seen.append(self.router.db_for_read(Session))
+            self.router.db_for_write(Session)
+        seen, response = self.run_request(self.factory.get('/api/bookings/'), view)
+        self.assertEqual(seen, ['default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        self.assertEqual(self.router.db_for_read(Booking), 'default')
+
+
+class LoadTestDriverTests(LiveServerTestCase):
+    def test_short_run_reports_every_scenario(self):
+        seed_event(buses=2, bookings_per_bus=5)
+        User.objects.create_user(username='loadtester', password='secret', role='volunteer')
+        fd, output = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, output)
+
+        # One virtual user: the live server shares its in-memory SQLite
+        # connection between threads, so concurrent writes would collide.
+        with redirect_stdout(StringIO()) as printed:
+            exit_code = loadtest.main([
+                '--base-url', self.live_server_url, '--username', 'loadtester', '--password', 'secret',
+                '--users', '1', '--duration', '1.5', '--ramp-up', '0', '--think-time', '0.01', '--output', output,
+            ])
+
+        self.assertEqual(exit_code, 0)
+        with open(output) as f:
+            report = json.load(f)
+        self.assertIn('GET /api/buses/{id}/seat_allocation/', report['endpoints'])
+        self.assertIn('GET /api/buses/{id}/passenger_list/', report['endpoints'])
+        self.assertEqual(report['total']['errors'], 0, report['endpoints'])
+        self.assertGreater(report['total']['requests'], 0)
+        self.assertIsNotNone(report['total']['p95_ms'])
+        self.assertIn('TOTAL', printed.getvalue())
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.admin = User.objects.create_user(username='metrics-admin', password='secret', role='admin')
+
+    def test_records_requests_and_serves_prometheus_text_to_admins(self):
+        self.client.get('/api/journeys/')
+        self.client.get('/api/no-such-route/')
+
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+        volunteer = User.objects.create_user(username='metrics-volunteer', password='secret', role='volunteer')
+        self.client.force_login(volunteer)
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+        self.client.logout()
+
+        response = self.client.get('/api/_metrics', HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'metrics-admin:secret').decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('bussewa_requests_total{view="journey-list",method="GET",status="200"} 1', text)
+        self.assertIn('bussewa_requests_total{view="<unmatched>",method="GET",status="404"} 1', text)
+        self.assertIn('bussewa_request_duration_seconds_bucket{view="journey-list",method="GET",le="+Inf"} 1', text)
+        self.assertRegex(text, r'bussewa_request_queries_sum\{view="journey-list",method="GET"\} [1-9]')
+        self.assertIn('bussewa_metrics_overhead_seconds_total', text)
+
+    def test_worker_snapshots_are_merged(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory, METRICS_FLUSH_SECONDS=0):
+            other_worker = metrics.MetricsRegistry()
+            other_worker.observe('journey-list', 'GET', 200, 0.02, 3, 0.001, 512)
+            other_worker.flush(directory)
+            self.client.get('/api/journeys/')
+
+            series, statuses, _ = metrics.registry.merged(directory)
+            self.assertEqual(statuses['journey-list', 'GET', 200], 2)
+            self.assertEqual(sum(series['journey-list', 'GET']['latency']), 2)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_overhead_is_small(self):
+        """Bookkeeping per request stays in the tens of microseconds, a few
+        percent of even a fast (~5ms) API request."""
+        request = RequestFactory().get('/api/journeys/')
+        middleware = metrics.RequestMetricsMiddleware(lambda r: HttpResponse(b'x' * 100))
+        for _ in range(2000):
+            middleware(request)
+        per_request = metrics.registry.overhead_seconds / 2000
+        self.assertLess(per_request, 0.00015, f'{per_request * 1e6:.0f}us of overhead per request')
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        slow_queries.registry.reset()
+
+    def test_fingerprint_collapses_literals_and_lists(self):
+        key, sql = slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'x\' LIMIT 21')
+        other_key, _ = slow_queries.fingerprint('SELECT *  FROM t WHERE id IN (%s) AND name = \'yy\' LIMIT 5')
+        self.assertEqual(sql, 'SELECT * FROM t WHERE id IN (?+) AND name = ? LIMIT ?')
+        self.assertNotEqual(key, other_key)  # a single-element IN is a different shape
+        self.assertEqual(key, slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND name = %s LIMIT 3')[0])
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_explained_and_listed_for_admins(self):
+        with self.assertLogs('bussewa.slow_queries', level='WARNING') as logs:
+            self.client.get('/api/journeys/')
+            self.client.get('/api/journeys/')
+        entry = json.loads(next(line for line in logs.output if 'bookings_journey' in line).split(':', 2)[2])
+        self.assertEqual(entry['view'], 'journey-list')
+        self.assertRegex(entry['plan'], 'SCAN' if connection.vendor == 'sqlite' else 'Scan')
+
+        admin = User.objects.create_user(username='sq-admin', password='secret', role='admin')
+        self.client.force_login(admin)
+        with self.assertLogs('bussewa.slow_queries', level='WARNING'):
+            response = self.client.get('/api/_slow_queries?limit=50')
+        self.assertEqual(response.status_code, 200)
+        journeys = next(f for f in response.json()['fingerprints'] if 'FROM "bookings_journey"' in f['sql'])
+        self.assertEqual(journeys['calls'], 2)
+        self.assertEqual(journeys['views'], ['journey-list'])
+        self.assertTrue(journeys['plan'])
+
+    def test_slow_query_view_is_admin_only(self):
+        volunteer = User.objects.create_user(username='sq-volunteer', password='secret', role='volunteer')
+        self.client.force_login(volunteer)
+        self.assertEqual(self.client.get('/api/_slow_queries').status_code, 403)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='profile-admin', password='secret', role='admin')
+
+    def test_admin_gets_collapsed_stacks_instead_of_body(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/journeys/?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Profile'], 'sample')
+        self.assertEqual(response['X-Profile-Status'], '200')
+        for line in response.content.decode().splitlines():
+            self.assertRegex(line, r'^\S.*;.* \d+$')
+
+    def test_cprofile_mode_via_header(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/journeys/', HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response['X-Profile'], 'cprofile')
+        self.assertIn('cumulative', response.content.decode())
+        self.assertIn('views_enhanced.py', response.content.decode())
+
+    def test_non_admins_get_the_normal_response(self):
+        volunteer = User.objects.create_user(username='profile-volunteer', password='secret', role='volunteer')
+        self.client.force_login(volunteer)
+        response = self.client.get('/api/journeys/?_profile=1')
+        self.assertEqual(response['X-Profile'], 'forbidden')
+        self.assertEqual(response.json(), [])
+
+    @override_settings(PROFILE_RATE_LIMIT=2)
+    def test_rate_limited(self):
+        self.client.force_login(self.admin)
+        modes = [self.client.get('/api/journeys/?_profile=cprofile')['X-Profile'] for _ in range(3)]
+        self.assertEqual(modes, ['cprofile', 'cprofile', 'rate-limited'])
+
+
+class ProtectedMediaTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.passenger = Passenger(name='Elder', gender='M', age=70, age_criteria='M-65 & Above', category='Satsang')
+        self.passenger.aadhar_document = SimpleUploadedFile('aadhar.pdf', b'%PDF-1.4 ' + b'x' * 1000)
+        self.passenger.save()
+        self.name = self.passenger.aadhar_document.name
+
+    def test_signed_url_is_served_without_queries_and_supports_ranges(self):
+        url = protected_media.signed_url(self.name)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content)[:9], b'%PDF-1.4 ')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual((partial.status_code, partial.content, partial['Content-Range']), (206, b'%PDF', 'bytes 0-3/1009'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=5000-').status_code, 416)
+
+    def test_tampered_or_expired_urls_are_refused(self):
+        url = protected_media.signed_url(self.name)
+        self.assertEqual(self.client.get(url.replace('signature=', 'signature=0')).status_code, 403)
+        self.assertEqual(self.client.get(url.replace('.pdf', '.png')).status_code, 403)
+        expired = f'/api/media/{self.name}?expires=1&signature={protected_media._signature(self.name, 1)}'
+        self.assertEqual(self.client.get(expired).status_code, 403)
+
+    @override_settings(PROTECTED_MEDIA_SERVER='nginx')
+    def test_document_view_checks_role_and_hands_off_to_nginx(self):
+        url = f'/api/passengers/{self.passenger.id}/document/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('viewer', role='viewer'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('volunteer', role='volunteer'))
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self.client.get(url, {'variant': 'thumbnail'}).status_code, 404)
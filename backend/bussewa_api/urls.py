@@ -16,18 +16,21 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('passengers.urls')),
     path('api/', include('bookings.urls')),
     path('api/', include('volunteers.urls')),
+    path('api/', include('sync.urls')),
+    path('api/', include('jobs.urls')),
     path('api/auth/', include('authentication.urls')),
+    path('api/_metrics', views.metrics, name='metrics'),
+    path('api/_slow_queries', views.slow_queries, name='slow_queries'),
+    path('api/media/<path:name>', views.signed_media, name='signed_media'),
     path('api-auth/', include('rest_framework.urls')),
 ]
 
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Media is not served as static files, even in development: views check who
+# is asking and hand files over with bussewa_api.protected_media
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework import status
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from . import metrics as request_metrics
+from . import protected_media
+from . import slow_queries as slow_query_sampler
+from .authentication import CsrfExemptSessionAuthentication, SignedTokenAuthentication
+
+
+@api_view(['GET'])
+@authentication_classes([CsrfExemptSessionAuthentication, SignedTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def metrics(request):
+    """Request metrics for all workers in Prometheus text format (admin only; scrapers can use basic auth)"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can read metrics'}, status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@authentication_classes([CsrfExemptSessionAuthentication, SignedTokenAuthentication, BasicAuthentication])
+@permission_classes([IsAuthenticated])
+def slow_queries(request):
+    """Top slow-query fingerprints by total time across all workers (admin only)"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can read slow queries'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 200)
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'threshold_ms': settings.SLOW_QUERY_MS,
+        'fingerprints': slow_query_sampler.top_fingerprints(limit),
+    })
+
+
+
+@require_safe
+def signed_media(request, name):
+    """A media file behind a signed URL (``protected_media.signed_url``); no session or database needed"""
+    name = protected_media.safe_name(name)
+    expires = request.GET.get('expires')
+    if name is None or not protected_media.verify(name, expires, request.GET.get('signature')):
+        return JsonResponse({'error': 'Invalid or expired link'}, status=403)
+    return protected_media.serve(request, name, cache_seconds=int(expires) - int(time.time()))
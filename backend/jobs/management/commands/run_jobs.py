@@ -0,0 +1,25 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.queue import work, worker_name
+
+
+class Command(BaseCommand):
+    help = 'Run a background job worker; start several for parallelism'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        stopping = []
+        # Finish the current job, then exit
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        name = worker_name()
+        self.stdout.write(f'Job worker {name} started')
+        try:
+            work(name, poll=options['poll'], once=options['once'], stop=lambda: bool(stopping))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Job worker {name} stopped')
@@ -0,0 +1,212 @@
+"""
+A database-backed job queue that needs no broker.
+
+Job kinds are registered with ``@register('kind')`` in an app's
+``tasks.py`` (discovered when the ``jobs`` app loads). A task is called with
+a ``JobContext`` and returns a JSON-serialisable result; it reports
+progress with ``ctx.progress(percent, message)``, which also notices a
+cancellation request and stops the task, and can attach a file with
+``ctx.save_artifact(name, content)``.
+
+``enqueue()`` stores a job and returns it; ``manage.py run_jobs`` starts a
+worker that claims queued jobs one at a time. Claiming is
+``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it and
+a compare-and-set ``UPDATE ... WHERE status='queued'`` elsewhere (SQLite),
+so any number of workers can share the table. Workers heartbeat while a job
+runs; a job whose worker died is re-queued (or failed after
+``JOB_MAX_ATTEMPTS``) once its heartbeat is ``JOB_STALE_SECONDS`` old.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('bussewa.jobs')
+
+PROGRESS_WRITE_SECONDS = 1.0
+HEARTBEAT_SECONDS = 30
+
+
+@dataclass
+class Task:
+    kind: str
+    func: object
+    roles: tuple = ('admin',)
+    description: str = ''
+
+
+_tasks = {}
+
+
+def register(kind, roles=('admin',)):
+    """Register ``func(ctx)`` as the job kind ``kind``, enqueueable over the API by ``roles``."""
+    def decorator(func):
+        _tasks[kind] = Task(kind, func, tuple(roles), (func.__doc__ or '').strip().split('\n')[0])
+        return func
+    return decorator
+
+
+def get_task(kind):
+    return _tasks.get(kind)
+
+
+def tasks():
+    return dict(_tasks)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class JobContext:
+    job: Job
+    _last_write: float = field(default=0.0)
+
+    @property
+    def params(self):
+        return self.job.params
+
+    def progress(self, percent, message=None):
+        """Record progress (throttled to one write a second) and stop if the job was cancelled."""
+        now = time.monotonic()
+        if percent < 100 and now - self._last_write < PROGRESS_WRITE_SECONDS:
+            return
+        self._last_write = now
+        updates = {'progress': round(min(max(percent, 0), 100), 1), 'heartbeat_at': timezone.now()}
+        if message is not None:
+            updates['message'] = message[:200]
+        Job.objects.filter(pk=self.job.pk).update(**updates)
+        if Job.objects.filter(pk=self.job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+    def save_artifact(self, name, content):
+        """Attach ``content`` (bytes or a file) to the job as its downloadable result."""
+        if isinstance(content, bytes):
+            content = ContentFile(content)
+        self.job.artifact.save(name, content, save=False)
+        Job.objects.filter(pk=self.job.pk).update(artifact=self.job.artifact.name)
+
+
+def enqueue(kind, params=None, user=None):
+    if kind not in _tasks:
+        raise KeyError(f'Unknown job kind: {kind}')
+    return Job.objects.create(kind=kind, params=params or {}, created_by=user)
+
+
+def cancel(job):
+    """Cancel a queued job now, or ask a running one to stop at its next progress report."""
+    if Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+        status=Job.CANCELLED, cancel_requested=True, finished_at=timezone.now(),
+    ):
+        return
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(cancel_requested=True)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next(worker):
+    """Mark the oldest queued job as running for ``worker`` and return it, or ``None``."""
+    now = timezone.now()
+    claimed = {'status': Job.RUNNING, 'worker': worker, 'started_at': now, 'heartbeat_at': now, 'attempts': F('attempts') + 1}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED).order_by('id').first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(**claimed)
+    else:
+        while True:
+            job_id = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            # Only one worker's UPDATE can still see the job queued
+            if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(**claimed):
+                job = Job(pk=job_id)
+                break
+    job.refresh_from_db()
+    return job
+
+
+class _Heartbeat(threading.Thread):
+    """Keep a running job's heartbeat fresh while its task is busy between progress reports."""
+
+    def __init__(self, job_id):
+        super().__init__(name=f'job-{job_id}-heartbeat', daemon=True)
+        self.job_id = job_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(HEARTBEAT_SECONDS):
+                Job.objects.filter(pk=self.job_id, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+        finally:
+            connections.close_all()
+
+
+def run_job(job):
+    """Run a claimed job to completion and record how it ended."""
+    task = _tasks.get(job.kind)
+    heartbeat = _Heartbeat(job.pk)
+    heartbeat.start()
+    try:
+        if task is None:
+            raise KeyError(f'Unknown job kind: {job.kind}')
+        result = task.func(JobContext(job))
+        fields = {'status': Job.SUCCEEDED, 'progress': 100, 'result': result}
+    except JobCancelled:
+        fields = {'status': Job.CANCELLED, 'message': 'Cancelled'}
+    except Exception as e:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        fields = {'status': Job.FAILED, 'error': ''.join(traceback.format_exception(type(e), e, e.__traceback__))[-5000:], 'message': str(e)[:200]}
+    finally:
+        heartbeat.stopped.set()
+    # A job taken over after this worker was presumed dead is not ours to finish
+    if not Job.objects.filter(pk=job.pk, worker=job.worker).update(finished_at=timezone.now(), **fields):
+        logger.warning('Job %s was re-queued while %s was running it', job.pk, job.worker)
+    job.refresh_from_db()
+    return job
+
+
+def requeue_stale():
+    """Re-queue running jobs whose worker stopped heartbeating; returns how many."""
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_STALE_SECONDS', 300))
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=stale_before)
+    failed = stale.filter(attempts__gte=getattr(settings, 'JOB_MAX_ATTEMPTS', 3)).update(
+        status=Job.FAILED, message='Worker stopped responding', finished_at=timezone.now(),
+    )
+    requeued = stale.update(status=Job.QUEUED, worker='')
+    return requeued + failed
+
+
+def work(worker=None, poll=1.0, once=False, stop=None):
+    """Claim and run jobs until ``stop()`` is true (or the queue is empty with ``once``)."""
+    worker = worker or worker_name()
+    last_sweep = 0.0
+    while not (stop and stop()):
+        if time.monotonic() - last_sweep > 60:
+            last_sweep = time.monotonic()
+            requeue_stale()
+        job = claim_next(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        logger.info('Running job %s (%s)', job.pk, job.kind)
+        run_job(job)
@@ -0,0 +1,46 @@
+import json
+import tempfile
+
+from django.apps import apps
+from django.core import serializers
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .queue import register
+
+BACKUP_MODELS = [
+    'authentication.User',
+    'authentication.UserProfile',
+    'passengers.Passenger',
+    'passengers.DocumentBlob',
+    'bookings.PickupPoint',
+    'bookings.Journey',
+    'bookings.JourneyPricing',
+    'bookings.Bus',
+    'bookings.OnSpotPassenger',
+    'bookings.Booking',
+    'bookings.Payment',
+    'bookings.SeatCancellation',
+]
+
+
+@register('backup')
+def backup(ctx):
+    """JSON backup of the event data, in the format export_db.py imports"""
+    counts = {}
+    with tempfile.TemporaryFile('w+b') as f:
+        f.write(b'{')
+        for n, label in enumerate(BACKUP_MODELS):
+            ctx.progress(n / len(BACKUP_MODELS) * 100, f'Exporting {label}')
+            model = apps.get_model(label)
+            records = serializers.serialize('python', model.objects.order_by('pk').iterator(chunk_size=2000))
+            counts[label] = len(records)
+            f.write(f'{json.dumps(label)}: '.encode())
+            f.write(json.dumps(records, cls=DjangoJSONEncoder).encode())
+            f.write(b', ')
+        metadata = {'export_date': timezone.now().isoformat(), 'version': '2.0', 'total_records': sum(counts.values())}
+        f.write(b'"_metadata": ' + json.dumps(metadata).encode() + b'}')
+        f.seek(0)
+        ctx.save_artifact(f'backup-{timezone.now():%Y%m%d-%H%M%S}.json', File(f))
+    return {'records': counts}
@@ -0,0 +1,103 @@
+import json
+import tempfile
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from authentication.models import User
+from bussewa_api.testing import seed_event
+from . import queue
+from .models import Job
+
+
+@queue.register('test_cancellable')
+def cancellable(ctx):
+    Job.objects.filter(pk=ctx.job.pk).update(cancel_requested=True)
+    ctx.progress(100, 'checking in')
+    return 'not reached'
+
+
+@queue.register('test_failing')
+def failing(ctx):
+    raise ValueError('bad params')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.admin = User.objects.create_user('admin', role='admin')
+        self.client.force_login(self.admin)
+
+    def enqueue(self, kind, **params):
+        response = self.client.post('/api/jobs/', {'kind': kind, 'params': params}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response.json()['id']
+
+    def test_backup_job_runs_in_worker_with_artifact(self):
+        seed_event(buses=1, bookings_per_bus=3)
+        job_id = self.enqueue('backup')
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/').json()['status'], 'queued')
+
+        queue.work('test-worker', once=True)
+
+        job = self.client.get(f'/api/jobs/{job_id}/').json()
+        self.assertEqual((job['status'], job['progress']), ('succeeded', 100))
+        self.assertEqual(job['result']['records']['passengers.Passenger'], 3)
+        response = self.client.get(job['artifact_url'])
+        backup = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(backup['bookings.Booking']), 3)
+        self.assertEqual(backup['_metadata']['total_records'], sum(job['result']['records'].values()))
+
+    def test_polling_returns_304_until_the_job_changes(self):
+        job_id = self.enqueue('backup')
+        first = self.client.get(f'/api/jobs/{job_id}/')
+        unchanged = self.client.get(f'/api/jobs/{job_id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+        queue.work('test-worker', once=True)
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_cancel_queued_and_running_jobs(self):
+        queued_id = self.enqueue('backup')
+        self.assertEqual(self.client.post(f'/api/jobs/{queued_id}/cancel/').json()['status'], 'cancelled')
+
+        queue.enqueue('test_cancellable')
+        job = queue.run_job(queue.claim_next('test-worker'))
+        self.assertEqual(job.status, Job.CANCELLED)
+        self.assertEqual(self.client.post(f'/api/jobs/{job.id}/cancel/').status_code, 409)
+
+    def test_failures_are_recorded(self):
+        queue.enqueue('test_failing')
+        with self.assertLogs('bussewa.jobs', 'ERROR'):
+            job = queue.run_job(queue.claim_next('test-worker'))
+        self.assertEqual((job.status, job.message), (Job.FAILED, 'bad params'))
+        self.assertIn('ValueError', job.error)
+
+    def test_a_job_is_claimed_once(self):
+        queue.enqueue('backup')
+        self.assertIsNotNone(queue.claim_next('worker-a'))
+        self.assertIsNone(queue.claim_next('worker-b'))
+
+    def test_stale_jobs_are_requeued_then_failed(self):
+        job = queue.enqueue('backup')
+        queue.claim_next('dead-worker')
+        for attempt in range(1, 4):
+            Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(queue.requeue_stale(), 1)
+            if attempt < 3:
+                self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+                queue.claim_next('dead-worker')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.FAILED)
+
+    def test_roles_and_visibility(self):
+        viewer = User.objects.create_user('viewer', role='viewer')
+        admin_job = self.enqueue('backup')
+        self.client.force_login(viewer)
+        response = self.client.post('/api/jobs/', {'kind': 'backup'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(f'/api/jobs/{admin_job}/').status_code, 404)
+        self.assertEqual(self.client.post('/api/jobs/', {'kind': 'nope'}, content_type='application/json').status_code, 400)
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('jobs/', views.jobs, name='jobs'),
+    path('jobs/kinds/', views.job_kinds, name='job_kinds'),
+    path('jobs/<int:job_id>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('jobs/<int:job_id>/artifact/', views.job_artifact, name='job_artifact'),
+]
@@ -0,0 +1,103 @@
+import hashlib
+
+from django.http import HttpResponseNotModified
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from bussewa_api import protected_media
+from . import queue
+from .models import Job
+
+POLL_FIELDS = ['id', 'kind', 'status', 'progress', 'message', 'result', 'artifact', 'error', 'cancel_requested',
+               'created_by_id', 'created_at', 'started_at', 'finished_at']
+
+
+def _visible_jobs(user):
+    jobs = Job.objects.all()
+    return jobs if user.role == 'admin' else jobs.filter(created_by_id=user.id)
+
+
+def _job_data(job):
+    data = {key: job[key] for key in POLL_FIELDS if key not in ('artifact', 'error', 'created_by_id')}
+    data['artifact_url'] = f"/api/jobs/{job['id']}/artifact/" if job['artifact'] else None
+    data['error'] = job['error'].splitlines()[-1] if job['error'] else ''
+    return data
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def jobs(request):
+    """List recent jobs (``?status=``), or enqueue one: ``{"kind": "...", "params": {...}}``"""
+    if request.method == 'GET':
+        queryset = _visible_jobs(request.user)
+        if request.query_params.get('status'):
+            queryset = queryset.filter(status=request.query_params['status'])
+        return Response([_job_data(job) for job in queryset.values(*POLL_FIELDS)[:50]])
+
+    kind = request.data.get('kind')
+    params = request.data.get('params') or {}
+    task = queue.get_task(kind)
+    if task is None:
+        return Response({'error': f'Unknown job kind: {kind}'}, status=status.HTTP_400_BAD_REQUEST)
+    if request.user.role not in task.roles:
+        return Response({'error': 'Not allowed to run this job'}, status=status.HTTP_403_FORBIDDEN)
+    if not isinstance(params, dict):
+        return Response({'error': 'params must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+    job = queue.enqueue(kind, params, user=request.user)
+    return Response(
+        {'id': job.id, 'status': job.status, 'url': f'/api/jobs/{job.id}/'},
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_kinds(request):
+    """Job kinds the current user can enqueue"""
+    return Response([
+        {'kind': task.kind, 'description': task.description}
+        for task in queue.tasks().values() if request.user.role in task.roles
+    ])
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_detail(request, job_id):
+    """Poll a job: one indexed lookup, and 304 while nothing changed (send back the ETag)"""
+    job = _visible_jobs(request.user).filter(pk=job_id).values(*POLL_FIELDS).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    etag = '"%s"' % hashlib.md5(
+        f"{job['status']}:{job['progress']}:{job['message']}:{job['finished_at']}:{job['cancel_requested']}".encode()
+    ).hexdigest()
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = Response(_job_data(job))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cancel_job(request, job_id):
+    job = _visible_jobs(request.user).filter(pk=job_id).first()
+    if job is None:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if job.status in Job.FINISHED:
+        return Response({'error': f'Job already {job.status}'}, status=status.HTTP_409_CONFLICT)
+    queue.cancel(job)
+    job.refresh_from_db()
+    return Response({'id': job.id, 'status': job.status, 'cancel_requested': job.cancel_requested})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_artifact(request, job_id):
+    job = _visible_jobs(request.user).filter(pk=job_id).first()
+    if job is None or not job.artifact:
+        return Response({'error': 'No artifact for this job'}, status=status.HTTP_404_NOT_FOUND)
+    return protected_media.serve(request, job.artifact.name, as_attachment=True)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Event-day Load Test for BusSewa
+-------------------------------
+Replays volunteer traffic against a running server (runserver or gunicorn)
+with concurrent virtual users and reports p50/p95/p99 latency, throughput
+and error rate per endpoint. Standard library only, so it runs anywhere.
+
+Each virtual user logs in, takes one bus of the chosen journey and loops
+over a weighted mix of scenarios, pausing between them for a think time:
+
+  seat_map      poll the bus seat map
+  attendance    mark a burst of passengers present
+  payment       collect a cash/GPay payment (write)
+  search        passenger search typeahead, one request per keystroke
+  manifest      export the bus manifest
+
+Populate a database first, e.g. ``python manage.py generate_event_data``.
+Payment and attendance scenarios write; pass --read-only to skip them.
+
+Usage:
+  python loadtest.py --username admin --password secret --users 50 --duration 120 --output run.json
+  python loadtest.py ... --output new.json --compare run.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+
+SCENARIOS = {
+    'seat_map': 40,
+    'search': 20,
+    'manifest': 15,
+    'attendance': 15,
+    'payment': 10,
+}
+WRITE_SCENARIOS = {'attendance', 'payment'}
+SEARCH_NAMES = ['Ramesh', 'Sunita', 'Kavita', 'Prakash', 'Lakshmi', 'Deepak', 'Patil', 'Sharma']
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Results:
+    """Latencies and errors per endpoint, shared by all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+
+    def record(self, endpoint, seconds, error=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds * 1000)
+            if error:
+                self.errors[endpoint] += 1
+                if len(self.error_samples[endpoint]) < 3:
+                    self.error_samples[endpoint].append(error)
+
+    def summary(self, elapsed):
+        def stats(latencies, errors):
+            latencies = sorted(latencies)
+            return {
+                'requests': len(latencies),
+                'errors': errors,
+                'error_rate': round(errors / len(latencies), 4) if latencies else 0,
+                'throughput_rps': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+                'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+                'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+                'max_ms': round(latencies[-1], 1) if latencies else None,
+            }
+
+        with self.lock:
+            endpoints = {
+                endpoint: dict(stats(latencies, self.errors[endpoint]), error_samples=self.error_samples[endpoint])
+                for endpoint, latencies in sorted(self.latencies.items())
+            }
+            everything = [ms for latencies in self.latencies.values() for ms in latencies]
+            total = stats(everything, sum(self.errors.values()))
+        return endpoints, total
+
+
+class Client:
+    """One virtual user's HTTP session (cookies, CSRF token)."""
+
+    def __init__(self, base_url, results, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def request(self, method, path, endpoint, data=None, record=True):
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        csrf = next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), None)
+        if csrf:
+            headers['X-CSRFToken'] = csrf
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+
+        started = time.perf_counter()
+        error = None
+        payload = None
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                raw = response.read()
+            payload = json.loads(raw) if raw else None
+        except urllib.error.HTTPError as e:
+            error = f'HTTP {e.code}'
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            error = f'{type(e).__name__}: {e}'
+        if record:
+            self.results.record(f'{method} {endpoint}', time.perf_counter() - started, error)
+        return payload, error
+
+    def get(self, path, endpoint, **kwargs):
+        return self.request('GET', path, endpoint, **kwargs)
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, number, options, results, bus_id, stop_at):
+        super().__init__(name=f'vu-{number}', daemon=True)
+        self.options = options
+        self.rng = random.Random(options.seed * 1000 + number)
+        self.client = Client(options.base_url, results, options.timeout)
+        self.bus_id = bus_id
+        self.stop_at = stop_at
+        self.bookings = []
+        scenarios = {
+            name: weight for name, weight in SCENARIOS.items()
+            if not (options.read_only and name in WRITE_SCENARIOS)
+        }
+        self.scenario_names = list(scenarios)
+        self.scenario_weights = list(scenarios.values())
+
+    def run(self):
+        _, error = self.client.request(
+            'POST', '/api/auth/login/', '/api/auth/login/',
+            data={'username': self.options.username, 'password': self.options.password},
+        )
+        if error:
+            return
+        self.manifest()
+        while time.monotonic() < self.stop_at:
+            scenario = self.rng.choices(self.scenario_names, weights=self.scenario_weights)[0]
+            getattr(self, scenario)()
+            self.think()
+
+    def think(self):
+        if self.options.think_time > 0:
+            time.sleep(min(self.rng.expovariate(1 / self.options.think_time), self.options.think_time * 5))
+
+    def seat_map(self):
+        self.client.get(f'/api/buses/{self.bus_id}/seat_allocation/', '/api/buses/{id}/seat_allocation/')
+
+    def manifest(self):
+        payload, _ = self.client.get(f'/api/buses/{self.bus_id}/passenger_list/', '/api/buses/{id}/passenger_list/')
+        if payload:
+            self.bookings = payload.get('passengers', [])
+
+    def search(self):
+        name = self.rng.choice(SEARCH_NAMES)
+        for length in range(2, min(len(name), 5) + 1):
+            query = urllib.parse.urlencode({'search': name[:length]})
+            self.client.get(f'/api/passengers/?{query}', '/api/passengers/?search=')
+            time.sleep(self.rng.uniform(0.05, 0.2))  # typing
+
+    def attendance(self):
+        if not self.bookings:
+            return
+        burst = self.rng.sample(self.bookings, min(len(self.bookings), self.rng.randint(5, 10)))
+        for booking in burst:
+            field = 'onward_attendance' if booking.get('journey_type') != 'RETURN' else 'return_attendance'
+            self.client.request('PATCH', f'/api/bookings/{booking["id"]}/', '/api/bookings/{id}/', data={field: True})
+
+    def payment(self):
+        unpaid = [booking for booking in self.bookings if booking.get('payment_status') != 'Paid']
+        if not unpaid:
+            return
+        booking = self.rng.choice(unpaid)
+        amount = booking.get('custom_amount') or booking.get('calculated_price') or 0
+        self.client.request('POST', '/api/payments/', '/api/payments/', data={
+            'booking': booking['id'],
+            'amount': str(amount),
+            'payment_method': self.rng.choice(['Cash', 'GPay']),
+            'collected_by': self.options.username,
+        })
+        booking['payment_status'] = 'Paid'
+
+
+def discover_buses(options):
+    """Bus ids of the chosen (or first) journey, looked up through the API."""
+    client = Client(options.base_url, Results(), options.timeout)
+    _, error = client.request('POST', '/api/auth/login/', '', record=False,
+                              data={'username': options.username, 'password': options.password})
+    if error:
+        raise SystemExit(f'Login failed for {options.username!r}: {error}')
+    journey_id = options.journey_id
+    if journey_id is None:
+        journeys, error = client.get('/api/journeys/', '', record=False)
+        if error or not journeys:
+            raise SystemExit(f'No journeys found ({error or "empty"}); generate data first')
+        journey_id = journeys[0]['id']
+    buses, error = client.get(f'/api/buses/?journey_id={journey_id}', '', record=False)
+    if error or not buses:
+        raise SystemExit(f'No buses found for journey {journey_id} ({error or "empty"})')
+    return [bus['id'] for bus in buses]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options):
+    bus_ids = discover_buses(options)
+    results = Results()
+    started = time.monotonic()
+    stop_at = started + options.ramp_up + options.duration
+    users = []
+    for number in range(options.users):
+        user = VirtualUser(number, options, results, bus_ids[number % len(bus_ids)], stop_at)
+        users.append(user)
+        user.start()
+        if options.ramp_up:
+            time.sleep(options.ramp_up / options.users)
+    for user in users:
+        user.join(timeout=max(stop_at - time.monotonic(), 0) + options.timeout + 30)
+    elapsed = time.monotonic() - started
+
+    endpoints, total = results.summary(elapsed)
+    return {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'base_url': options.base_url,
+            'users': options.users,
+            'duration_s': round(elapsed, 1),
+            'think_time_s': options.think_time,
+            'read_only': options.read_only,
+            'seed': options.seed,
+            'buses': len(bus_ids),
+        },
+        'total': total,
+        'endpoints': endpoints,
+    }
+
+
+def format_report(report, baseline=None):
+    columns = f'{"endpoint":<42} {"reqs":>7} {"rps":>7} {"err%":>6} {"p50":>8} {"p95":>8} {"p99":>8}'
+    if baseline:
+        columns += f' {"p95 vs base":>12}'
+    lines = [columns]
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['total'])]
+    base_rows = dict(baseline['endpoints'], TOTAL=baseline['total']) if baseline else {}
+    for endpoint, stats in rows:
+        line = (
+            f'{endpoint:<42} {stats["requests"]:>7} {stats["throughput_rps"]:>7} {stats["error_rate"] * 100:>6.1f}'
+            f' {stats["p50_ms"] or 0:>8.1f} {stats["p95_ms"] or 0:>8.1f} {stats["p99_ms"] or 0:>8.1f}'
+        )
+        base = base_rows.get(endpoint)
+        if base and base.get('p95_ms') and stats['p95_ms']:
+            line += f' {(stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100:>+11.1f}%'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate event-day volunteer traffic against a BusSewa server')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which users are started')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between scenarios, in seconds')
+    parser.add_argument('--journey-id', type=int, help='Journey whose buses users work on (default: the first one)')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--read-only', action='store_true', help='Skip attendance and payment scenarios')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Earlier JSON results to compare p95 latencies against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    report = run(options)
+    baseline = None
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {options.output}')
+    return 1 if report['total']['requests'] == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Passenger
+from .models import DocumentBlob, Passenger
 
 @admin.register(Passenger)
 class PassengerAdmin(admin.ModelAdmin):
@@ -13,13 +13,21 @@ class PassengerAdmin(admin.ModelAdmin):
             'fields': ('name', 'gender', 'age_criteria', 'category', 'mobile_no')
         }),
         ('Document Verification', {
-            'fields': ('aadhar_received', 'aadhar_document', 'verification_status', 'verification_notes'),
+            'fields': ('aadhar_received', 'aadhar_document', 'aadhar_thumbnail', 'aadhar_preview', 'aadhar_processed_at', 'verification_status', 'verification_notes'),
             'classes': ('collapse',)
         }),
     )
     
     def get_readonly_fields(self, request, obj=None):
         # Make verification_status readonly for non-superusers
+        derivatives = ['aadhar_thumbnail', 'aadhar_preview', 'aadhar_processed_at']
         if not request.user.is_superuser:
-            return ['verification_status']
-        return []
\ No newline at end of file
+            return ['verification_status'] + derivatives
+        return derivatives
+
+
+@admin.register(DocumentBlob)
+class DocumentBlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'references', 'saved_at']
+    readonly_fields = ['name', 'digest', 'size', 'references', 'saved_at']
+    search_fields = ['digest']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PassengersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'passengers'
+
+    def ready(self):
+        from . import blobs, documents  # noqa: F401  (connect the reference-count and upload receivers)
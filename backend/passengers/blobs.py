@@ -0,0 +1,104 @@
+"""
+Reference counts and garbage collection for document blobs.
+
+``DocumentBlob.references`` is adjusted in the same transaction as every
+tracked passenger write that changes a document field, so it always agrees
+with the committed rows. Writes that bypass ``save()`` (queryset
+``update()``) are caught up by ``collect_garbage()``, which recounts every
+blob from the passenger table before it deletes the ones nothing names.
+A blob younger than ``grace`` seconds is kept even if unreferenced: it may
+belong to a save whose transaction has not committed yet.
+"""
+
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import receiver
+from django.utils import timezone
+
+from sync.tracking import change_recorded
+from .models import DocumentBlob, Passenger
+from .storage import BLOB_DIR, document_storage, is_blob
+
+DOCUMENT_FIELDS = ('aadhar_document', 'aadhar_preview', 'aadhar_thumbnail')
+GRACE_SECONDS = 3600
+
+
+def _adjust(name, delta):
+    name = getattr(name, 'name', name)  # deletions report the FieldFile
+    if is_blob(name):
+        DocumentBlob.objects.filter(name=name).update(references=F('references') + delta)
+
+
+@receiver(change_recorded, sender=Passenger)
+def document_fields_changed(sender, instance, operation, fields, previous, **kwargs):
+    for field in DOCUMENT_FIELDS:
+        if operation != 'delete' and field not in fields:
+            continue
+        if operation != 'create':
+            _adjust(previous.get(field), -1)
+        if operation != 'delete':
+            _adjust(getattr(instance, field).name, 1)
+
+
+def reference_counts():
+    counts = Counter()
+    for field in DOCUMENT_FIELDS:
+        for name in Passenger.objects.filter(**{f'{field}__startswith': f'{BLOB_DIR}/'}).values_list(field, flat=True).iterator():
+            counts[name] += 1
+    return counts
+
+
+def collect_garbage(grace=GRACE_SECONDS):
+    """Recount references and delete unreferenced blobs not saved for ``grace`` seconds; returns the bytes freed."""
+    storage = document_storage()
+    counts = reference_counts()
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    freed = 0
+    for blob in list(DocumentBlob.objects.all()):
+        references = counts[blob.name]
+        if references == 0 and blob.saved_at < cutoff:
+            with transaction.atomic():
+                # Check again under the row lock: the content may have been saved or taken since the scan
+                blob = DocumentBlob.objects.select_for_update().filter(pk=blob.pk).first()
+                if blob is None:
+                    continue
+                references = sum(Passenger.objects.filter(**{field: blob.name}).count() for field in DOCUMENT_FIELDS)
+                if references == 0 and blob.saved_at < cutoff:
+                    # File first, while the row is still locked: a save of the same
+                    # content waits for the lock, then finds neither and writes both
+                    storage.delete(blob.name)
+                    blob.delete()
+                    freed += blob.size
+                    continue
+        if references != blob.references:
+            DocumentBlob.objects.filter(pk=blob.pk).update(references=references)
+    return freed
+
+
+def adopt_legacy_files():
+    """Move documents stored under their old per-passenger names into blobs; returns how many passengers moved."""
+    storage = document_storage()
+    legacy = Q()
+    for field in DOCUMENT_FIELDS:
+        legacy |= Q(**{f'{field}__isnull': False}) & ~Q(**{field: ''}) & ~Q(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+    adopted = 0
+    for passenger in list(Passenger.objects.filter(legacy).order_by('id')):
+        moved = {}
+        for field in DOCUMENT_FIELDS:
+            file = getattr(passenger, field)
+            if file and not is_blob(file.name) and storage.exists(file.name):
+                with file.open('rb') as f:
+                    content = ContentFile(f.read())
+                moved[field] = file.name
+                file.save(os.path.basename(file.name), content, save=False)
+        if moved:
+            with transaction.atomic():
+                passenger.save(update_fields=[*moved, 'updated_at'])
+                transaction.on_commit(lambda names=list(moved.values()): [storage.delete(name) for name in names])
+            adopted += 1
+    return adopted
@@ -0,0 +1,219 @@
+"""
+Compact derivatives of uploaded Aadhar documents.
+
+Uploads are stored as they arrive (up to 5MB, see ``validate_document_file``)
+and a ``process_aadhar_document`` job is queued once the upload commits.
+The job, run by ``manage.py run_jobs``, turns the upload into:
+
+* images - the document itself is replaced by a WEBP copy no larger than
+  ``PREVIEW_SIZE`` with EXIF, GPS and colour-profile metadata dropped (the
+  EXIF orientation is applied first), plus a ``THUMBNAIL_SIZE`` thumbnail;
+* PDFs - the original is kept (it may be a signed e-Aadhar) and its first
+  page becomes ``aadhar_preview`` and ``aadhar_thumbnail``. The page is
+  rasterised with ``pdftoppm`` when poppler is installed; otherwise the
+  first embedded JPEG is used, which is the whole page for scanned PDFs.
+
+Files replaced here are deleted, unless they are shared blobs (see
+passengers/storage.py), which the blob garbage collector removes.
+
+Verification screens show ``aadhar_thumbnail`` in lists and
+``aadhar_preview`` (or the document, for images) when opened.
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from sync.tracking import change_recorded
+from .models import Passenger
+from .storage import is_blob
+
+logger = logging.getLogger('bussewa.documents')
+
+PREVIEW_SIZE = (1600, 1600)
+PREVIEW_QUALITY = 70
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 60
+PDF_PREVIEW_DPI = 110
+
+# A JPEG image object inside a PDF: its dictionary, then the raw JPEG stream
+_PDF_JPEG = re.compile(rb'<<((?:(?!>>\s*stream|endobj).)*?/DCTDecode(?:(?!endobj).)*?)>>\s*stream\r?\n', re.DOTALL)
+_PDF_LENGTH = re.compile(rb'/Length\s+(\d+)(\s+\d+\s+R)?')
+
+
+class DocumentError(Exception):
+    pass
+
+
+def _open_image(data):
+    try:
+        image = Image.open(BytesIO(data))
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, much faster than full size
+        image.draft('RGB', PREVIEW_SIZE)
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise DocumentError(f'Unreadable image: {e}') from e
+    return image
+
+
+def normalize(image):
+    """Upright, flattened copy of ``image`` without any of its metadata."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        flattened = Image.new('RGB', image.size, 'white')
+        flattened.paste(image, mask=image.getchannel('A'))
+        image = flattened
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # A fresh image carries pixels only - no EXIF, XMP or ICC profile
+    clean = Image.new(image.mode, image.size)
+    clean.paste(image)
+    return clean
+
+
+def encode(image, size, quality):
+    """WEBP bytes of ``image`` scaled down to fit ``size``."""
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _pdftoppm_page(data):
+    executable = shutil.which('pdftoppm')
+    if not executable:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'document.pdf')
+        with open(source, 'wb') as f:
+            f.write(data)
+        try:
+            subprocess.run(
+                [executable, '-f', '1', '-l', '1', '-r', str(PDF_PREVIEW_DPI), '-png', '-singlefile', source, os.path.join(directory, 'page')],
+                check=True, capture_output=True, timeout=60,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning('pdftoppm could not render a page: %s', e)
+            return None
+        with open(os.path.join(directory, 'page.png'), 'rb') as f:
+            return _open_image(f.read())
+
+
+def _embedded_jpeg(data):
+    for match in _PDF_JPEG.finditer(data):
+        if b'/Image' not in match.group(1):
+            continue
+        start = match.end()
+        length = _PDF_LENGTH.search(match.group(1))
+        if length and not length.group(2):
+            end = start + int(length.group(1))
+        else:  # an indirect length; the stream runs to its end marker
+            end = data.find(b'endstream', start)
+        try:
+            return _open_image(data[start:end])
+        except DocumentError:
+            continue
+    return None
+
+
+def pdf_first_page(data):
+    """The first page of a PDF as an image, or ``None`` if it cannot be rendered here."""
+    if not data.startswith(b'%PDF'):
+        raise DocumentError('Not a PDF file')
+    return _pdftoppm_page(data) or _embedded_jpeg(data)
+
+
+def derivatives(name, data):
+    """``(document, preview, thumbnail)`` bytes for an upload; ``None`` where there is nothing to store.
+
+    ``document`` is the re-encoded image that replaces an image upload; PDFs
+    keep their original and get a ``preview`` instead.
+    """
+    if os.path.splitext(name)[1].lower() == '.pdf':
+        page = pdf_first_page(data)
+        if page is None:
+            return None, None, None
+        page = normalize(page)
+        return None, encode(page, PREVIEW_SIZE, PREVIEW_QUALITY), encode(page, THUMBNAIL_SIZE, THUMBNAIL_QUALITY)
+    image = normalize(_open_image(data))
+    return encode(image, PREVIEW_SIZE, PREVIEW_QUALITY), None, encode(image, THUMBNAIL_SIZE, THUMBNAIL_QUALITY)
+
+
+def _delete_files(storage, names):
+    # Blobs may be shared with other passengers; blobs.collect_garbage() removes them
+    for name in names:
+        name = getattr(name, 'name', name)  # deletions report the FieldFile
+        if name and not is_blob(name):
+            storage.delete(name)
+
+
+def process(passenger_id):
+    """Build the derivatives of a passenger's current document; returns what was stored."""
+    passenger = Passenger.objects.get(pk=passenger_id)
+    source = passenger.aadhar_document.name
+    if not source or passenger.aadhar_processed_at:
+        return {'passenger_id': passenger_id, 'skipped': True}
+
+    storage = passenger.aadhar_document.storage
+    with passenger.aadhar_document.open('rb') as f:
+        data = f.read()
+    document, preview, thumbnail = derivatives(source, data)
+
+    stem = f'passenger_{passenger.id}_{int(timezone.now().timestamp())}'
+    written = []
+    if document:
+        passenger.aadhar_document.save(f'{stem}.webp', ContentFile(document), save=False)
+        written.append(passenger.aadhar_document.name)
+    if preview:
+        passenger.aadhar_preview.save(f'{stem}_preview.webp', ContentFile(preview), save=False)
+        written.append(passenger.aadhar_preview.name)
+    if thumbnail:
+        passenger.aadhar_thumbnail.save(f'{stem}_thumb.webp', ContentFile(thumbnail), save=False)
+        written.append(passenger.aadhar_thumbnail.name)
+    passenger.aadhar_processed_at = timezone.now()
+
+    with transaction.atomic():
+        current = Passenger.objects.select_for_update().filter(pk=passenger_id).values_list('aadhar_document', flat=True).first()
+        if current != source:
+            # Replaced (or the passenger deleted) while we worked; that upload has its own job
+            transaction.on_commit(lambda: _delete_files(storage, written))
+            return {'passenger_id': passenger_id, 'skipped': True}
+        passenger.save(update_fields=['aadhar_document', 'aadhar_preview', 'aadhar_thumbnail', 'aadhar_processed_at'])
+        if document:
+            transaction.on_commit(lambda: _delete_files(storage, [source]))
+    return {
+        'passenger_id': passenger_id,
+        'original_bytes': len(data),
+        'stored_bytes': sum(len(part) for part in (document or data, preview, thumbnail) if part),
+    }
+
+
+def _enqueue_processing(passenger_id):
+    from jobs.queue import enqueue
+
+    enqueue('process_aadhar_document', {'passenger_id': passenger_id})
+
+
+@receiver(change_recorded, sender=Passenger)
+def document_changed(sender, instance, operation, fields, previous, **kwargs):
+    if operation == 'delete' or ('aadhar_document' in fields and not instance.aadhar_processed_at):
+        stale = [previous.get('aadhar_preview'), previous.get('aadhar_thumbnail')]
+        storage = Passenger._meta.get_field('aadhar_preview').storage
+        transaction.on_commit(lambda: _delete_files(storage, stale))
+    if operation == 'delete' or 'aadhar_document' not in fields or instance.aadhar_processed_at:
+        return
+    if instance.aadhar_document:
+        passenger_id = instance.pk
+        transaction.on_commit(lambda: _enqueue_processing(passenger_id))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from passengers import blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete stored passenger documents that no passenger refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--adopt', action='store_true', help='First move documents stored under per-passenger names into shared blobs')
+        parser.add_argument('--grace', type=int, default=blobs.GRACE_SECONDS, help='Keep blobs saved within this many seconds')
+
+    def handle(self, *args, **options):
+        if options['adopt']:
+            self.stdout.write(f'{blobs.adopt_legacy_files()} passengers moved to shared blobs')
+        freed = blobs.collect_garbage(options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'{freed / (1024 * 1024):.1f}MB freed'))
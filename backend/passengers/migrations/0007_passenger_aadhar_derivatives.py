@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:48
+
+from django.db import migrations, models
+import passengers.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passengers', '0006_passenger_aadhar_required_passenger_age'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='aadhar_preview',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to=passengers.models.passenger_derivative_path),
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='aadhar_processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='aadhar_thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to=passengers.models.passenger_derivative_path),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:53
+
+from django.db import migrations, models
+import django.utils.timezone
+import passengers.models
+import passengers.storage
+import passengers.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passengers', '0008_documentupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('digest', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveIntegerField()),
+                ('references', models.IntegerField(default=0)),
+                ('saved_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Last time this content was saved; recent blobs are never collected')),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='passenger',
+            name='aadhar_document',
+            field=models.FileField(blank=True, help_text='Upload Aadhar card (PDF, JPG, PNG, WEBP - Max 5MB)', null=True, storage=passengers.storage.document_storage, upload_to=passengers.models.passenger_document_path, validators=[passengers.validators.validate_document_file]),
+        ),
+        migrations.AlterField(
+            model_name='passenger',
+            name='aadhar_preview',
+            field=models.FileField(blank=True, editable=False, null=True, storage=passengers.storage.document_storage, upload_to=passengers.models.passenger_derivative_path),
+        ),
+        migrations.AlterField(
+            model_name='passenger',
+            name='aadhar_thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, storage=passengers.storage.document_storage, upload_to=passengers.models.passenger_derivative_path),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('passengers', '0009_documentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='passenger',
+            name='verification_claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='verification_claimed_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='passenger',
+            index=models.Index(fields=['verification_status', 'id'], name='passenger_verification_idx'),
+        ),
+    ]
@@ -1,4 +1,9 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
+from sync.tracking import TrackedModelMixin
+from .storage import document_storage
 from .validators import validate_document_file, validate_aadhar_number
 
 def passenger_document_path(instance, filename):
@@ -7,7 +12,10 @@ def passenger_document_path(instance, filename):
     ext = os.path.splitext(filename)[1]
     return f'aadhar_documents/passenger_{instance.id}_{int(time.time())}{ext}'
 
-class Passenger(models.Model):
+def passenger_derivative_path(instance, filename):
+    return f'aadhar_documents/derived/{filename}'
+
+class Passenger(TrackedModelMixin, models.Model):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -55,13 +63,21 @@ class Passenger(models.Model):
     aadhar_received = models.BooleanField(default=False)
     aadhar_document = models.FileField(
         upload_to=passenger_document_path, 
+        storage=document_storage,
         blank=True, 
         null=True,
         validators=[validate_document_file],
         help_text='Upload Aadhar card (PDF, JPG, PNG, WEBP - Max 5MB)'
     )
+    # Compact copies made by passengers.documents after each upload
+    aadhar_preview = models.FileField(upload_to=passenger_derivative_path, storage=document_storage, blank=True, null=True, editable=False)
+    aadhar_thumbnail = models.FileField(upload_to=passenger_derivative_path, storage=document_storage, blank=True, null=True, editable=False)
+    aadhar_processed_at = models.DateTimeField(null=True, blank=True, editable=False)
     verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS, default='Not Required')
     verification_notes = models.TextField(blank=True, help_text='Volunteer verification notes')
+    # A reviewer's claim on a pending passenger in the verification queue (passengers/verification.py)
+    verification_claimed_by = models.ForeignKey('authentication.User', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+')
+    verification_claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -113,6 +129,17 @@ class Passenger(models.Model):
         else:
             self.verification_status = 'Not Required'
         
+        # A new upload makes the derivatives stale; they are rebuilt off the request path
+        loaded = getattr(self, '_loaded_values', None) or {}
+        if (
+            not self._state.adding
+            and loaded.get('aadhar_document') != self.aadhar_document.name
+            and loaded.get('aadhar_processed_at') == self.aadhar_processed_at
+        ):
+            self.aadhar_preview = self.aadhar_thumbnail = self.aadhar_processed_at = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'aadhar_preview', 'aadhar_thumbnail', 'aadhar_processed_at'}
+        
         super().save(*args, **kwargs)
     
     def clean(self):
@@ -129,3 +156,34 @@ class Passenger(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['verification_status', 'id'], name='passenger_verification_idx'),
+        ]
+
+
+class DocumentUpload(models.Model):
+    """An Aadhar document being uploaded in chunks (see passengers/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    passenger = models.ForeignKey(Passenger, on_delete=models.CASCADE, related_name='document_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Expected checksum, if given when the upload started')
+    received = models.PositiveIntegerField(default=0, help_text='Bytes stored so far, from the start of the file')
+    created_by = models.ForeignKey('authentication.User', on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} for {self.passenger_id} ({self.received}/{self.size})"
+
+
+class DocumentBlob(models.Model):
+    """One stored document file, shared by every passenger field that names it (see passengers/storage.py)."""
+    name = models.CharField(max_length=100, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveIntegerField()
+    references = models.IntegerField(default=0)
+    saved_at = models.DateTimeField(default=timezone.now, help_text='Last time this content was saved; recent blobs are never collected')
+
+    def __str__(self):
+        return f"{self.name} ({self.references} references)"
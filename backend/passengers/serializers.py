@@ -1,6 +1,12 @@
 from rest_framework import serializers
+
+from bussewa_api import protected_media
 from .models import Passenger
 
+DOCUMENT_FIELDS = ['aadhar_document', 'aadhar_preview', 'aadhar_thumbnail']
+DOCUMENT_ROLES = ('admin', 'volunteer')
+
+
 class PassengerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Passenger
@@ -10,4 +16,14 @@ class PassengerSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Handle file upload and auto-set verification status
         passenger = super().create(validated_data)
-        return passenger
\ No newline at end of file
+        return passenger
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Documents are linked with short-lived signed URLs, and only for staff
+        request = self.context.get('request')
+        allowed = request is not None and getattr(request.user, 'role', None) in DOCUMENT_ROLES
+        for field in DOCUMENT_FIELDS:
+            file = getattr(instance, field)
+            data[field] = protected_media.signed_url(file.name) if allowed and file else None
+        return data
@@ -0,0 +1,70 @@
+"""
+Content-addressed storage for passenger documents.
+
+Files saved through ``document_storage()`` are stored once per content, as
+``documents/<2 hex>/<sha256><ext>`` under ``MEDIA_ROOT``; the name the
+``upload_to`` function chose only contributes its extension. Saving bytes
+that are already stored writes nothing and returns the existing name, so a
+re-upload, or the same card uploaded for a family member, costs one blob.
+
+Every blob has a ``DocumentBlob`` row whose ``references`` counts the
+passenger fields that name it (kept up to date in passengers/blobs.py).
+Blobs never change once written, which lets backups copy only digests they
+do not already have. Unreferenced blobs are removed by
+``blobs.collect_garbage()``, never when a passenger lets go of one.
+"""
+
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+BLOB_DIR = 'documents'
+
+
+def blob_name(digest, ext):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{BLOB_DIR}/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        from .models import DocumentBlob
+
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        digest = digest.hexdigest()
+        name = blob_name(digest, os.path.splitext(name)[1])
+
+        # Touch the row first: the garbage collector leaves recently saved blobs alone
+        if not DocumentBlob.objects.filter(name=name).update(saved_at=timezone.now()):
+            try:
+                with transaction.atomic():
+                    DocumentBlob.objects.create(name=name, digest=digest, size=size)
+            except IntegrityError:
+                pass  # saved concurrently
+        if not self.exists(name):
+            # Write beside the blob and rename, so a blob is never seen half-written
+            partial = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+            os.replace(self.path(partial), self.path(name))
+        return name
+
+
+_storage = None
+
+
+def document_storage():
+    """The storage of every passenger document field (a callable, so migrations keep the reference)."""
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
@@ -0,0 +1,35 @@
+from jobs.queue import register
+from . import blobs, documents
+from .models import Passenger
+
+
+@register('process_aadhar_document', roles=('admin', 'volunteer'))
+def process_aadhar_document(ctx):
+    """Compact copies and thumbnails of Aadhar uploads (params: passenger_id; all unprocessed if omitted)"""
+    if ctx.params.get('passenger_id'):
+        return documents.process(ctx.params['passenger_id'])
+
+    passenger_ids = list(
+        Passenger.objects.exclude(aadhar_document='').filter(aadhar_document__isnull=False, aadhar_processed_at__isnull=True)
+        .order_by('id').values_list('id', flat=True)
+    )
+    original_bytes = stored_bytes = failed = 0
+    for n, passenger_id in enumerate(passenger_ids):
+        ctx.progress(n / len(passenger_ids) * 100, f'Document {n + 1} of {len(passenger_ids)}')
+        try:
+            result = documents.process(passenger_id)
+        except (documents.DocumentError, OSError):
+            documents.logger.exception('Could not process the document of passenger %s', passenger_id)
+            failed += 1
+            continue
+        original_bytes += result.get('original_bytes', 0)
+        stored_bytes += result.get('stored_bytes', 0)
+    return {'documents': len(passenger_ids), 'failed': failed, 'original_bytes': original_bytes, 'stored_bytes': stored_bytes}
+
+
+@register('collect_document_blobs')
+def collect_document_blobs(ctx):
+    """Delete stored documents no passenger refers to any more (params: adopt to move old files into blobs first)"""
+    adopted = blobs.adopt_legacy_files() if ctx.params.get('adopt') else 0
+    ctx.progress(50, 'Collecting unreferenced blobs')
+    return {'adopted': adopted, 'freed_bytes': blobs.collect_garbage()}
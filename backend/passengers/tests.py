@@ -1,3 +1,336 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from authentication.models import User
+from bussewa_api.testing import EndpointBudgetTestCase
+from jobs import queue
+from sync.changelog import head_seq
+from sync.models import ChangeLogEntry
+from jobs.models import Job
+from . import blobs, uploads
+from .models import DocumentBlob, DocumentUpload, Passenger
+
+
+class EndpointBudgetTests(EndpointBudgetTestCase):
+    def test_passengers(self):
+        self.assertWithinBudget('/api/passengers/')
+        self.assertWithinBudget('/api/passengers/?search=Passenger')
+
+    def test_passenger_detail(self):
+        self.assertWithinBudget('/api/passengers/{passenger}/')
+
+    def test_verification_queue(self):
+        Passenger.objects.update(verification_status='Pending')
+        self.assertWithinBudget('/api/verification-queue/')
+
+
+class AadharDocumentTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def upload(self, name, content, passenger_id=None):
+        data = {'aadhar_document': SimpleUploadedFile(name, content)}
+        with self.captureOnCommitCallbacks(execute=True):
+            if passenger_id:
+                response = self.client.patch(f'/api/passengers/{passenger_id}/', encode_multipart(BOUNDARY, data), content_type=MULTIPART_CONTENT)
+            else:
+                data.update(name='Elder', gender='M', age=70, age_criteria='M-65 & Above', category='Satsang', aadhar_number='234567890123')
+                response = self.client.post('/api/passengers/', data)
+        self.assertIn(response.status_code, (200, 201), response.content)
+        return response.json()
+
+    def photo(self):
+        image = Image.effect_noise((3000, 2000), 60).convert('RGB')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'PhoneMaker'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=80, exif=exif)
+        return buffer.getvalue()
+
+    def test_photo_is_replaced_by_upright_compact_copy_without_metadata(self):
+        original = self.photo()
+        passenger = self.upload('aadhar.jpg', original)
+        self.assertIsNone(passenger['aadhar_thumbnail'])
+        job = Job.objects.get(kind='process_aadhar_document')
+        self.assertEqual(job.params, {'passenger_id': passenger['id']})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            queue.work('test-worker', once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED, job.error)
+        record = Passenger.objects.get(pk=passenger['id'])
+        self.assertTrue(record.aadhar_document.name.endswith('.webp'))
+        self.assertFalse(record.aadhar_preview)
+        with Image.open(record.aadhar_document) as document:
+            self.assertEqual(document.size, (1067, 1600))  # rotated upright, long edge bounded
+            self.assertFalse(document.getexif())
+        with Image.open(record.aadhar_thumbnail) as thumbnail:
+            self.assertEqual(max(thumbnail.size), 320)
+        self.assertLess(record.aadhar_thumbnail.size * 50, len(original))
+        # The original is no longer referenced and goes with the next collection
+        self.assertEqual(DocumentBlob.objects.filter(references=0).count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            freed = blobs.collect_garbage(grace=0)
+        self.assertEqual(freed, len(original))
+        self.assertEqual(sum(len(files) for _, _, files in os.walk(settings.MEDIA_ROOT)), 2)
+
+        self.client.force_login(User.objects.create_user('volunteer', role='volunteer'))
+        listed = self.client.get('/api/passengers/').json()
+        listed = listed['results'] if isinstance(listed, dict) else listed
+        self.assertTrue(listed[0]['aadhar_thumbnail'].startswith(f'/api/media/{record.aadhar_thumbnail.name}?expires='))
+
+    def test_pdf_keeps_original_and_gets_first_page_preview(self):
+        buffer = BytesIO()
+        Image.new('RGB', (1240, 1754), 'white').save(buffer, 'PDF', resolution=150)
+        passenger = self.upload('aadhar.pdf', buffer.getvalue())
+
+        queue.work('test-worker', once=True)
+
+        record = Passenger.objects.get(pk=passenger['id'])
+        self.assertTrue(record.aadhar_document.name.endswith('.pdf'))
+        with Image.open(record.aadhar_preview) as preview:
+            self.assertEqual(preview.size, (1131, 1600))
+        self.assertTrue(record.aadhar_thumbnail)
+
+    def test_new_upload_replaces_stale_derivatives(self):
+        passenger = self.upload('aadhar.jpg', self.photo())
+        queue.work('test-worker', once=True)
+        old_thumbnail = Passenger.objects.get(pk=passenger['id']).aadhar_thumbnail
+
+        updated = self.upload('aadhar.png', self.photo(), passenger_id=passenger['id'])
+
+        self.assertIsNone(updated['aadhar_thumbnail'])
+        self.assertEqual(DocumentBlob.objects.get(name=old_thumbnail.name).references, 0)
+        queue.work('test-worker', once=True)
+        self.assertEqual(Job.objects.filter(kind='process_aadhar_document', status=Job.SUCCEEDED).count(), 2)
+        self.assertTrue(Passenger.objects.get(pk=passenger['id']).aadhar_thumbnail)
+
+
+class DocumentUploadTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        paths = override_settings(MEDIA_ROOT=os.path.join(directory.name, 'media'), UPLOAD_TMP_DIR=os.path.join(directory.name, 'parts'))
+        paths.enable()
+        self.addCleanup(paths.disable)
+        self.passenger = Passenger.objects.create(name='Elder', gender='M', age=70, age_criteria='M-65 & Above', category='Satsang')
+        self.content = os.urandom(300_000)
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def start(self, **data):
+        data = {'filename': 'aadhar.jpg', 'size': len(self.content), 'sha256': self.sha256, **data}
+        return self.client.post(f'/api/passengers/{self.passenger.id}/document-upload/', data, content_type='application/json')
+
+    def put(self, url, first, last, body=None, **headers):
+        body = self.content[first:last + 1] if body is None else body
+        return self.client.put(
+            url, body, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(self.content)}', **headers,
+        )
+
+    def test_upload_resumes_from_stored_offset_and_attaches_on_finish(self):
+        upload = self.start().json()
+        url = upload['url']
+        self.assertEqual(self.put(url, 0, 99_999).json()['offset'], 100_000)
+        # A connection that dropped after 50,000 bytes of the next chunk
+        dropped = BytesIO(self.content[100_000:150_000])
+        self.assertEqual(uploads.write_chunk(DocumentUpload.objects.get(pk=upload['id']), 100_000, 100_000, dropped), 150_000)
+        self.assertEqual(self.client.get(url).json()['offset'], 150_000)
+        self.assertEqual(self.put(url, 250_000, 299_999).status_code, 409)
+        self.passenger.refresh_from_db()
+        self.assertFalse(self.passenger.aadhar_document)
+
+        self.put(url, 120_000, 299_999)  # overlaps bytes already stored
+        with self.captureOnCommitCallbacks(execute=True):
+            finished = self.client.post(f'{url}finish/', content_type='application/json')
+
+        self.assertEqual(finished.status_code, 200, finished.content)
+        self.passenger.refresh_from_db()
+        with self.passenger.aadhar_document.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.listdir(settings.UPLOAD_TMP_DIR), [])
+        self.assertTrue(Job.objects.filter(kind='process_aadhar_document', params={'passenger_id': self.passenger.id}).exists())
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_checksums_are_verified(self):
+        url = self.start(sha256='0' * 64).json()['url']
+        bad_chunk = self.put(url, 0, 99_999, HTTP_X_CHUNK_SHA256=hashlib.sha256(b'other').hexdigest())
+        self.assertEqual((bad_chunk.status_code, bad_chunk.json()['offset']), (422, 0))
+        self.put(url, 0, 299_999)
+
+        response = self.client.post(f'{url}finish/', content_type='application/json')
+
+        self.assertEqual((response.status_code, response.json()['offset']), (422, 0))
+        self.passenger.refresh_from_db()
+        self.assertFalse(self.passenger.aadhar_document)
+
+    def test_a_corrupt_retry_leaves_received_bytes_alone(self):
+        url = self.start().json()['url']
+        self.put(url, 0, 99_999)
+        chunk_sha256 = hashlib.sha256(self.content[:100_000]).hexdigest()
+        corrupt = self.put(url, 0, 99_999, body=bytes(100_000), HTTP_X_CHUNK_SHA256=chunk_sha256)
+        self.assertEqual((corrupt.status_code, corrupt.json()['offset']), (422, 100_000))
+        self.put(url, 100_000, 299_999)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            finished = self.client.post(f'{url}finish/', content_type='application/json')
+
+        self.assertEqual(finished.status_code, 200, finished.content)
+
+    def test_whole_file_checksum_is_optional(self):
+        url = self.start(sha256='').json()['url']
+        self.put(url, 0, 299_999)
+        with self.captureOnCommitCallbacks(execute=True):
+            finished = self.client.post(f'{url}finish/', content_type='application/json')
+        self.assertEqual(finished.status_code, 200, finished.content)
+
+    def test_start_validates_the_file(self):
+        self.assertEqual(self.start(filename='aadhar.exe').status_code, 400)
+        self.assertEqual(self.start(size=6 * 1024 * 1024).status_code, 400)
+
+
+class DocumentBlobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def passenger(self, name, content=None):
+        passenger = Passenger(name=name, gender='M', age=70, age_criteria='M-65 & Above', category='Satsang')
+        if content is not None:
+            passenger.aadhar_document = SimpleUploadedFile('aadhar.pdf', content)
+        passenger.save()
+        return passenger
+
+    def test_identical_documents_share_one_reference_counted_blob(self):
+        first = self.passenger('First', b'%PDF-1.4 same card')
+        second = self.passenger('Second', b'%PDF-1.4 same card')
+
+        self.assertEqual(first.aadhar_document.name, second.aadhar_document.name)
+        digest = hashlib.sha256(b'%PDF-1.4 same card').hexdigest()
+        self.assertEqual(first.aadhar_document.name, f'documents/{digest[:2]}/{digest}.pdf')
+        blob = DocumentBlob.objects.get()
+        self.assertEqual((blob.digest, blob.references), (digest, 2))
+
+        first.delete()
+        second.aadhar_document = SimpleUploadedFile('aadhar.pdf', b'%PDF-1.4 new card')
+        second.save()
+        blob.refresh_from_db()
+        self.assertEqual(blob.references, 0)
+
+        self.assertEqual(blobs.collect_garbage(), 0)  # saved too recently
+        self.assertEqual(blobs.collect_garbage(grace=0), len(b'%PDF-1.4 same card'))
+        self.assertFalse(second.aadhar_document.storage.exists(blob.name))
+        self.assertTrue(second.aadhar_document.storage.exists(second.aadhar_document.name))
+
+        # The same content saved again after collection is stored afresh
+        third = self.passenger('Third', b'%PDF-1.4 same card')
+        self.assertEqual(third.aadhar_document.name, blob.name)
+        self.assertTrue(third.aadhar_document.storage.exists(blob.name))
+        self.assertEqual(DocumentBlob.objects.get(name=blob.name).references, 1)
+
+    def test_collection_recounts_references_written_without_save(self):
+        passenger = self.passenger('First', b'%PDF-1.4 card')
+        name = passenger.aadhar_document.name
+        Passenger.objects.filter(pk=passenger.pk).update(aadhar_preview=name)
+
+        self.assertEqual(blobs.collect_garbage(grace=0), 0)
+        self.assertEqual(DocumentBlob.objects.get(name=name).references, 2)
+
+    def test_legacy_files_are_adopted_into_blobs(self):
+        passenger = self.passenger('First')
+        legacy = 'aadhar_documents/passenger_1_1700000000.pdf'
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'aadhar_documents'))
+        with open(os.path.join(settings.MEDIA_ROOT, legacy), 'wb') as f:
+            f.write(b'%PDF-1.4 old card')
+        Passenger.objects.filter(pk=passenger.pk).update(aadhar_document=legacy)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(blobs.adopt_legacy_files(), 1)
+
+        passenger.refresh_from_db()
+        self.assertTrue(passenger.aadhar_document.name.startswith('documents/'))
+        self.assertEqual(DocumentBlob.objects.get().references, 1)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, legacy)))
+
+
+class VerificationQueueTests(TestCase):
+    def setUp(self):
+        self.first = User.objects.create_user('first', role='volunteer')
+        self.second = User.objects.create_user('second', role='volunteer')
+        self.pending = Passenger.objects.bulk_create(
+            Passenger(name=f'Elder {n}', gender='M', age=70, age_criteria='M-65 & Above', category='Satsang',
+                      aadhar_required=True, verification_status='Pending', aadhar_thumbnail=f'documents/ab/{n:064x}.webp')
+            for n in range(7)
+        )
+        Passenger.objects.create(name='Young', gender='M', age=30, age_criteria='M-Above 12 & Below 65', category='Satsang')
+        self.client.force_login(self.first)
+
+    def test_pages_only_pending_passengers_by_keyset(self):
+        first_page = self.client.get('/api/verification-queue/', {'limit': 4}).json()
+        second_page = self.client.get('/api/verification-queue/', {'limit': 4, 'after': first_page['next']}).json()
+
+        ids = [row['id'] for row in first_page['results'] + second_page['results']]
+        self.assertEqual(ids, [p.id for p in self.pending])
+        self.assertIsNone(second_page['next'])
+        self.assertTrue(first_page['results'][0]['thumbnail_url'].startswith('/api/media/documents/ab/'))
+        plan = Passenger.objects.filter(verification_status='Pending', id__gt=first_page['next']).order_by('id').explain()
+        self.assertIn('passenger_verification_idx', plan)
+
+    def test_claimed_batches_do_not_overlap_and_lapse(self):
+        mine = [row['id'] for row in self.client.post('/api/verification-queue/claim/', {'limit': 4}, content_type='application/json').json()['results']]
+        self.client.force_login(self.second)
+        theirs = [row['id'] for row in self.client.post('/api/verification-queue/claim/', {'limit': 4}, content_type='application/json').json()['results']]
+
+        self.assertEqual(len(mine), 4)
+        self.assertEqual(len(theirs), 3)
+        self.assertFalse(set(mine) & set(theirs))
+        self.assertEqual(len(self.client.get('/api/verification-queue/', {'mine': '1'}).json()['results']), 3)
+
+        Passenger.objects.filter(pk__in=mine).update(verification_claimed_at=timezone.now() - timedelta(hours=1))
+        retaken = self.client.post('/api/verification-queue/claim/', {'limit': 10}, content_type='application/json').json()['results']
+        self.assertEqual(sorted(row['id'] for row in retaken), sorted(mine))
+
+    def test_bulk_decision_is_one_update_and_skips_other_reviewers_claims(self):
+        self.client.post('/api/verification-queue/claim/', {'limit': 2}, content_type='application/json')
+        self.client.force_login(self.second)
+        ids = [p.id for p in self.pending]
+        since = head_seq()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/api/verification-queue/decide/', {'ids': ids, 'decision': 'Verified', 'notes': 'Card checked'},
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.json()['skipped'], ids[:2])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE "passengers_passenger"')]), 1)
+        verified = Passenger.objects.filter(verification_status='Verified')
+        self.assertEqual(sorted(verified.values_list('id', flat=True)), ids[2:])
+        self.assertEqual(set(verified.values_list('verification_notes', flat=True)), {'Card checked'})
+        entries = ChangeLogEntry.objects.filter(id__gt=since, model='passengers.passenger')
+        self.assertEqual(sorted(entries.values_list('object_id', flat=True)), ids[2:])
+        self.assertEqual(entries.first().changed_fields, ['verification_status', 'verification_notes'])
+
+        bad = self.client.post('/api/verification-queue/decide/', {'ids': ids, 'decision': 'Maybe'}, content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
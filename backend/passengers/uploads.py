@@ -0,0 +1,177 @@
+"""
+Resumable chunked uploads of Aadhar documents.
+
+A client starts an upload with the file's name, size and (optionally) its
+SHA-256, then PUTs byte ranges of the file with a ``Content-Range`` header.
+Each chunk is streamed from the request straight into a part file under
+``UPLOAD_TMP_DIR`` and fsynced before ``received`` advances, so after a
+dropped connection the client asks for the offset and carries on from
+there. Finishing checks the size (and the checksum, if one was given) and
+moves the part file into ``Passenger.aadhar_document``; nothing is
+attached until then.
+
+Uploads that see no chunk for ``UPLOAD_EXPIRY_SECONDS`` are removed the
+next time an upload starts.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .models import DocumentUpload
+from .validators import validate_document_file
+
+READ_SIZE = 64 * 1024
+CHUNK_SIZE = 512 * 1024  # suggested to clients; any size up to the rest of the file is accepted
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _PartFile(File):
+    """A finished part file; storages move it into place instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _upload_dir():
+    return str(getattr(settings, 'UPLOAD_TMP_DIR', settings.BASE_DIR / 'upload_tmp'))
+
+
+def part_path(upload):
+    return os.path.join(_upload_dir(), f'{upload.pk}.part')
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired():
+    """Remove uploads that have not received a chunk for ``UPLOAD_EXPIRY_SECONDS``."""
+    expired_before = timezone.now() - timedelta(seconds=getattr(settings, 'UPLOAD_EXPIRY_SECONDS', 86400))
+    expired = list(DocumentUpload.objects.filter(updated_at__lt=expired_before))
+    for upload in expired:
+        _remove(part_path(upload))
+    DocumentUpload.objects.filter(pk__in=[upload.pk for upload in expired]).delete()
+    return len(expired)
+
+
+def start(passenger, filename, size, sha256='', user=None):
+    try:
+        validate_document_file(SimpleNamespace(name=filename, size=size))
+    except ValidationError as e:
+        raise UploadError(e.messages[0])
+    if size <= 0:
+        raise UploadError('size must be positive')
+    purge_expired()
+    upload = DocumentUpload.objects.create(
+        passenger=passenger, filename=filename, size=size, sha256=sha256.lower(),
+        created_by=user if user and user.is_authenticated else None,
+    )
+    os.makedirs(_upload_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def _copy(stream, length, f):
+    """Copy up to ``length`` bytes of ``stream`` into ``f``; returns the count and their digest."""
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+    except (UnreadablePostError, OSError):
+        pass  # keep what arrived; the client resumes from the offset
+    return written, digest.hexdigest()
+
+
+def write_chunk(upload, offset, length, stream, sha256=''):
+    """Store ``length`` bytes read from ``stream`` at ``offset``; returns the new offset.
+
+    Bytes the upload already has may be sent again (a retried chunk).
+    Bytes read before the connection dropped are kept, so the retry can
+    start from the returned offset. With ``sha256`` the chunk is read aside
+    and only written, and counted, if the whole of it arrived with that
+    checksum, so a bad retry never overwrites bytes already received.
+    """
+    if offset > upload.received:
+        raise UploadError(f'Expected a chunk starting at byte {upload.received}', status=409)
+    if offset + length > upload.size:
+        raise UploadError('Chunk runs past the end of the file')
+
+    with open(part_path(upload), 'r+b') as f:
+        f.seek(offset)
+        if sha256:
+            with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE, dir=_upload_dir()) as chunk:
+                written, digest = _copy(stream, length, chunk)
+                if written < length or digest != sha256.lower():
+                    raise UploadError('Chunk checksum does not match', status=422)
+                chunk.seek(0)
+                shutil.copyfileobj(chunk, f, READ_SIZE)
+        else:
+            written, _ = _copy(stream, length, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    end = offset + written
+    # Concurrent retries of the same range write the same bytes; only ever move forward
+    DocumentUpload.objects.filter(pk=upload.pk, received__lt=end).update(received=end, updated_at=timezone.now())
+    upload.refresh_from_db(fields=['received', 'updated_at'])
+    return upload.received
+
+
+def finish(upload, sha256=''):
+    """Verify the complete file and attach it to the passenger; returns the passenger.
+
+    The whole-file checksum is checked when the client gave one, here or at
+    the start; browsers without WebCrypto (plain-http origins) cannot.
+    """
+    expected = (sha256 or upload.sha256).lower()
+    if upload.received != upload.size:
+        raise UploadError(f'Upload is incomplete: {upload.received} of {upload.size} bytes received', status=409)
+
+    path = part_path(upload)
+    if expected:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while data := f.read(READ_SIZE):
+                digest.update(data)
+        if digest.hexdigest() != expected:
+            # The stored bytes are wrong somewhere; start again from scratch
+            open(path, 'wb').close()
+            DocumentUpload.objects.filter(pk=upload.pk).update(received=0, updated_at=timezone.now())
+            raise UploadError('File checksum does not match; upload it again from the start', status=422)
+
+    passenger = upload.passenger
+    with open(path, 'rb') as f:
+        passenger.aadhar_document.save(upload.filename, _PartFile(f, name=upload.filename), save=False)
+    passenger.save(update_fields=['aadhar_document', 'updated_at'])
+    _remove(path)
+    upload.delete()
+    return passenger
+
+
+def abort(upload):
+    _remove(part_path(upload))
+    upload.delete()
@@ -1,10 +1,19 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PassengerViewSet
+from .views import (
+    PassengerViewSet, claim_verifications, decide_verifications, document_upload, finish_document_upload,
+    release_verifications, verification_queue,
+)
 
 router = DefaultRouter()
 router.register(r'passengers', PassengerViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
-]
\ No newline at end of file
+    path('document-uploads/<uuid:upload_id>/', document_upload, name='document-upload'),
+    path('document-uploads/<uuid:upload_id>/finish/', finish_document_upload, name='finish-document-upload'),
+    path('verification-queue/', verification_queue, name='verification-queue'),
+    path('verification-queue/claim/', claim_verifications, name='claim-verifications'),
+    path('verification-queue/release/', release_verifications, name='release-verifications'),
+    path('verification-queue/decide/', decide_verifications, name='decide-verifications'),
+]
@@ -0,0 +1,107 @@
+"""
+The document-verification work queue.
+
+Passengers whose concession needs an Aadhar check wait with
+``verification_status='Pending'``. ``queue_page`` lists them by id with
+keyset pagination (``?after=<last id>``) over the
+``(verification_status, id)`` index, so every page is one index range scan
+however deep the reviewer has paged.
+
+Reviewers ``claim`` a batch before opening the documents: the claim is a
+single conditional ``UPDATE`` that only takes rows nobody else holds, so
+two reviewers never get the same passenger. A claim lapses after
+``VERIFICATION_CLAIM_SECONDS``. ``decide`` approves or rejects many
+passengers with one ``UPDATE`` and records it in the change log.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from bussewa_api import protected_media
+from sync.tracking import record_bulk_changes
+from .models import Passenger
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DECISIONS = ('Verified', 'Rejected')
+FIELDS = [
+    'id', 'name', 'gender', 'age', 'age_criteria', 'category', 'mobile_no', 'aadhar_number', 'aadhar_received',
+    'verification_notes', 'aadhar_document', 'aadhar_preview', 'aadhar_thumbnail',
+    'verification_claimed_by_id', 'verification_claimed_by__username', 'verification_claimed_at',
+]
+
+
+def _claim_cutoff():
+    return timezone.now() - timedelta(seconds=getattr(settings, 'VERIFICATION_CLAIM_SECONDS', 900))
+
+
+def _available_to(user):
+    """Pending passengers that ``user`` holds or that nobody holds any more."""
+    return Q(verification_claimed_by__isnull=True) | Q(verification_claimed_by=user) | Q(verification_claimed_at__lt=_claim_cutoff())
+
+
+def _row(passenger):
+    document = passenger.pop('aadhar_document')
+    preview = passenger.pop('aadhar_preview')
+    thumbnail = passenger.pop('aadhar_thumbnail')
+    passenger['document_url'] = protected_media.signed_url(document) if document else None
+    # Images are compacted in place and have no separate preview
+    passenger['preview_url'] = protected_media.signed_url(preview or document) if preview or document else None
+    passenger['thumbnail_url'] = protected_media.signed_url(thumbnail) if thumbnail else None
+    passenger['claimed_by'] = passenger.pop('verification_claimed_by__username')
+    return passenger
+
+
+def queue_page(user, after=0, limit=DEFAULT_PAGE_SIZE, mine=False):
+    """One page of pending passengers after id ``after``; ``next`` is the cursor of the following page."""
+    pending = Passenger.objects.filter(verification_status='Pending', id__gt=after)
+    if mine:
+        pending = pending.filter(verification_claimed_by=user, verification_claimed_at__gte=_claim_cutoff())
+    rows = list(pending.order_by('id').values(*FIELDS)[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [_row(row) for row in rows],
+        'next': rows[-1]['id'] if more else None,
+    }
+
+
+def claim(user, limit=DEFAULT_PAGE_SIZE):
+    """Claim up to ``limit`` pending passengers nobody else holds, oldest first, and return them."""
+    candidates = list(
+        Passenger.objects.filter(verification_status='Pending')
+        .filter(Q(verification_claimed_by__isnull=True) | Q(verification_claimed_at__lt=_claim_cutoff()))
+        .order_by('id').values_list('id', flat=True)[:limit]
+    )
+    # Re-checked in the UPDATE itself: a row another reviewer took meanwhile is left alone
+    Passenger.objects.filter(pk__in=candidates, verification_status='Pending').filter(
+        Q(verification_claimed_by__isnull=True) | Q(verification_claimed_at__lt=_claim_cutoff())
+    ).update(verification_claimed_by=user, verification_claimed_at=timezone.now())
+    claimed = Passenger.objects.filter(pk__in=candidates, verification_claimed_by=user).order_by('id').values(*FIELDS)
+    return [_row(row) for row in claimed]
+
+
+def release(user, ids):
+    return Passenger.objects.filter(pk__in=ids, verification_claimed_by=user).update(
+        verification_claimed_by=None, verification_claimed_at=None,
+    )
+
+
+def decide(user, ids, decision, notes=''):
+    """Set ``decision`` on the pending passengers of ``ids`` that ``user`` may decide; returns their ids."""
+    if decision not in DECISIONS:
+        raise ValueError(f"decision must be one of {', '.join(DECISIONS)}")
+    with transaction.atomic():
+        decidable = Passenger.objects.filter(pk__in=ids, verification_status='Pending').filter(_available_to(user))
+        decided = list(decidable.select_for_update().values_list('id', flat=True))
+        updates = {'verification_status': decision, 'verification_claimed_by': None, 'verification_claimed_at': None,
+                   'updated_at': timezone.now()}
+        if notes:
+            updates['verification_notes'] = notes
+        Passenger.objects.filter(pk__in=decided).update(**updates)
+        record_bulk_changes(Passenger, decided, ['verification_status'] + (['verification_notes'] if notes else []))
+    return decided
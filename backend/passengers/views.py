@@ -1,7 +1,19 @@
-from rest_framework import viewsets
-from rest_framework.permissions import AllowAny
-from .models import Passenger
-from .serializers import PassengerSerializer
+import re
+
+from django.shortcuts import get_object_or_404
+from rest_framework import status, viewsets
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+
+from bussewa_api import protected_media
+from . import uploads, verification
+from .models import DocumentUpload, Passenger
+from .serializers import DOCUMENT_ROLES, PassengerSerializer
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+VARIANTS = {'original': 'aadhar_document', 'preview': 'aadhar_preview', 'thumbnail': 'aadhar_thumbnail'}
+
 
 class PassengerViewSet(viewsets.ModelViewSet):
     queryset = Passenger.objects.all()
@@ -14,4 +26,151 @@ class PassengerViewSet(viewsets.ModelViewSet):
         search = self.request.query_params.get('search', None)
         if search:
             queryset = queryset.filter(name__icontains=search)
-        return queryset
\ No newline at end of file
+        return queryset
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def document(self, request, pk=None):
+        """The Aadhar document (``?variant=preview`` or ``thumbnail`` for the small copies); staff only"""
+        if request.user.role not in DOCUMENT_ROLES:
+            return Response({'error': 'Only admins and volunteers can view documents'}, status=status.HTTP_403_FORBIDDEN)
+        field = VARIANTS.get(request.query_params.get('variant', 'original'))
+        if field is None:
+            return Response({'error': f"variant must be one of {', '.join(VARIANTS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        name = Passenger.objects.filter(pk=pk).values_list(field, flat=True).first()
+        if not name:
+            return Response({'error': 'No such document'}, status=status.HTTP_404_NOT_FOUND)
+        return protected_media.serve(request, name)
+
+    @action(detail=True, methods=['post'], url_path='document-upload')
+    def document_upload(self, request, pk=None):
+        """Start a resumable upload of the Aadhar document: ``{"filename", "size", "sha256"}``"""
+        passenger = self.get_object()
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({'error': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = uploads.start(
+                passenger, str(request.data.get('filename') or ''), size, str(request.data.get('sha256') or ''), request.user,
+            )
+        except uploads.UploadError as e:
+            return Response({'error': str(e)}, status=e.status)
+        return Response(_upload_data(upload), status=status.HTTP_201_CREATED)
+
+
+def _upload_data(upload):
+    return {
+        'id': str(upload.id),
+        'url': f'/api/document-uploads/{upload.id}/',
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': uploads.CHUNK_SIZE,
+    }
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([AllowAny])  # like PassengerViewSet; the upload id is unguessable
+def document_upload(request, upload_id):
+    """Resume point (GET), a chunk with ``Content-Range: bytes first-last/size`` (PUT), or abort (DELETE)"""
+    upload = get_object_or_404(DocumentUpload, pk=upload_id)
+    if request.method == 'GET':
+        return Response(_upload_data(upload))
+    if request.method == 'DELETE':
+        uploads.abort(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    match = CONTENT_RANGE.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+    if not match:
+        return Response({'error': 'Content-Range: bytes first-last/size is required'}, status=status.HTTP_400_BAD_REQUEST)
+    first, last, size = (int(group) for group in match.groups())
+    length = last - first + 1
+    if size != upload.size or length <= 0:
+        return Response({'error': 'Content-Range does not fit this upload'}, status=status.HTTP_400_BAD_REQUEST)
+    if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+        return Response({'error': 'Content-Length must match Content-Range'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # The body is read from the socket as it is written; never through request.data
+        uploads.write_chunk(upload, first, length, request.stream, request.META.get('HTTP_X_CHUNK_SHA256', ''))
+    except uploads.UploadError as e:
+        return Response({'error': str(e), 'offset': upload.received}, status=e.status)
+    return Response(_upload_data(upload))
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def finish_document_upload(request, upload_id):
+    """Verify the checksum (``{"sha256": ...}``) and attach the document to the passenger"""
+    upload = get_object_or_404(DocumentUpload.objects.select_related('passenger'), pk=upload_id)
+    try:
+        passenger = uploads.finish(upload, str(request.data.get('sha256') or ''))
+    except uploads.UploadError as e:
+        upload.refresh_from_db()
+        return Response({'error': str(e), 'offset': upload.received}, status=e.status)
+    return Response(PassengerSerializer(passenger, context={'request': request}).data)
+
+
+def _page_size(request):
+    return min(max(int(request.query_params.get('limit', verification.DEFAULT_PAGE_SIZE)), 1), verification.MAX_PAGE_SIZE)
+
+
+def _ids(request):
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        raise ValueError('ids must be a list of passenger ids')
+    return ids
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def verification_queue(request):
+    """Pending document verifications by id (``?after=<next>&limit=&mine=1``)"""
+    if request.user.role not in DOCUMENT_ROLES:
+        return Response({'error': 'Only admins and volunteers can verify documents'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        after = int(request.query_params.get('after', 0))
+        limit = _page_size(request)
+    except ValueError:
+        return Response({'error': 'after and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(verification.queue_page(request.user, after, limit, mine=request.query_params.get('mine') == '1'))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def claim_verifications(request):
+    """Claim the next batch of pending passengers (``{"limit": n}``) so no one else reviews them"""
+    if request.user.role not in DOCUMENT_ROLES:
+        return Response({'error': 'Only admins and volunteers can verify documents'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        limit = min(max(int(request.data.get('limit', verification.DEFAULT_PAGE_SIZE)), 1), verification.MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': verification.claim(request.user, limit)})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def release_verifications(request):
+    """Give claimed passengers back to the queue: ``{"ids": [...]}``"""
+    if request.user.role not in DOCUMENT_ROLES:
+        return Response({'error': 'Only admins and volunteers can verify documents'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        ids = _ids(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'released': verification.release(request.user, ids)})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def decide_verifications(request):
+    """Approve or reject many passengers at once: ``{"ids": [...], "decision": "Verified"|"Rejected", "notes": ""}``"""
+    if request.user.role not in DOCUMENT_ROLES:
+        return Response({'error': 'Only admins and volunteers can verify documents'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        ids = _ids(request)
+        decided = verification.decide(request.user, ids, request.data.get('decision'), str(request.data.get('notes') or ''))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    # Skipped: already decided, or claimed by another reviewer
+    return Response({'decided': decided, 'skipped': sorted(set(ids) - set(decided))})
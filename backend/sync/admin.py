@@ -0,0 +1,24 @@
+from django.contrib import admin
+from .models import ChangeLogEntry, SheetRow, SyncOperation
+
+@admin.register(SyncOperation)
+class SyncOperationAdmin(admin.ModelAdmin):
+    list_display = ['device_id', 'client_seq', 'user', 'op', 'object_id', 'status', 'received_at']
+    list_filter = ['op', 'status']
+    search_fields = ['device_id', 'user__username']
+    ordering = ['-received_at']
+
+@admin.register(ChangeLogEntry)
+class ChangeLogEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'model', 'object_id', 'operation', 'changed_at']
+    list_filter = ['model', 'operation']
+    ordering = ['-id']
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SheetRow)
+class SheetRowAdmin(admin.ModelAdmin):
+    list_display = ['sheet', 'row_number', 'key', 'pushed_at']
+    list_filter = ['sheet']
+    ordering = ['sheet', 'row_number']
@@ -0,0 +1,14 @@
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete
+
+
+class SyncConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'sync'
+
+    def ready(self):
+        from .tracking import TrackedModelMixin, record_deletion
+
+        for model in apps.get_models():
+            if issubclass(model, TrackedModelMixin):
+                post_delete.connect(record_deletion, sender=model, dispatch_uid=f'sync-delete-{model._meta.label_lower}')
@@ -0,0 +1,126 @@
+"""
+Reading and maintaining the change-log outbox.
+
+In-process consumers call ``read_changes`` directly; HTTP consumers use
+``/api/changes/``. ``compact`` and ``prune`` keep the table bounded and are
+run by ``manage.py compact_changelog``.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import ChangeLogCursor, ChangeLogEntry
+
+TRACKED_MODELS = [
+    'bookings.booking',
+    'bookings.payment',
+    'bookings.bus',
+    'bookings.onspotpassenger',
+    'passengers.passenger',
+]
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+COMPACT_BATCH_SIZE = 500
+
+
+class ChangesExpired(Exception):
+    """The requested position has been pruned; the consumer must re-read in full."""
+
+    def __init__(self, horizon):
+        super().__init__(f'Changes before {horizon} have been pruned')
+        self.horizon = horizon
+
+
+def head_seq():
+    """Sequence number of the newest change, or 0 if the log is empty."""
+    return ChangeLogEntry.objects.aggregate(head=Max('id'))['head'] or 0
+
+
+def retention_horizon():
+    return ChangeLogCursor.objects.filter(name=ChangeLogCursor.RETENTION).values_list('seq', flat=True).first() or 0
+
+
+def read_changes(since=0, models=None, limit=DEFAULT_PAGE_SIZE):
+    """Return up to ``limit`` entries after ``since`` and whether more follow."""
+    horizon = retention_horizon()
+    if since < horizon:
+        raise ChangesExpired(horizon)
+
+    queryset = ChangeLogEntry.objects.filter(id__gt=since)
+    if models:
+        queryset = queryset.filter(model__in=models)
+    entries = list(queryset.order_by('id')[:limit + 1])
+    return entries[:limit], len(entries) > limit
+
+
+def compact(older_than):
+    """Collapse entries older than ``older_than`` to one per row.
+
+    The surviving (newest) entry gets the union of the changed fields, and a
+    ``create`` followed by updates stays a ``create``. A consumer positioned
+    anywhere inside the compacted range still sees every row that changed
+    after its position, with at least the fields that changed.
+    Returns the number of entries removed.
+    """
+    cutoff = ChangeLogEntry.objects.filter(changed_at__lt=older_than).aggregate(seq=Max('id'))['seq']
+    if cutoff is None:
+        return 0
+
+    duplicated = list(
+        ChangeLogEntry.objects.filter(id__lte=cutoff)
+        .values('model', 'object_id')
+        .annotate(entries=Count('id'))
+        .filter(entries__gt=1)
+        .values_list('model', 'object_id')
+    )
+
+    removed = 0
+    for start in range(0, len(duplicated), COMPACT_BATCH_SIZE):
+        by_model = defaultdict(list)
+        for model, object_id in duplicated[start:start + COMPACT_BATCH_SIZE]:
+            by_model[model].append(object_id)
+
+        with transaction.atomic():
+            obsolete = []
+            for model, object_ids in by_model.items():
+                groups = defaultdict(list)
+                entries = (
+                    ChangeLogEntry.objects.filter(id__lte=cutoff, model=model, object_id__in=object_ids)
+                    .order_by('id')
+                    .values_list('id', 'object_id', 'operation', 'changed_fields')
+                )
+                for entry in entries:
+                    groups[entry[1]].append(entry)
+
+                for group in groups.values():
+                    keep_id, _, operation, _ = group[-1]
+                    fields = sorted({name for entry in group for name in entry[3]})
+                    if operation != 'delete' and any(entry[2] == 'create' for entry in group):
+                        operation = 'create'
+                    ChangeLogEntry.objects.filter(id=keep_id).update(operation=operation, changed_fields=fields)
+                    obsolete.extend(entry[0] for entry in group[:-1])
+
+            removed += ChangeLogEntry.objects.filter(id__in=obsolete).delete()[0]
+    return removed
+
+
+def prune(older_than):
+    """Delete entries older than ``older_than`` and advance the retention horizon."""
+    with transaction.atomic():
+        seq = ChangeLogEntry.objects.filter(changed_at__lt=older_than).aggregate(seq=Max('id'))['seq']
+        if seq is None:
+            return 0
+        deleted, _ = ChangeLogEntry.objects.filter(id__lte=seq).delete()
+        ChangeLogCursor.objects.update_or_create(name=ChangeLogCursor.RETENTION, defaults={'seq': seq})
+    return deleted
+
+
+def maintain(retain=timedelta(days=14), compact_after=timedelta(hours=6)):
+    now = timezone.now()
+    pruned = prune(now - retain)
+    compacted = compact(now - compact_after)
+    return pruned, compacted
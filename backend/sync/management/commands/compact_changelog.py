@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from sync.changelog import maintain
+
+
+class Command(BaseCommand):
+    help = 'Compact and prune the change log so it stays bounded (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retain-days', type=int, default=14, help='Delete entries older than this many days')
+        parser.add_argument('--compact-after-hours', type=int, default=6, help='Collapse entries older than this to one per row')
+
+    def handle(self, *args, **options):
+        pruned, compacted = maintain(
+            retain=timedelta(days=options['retain_days']),
+            compact_after=timedelta(hours=options['compact_after_hours']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} and compacted {compacted} change-log entries'))
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sync.sheets import SheetsSync, get_client
+
+
+class Command(BaseCommand):
+    help = 'Push changed bookings to the Google Sheet (runs until stopped unless --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Push the pending changes and exit')
+        parser.add_argument('--full', action='store_true', help='Re-read every booking (still sends only changed rows)')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between checks for changes')
+        parser.add_argument('--settle', type=float, default=2, help='Quiet seconds a burst of edits gets before it is pushed')
+        parser.add_argument('--max-delay', type=float, default=60, help='Longest a change waits while edits keep coming')
+        parser.add_argument('--batch-rows', type=int, default=500, help='Rows per batchUpdate call')
+
+    def handle(self, *args, **options):
+        if not settings.SHEETS_SPREADSHEET_ID:
+            raise CommandError('Set SHEETS_SPREADSHEET_ID')
+        worker = SheetsSync(get_client(), settings.SHEETS_SPREADSHEET_ID, batch_rows=options['batch_rows'])
+
+        if options['once'] or options['full']:
+            result = worker.run_once(full=options['full'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Pushed {result['rows']} rows in {result['calls']} calls{' (full re-read)' if result['full'] else ''}"
+            ))
+            if options['once']:
+                return
+
+        self.stdout.write(f"Watching for changes every {options['interval']}s")
+        try:
+            worker.run_forever(options['interval'], options['settle'], options['max_delay'])
+        except KeyboardInterrupt:
+            pass
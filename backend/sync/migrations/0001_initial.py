@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FieldStamp',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('field', models.CharField(max_length=50)),
+                ('stamped_at', models.DateTimeField()),
+                ('written_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'written_at'], name='sync_stamp_model_written_idx')],
+                'unique_together': {('model', 'object_id', 'field')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SyncOperation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64)),
+                ('client_seq', models.BigIntegerField()),
+                ('op', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('applied', 'Applied'), ('partial', 'Partially Applied'), ('rejected', 'Rejected')], max_length=10)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sync_operations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['device_id', 'client_seq'],
+                'unique_together': {('device_id', 'client_seq')},
+            },
+        ),
+    ]
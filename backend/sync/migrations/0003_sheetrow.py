@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0002_changelogcursor_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SheetRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sheet', models.CharField(max_length=100)),
+                ('key', models.BigIntegerField()),
+                ('row_number', models.IntegerField()),
+                ('digest', models.CharField(blank=True, max_length=40)),
+                ('pushed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('sheet', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db import models
+
+
+class FieldStamp(models.Model):
+    """Last accepted write to one field of one row.
+
+    ``stamped_at`` is the logical time of the write used for per-field
+    last-writer-wins (for an offline edit it is when the edit was made,
+    translated to the server clock). ``written_at`` is when the server
+    stored it and drives the "what changed since" pull. A deletion is
+    recorded with the special field name ``__deleted__``.
+    """
+    DELETED = '__deleted__'
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    field = models.CharField(max_length=50)
+    stamped_at = models.DateTimeField()
+    written_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['model', 'object_id', 'field']
+        indexes = [
+            models.Index(fields=['model', 'written_at'], name='sync_stamp_model_written_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id}.{self.field} @ {self.stamped_at}"
+
+
+class SyncOperation(models.Model):
+    """A queued client operation, recorded once so retries are idempotent."""
+    STATUS_CHOICES = [
+        ('applied', 'Applied'),
+        ('partial', 'Partially Applied'),
+        ('rejected', 'Rejected'),
+    ]
+
+    device_id = models.CharField(max_length=64)
+    client_seq = models.BigIntegerField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='sync_operations')
+    op = models.CharField(max_length=30)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    result = models.JSONField(default=dict, blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['device_id', 'client_seq']
+        ordering = ['device_id', 'client_seq']
+
+    def __str__(self):
+        return f"{self.device_id}:{self.client_seq} {self.op} ({self.status})"
+
+
+class ChangeLogEntry(models.Model):
+    """Append-only outbox of tracked model writes.
+
+    The primary key is the global, monotonic change sequence that consumers
+    page through with ``/api/changes/?since=<seq>``.
+    """
+    OPERATIONS = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    changed_fields = models.JSONField(default=list, blank=True)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['model', 'id'], name='sync_changelog_model_seq_idx'),
+            models.Index(fields=['changed_at'], name='sync_changelog_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.operation} {self.model}#{self.object_id}"
+
+
+class ChangeLogCursor(models.Model):
+    """A named position in the change log.
+
+    ``retention`` marks how far the log has been pruned; consumers asking
+    for changes from before it must do a full re-read. Background consumers
+    keep their own cursor here.
+    """
+    RETENTION = 'retention'
+
+    name = models.CharField(max_length=50, unique=True)
+    seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.seq}"
+
+
+class SheetRow(models.Model):
+    """What was last pushed to one row of a synced spreadsheet tab.
+
+    ``key`` is the source row's id and ``digest`` a hash of the values
+    written, so the Sheets worker only sends rows whose values changed.
+    An empty digest marks a row that was blanked after its source was
+    deleted; its row number is never reused.
+    """
+    sheet = models.CharField(max_length=100)
+    key = models.BigIntegerField()
+    row_number = models.IntegerField()
+    digest = models.CharField(max_length=40, blank=True)
+    pushed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['sheet', 'key']
+
+    def __str__(self):
+        return f"{self.sheet}!{self.row_number} <- #{self.key}"
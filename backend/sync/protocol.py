@@ -0,0 +1,378 @@
+"""
+Offline-first delta sync for volunteer devices.
+
+One round trip does both directions:
+
+* push - the device uploads operations it queued while offline. Each carries
+  a per-device ``client_seq`` so a retried batch is applied exactly once, and
+  ``made_at`` (device clock) which is shifted onto the server clock using the
+  batch's ``sent_at``. Field conflicts resolve last-writer-wins per field
+  against ``FieldStamp.stamped_at``.
+* pull - the device receives only the fields that changed since its
+  ``sync_token``, for the buses in its scope, plus deletions and rows that
+  left its scope.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bookings.models import Booking, Bus, OnSpotPassenger
+from .models import FieldStamp, SyncOperation
+
+TOKEN_SALT = 'sync.token'
+# Stamps written by transactions that commit slightly out of order are caught
+# by re-sending this window on the next pull; applying a change twice is harmless.
+SYNC_OVERLAP = timedelta(seconds=2)
+MAX_CHANGES = 1000
+MAX_ID = 2 ** 63 - 1  # BigAutoField
+
+BOOKING_FIELDS = [
+    'passenger', 'status', 'journey_type', 'pickup_point',
+    'onward_bus', 'return_bus', 'onward_seat_number', 'return_seat_number',
+    'onward_price', 'return_price', 'total_price', 'custom_amount', 'payment_status',
+    'is_volunteer', 'onward_attendance', 'return_attendance', 'attendance_notes', 'remarks',
+]
+BOOKING_WRITABLE = {'onward_attendance', 'return_attendance', 'attendance_notes', 'remarks'}
+BOOKING_SCOPE_FIELDS = {'onward_bus', 'return_bus'}
+
+ONSPOT_FIELDS = [
+    'name', 'age', 'gender', 'mobile_no', 'bus', 'journey_type',
+    'calculated_price', 'payment_status', 'attendance', 'notes',
+]
+ONSPOT_WRITABLE = {'name', 'age', 'gender', 'mobile_no', 'payment_status', 'attendance', 'notes'}
+ONSPOT_SCOPE_FIELDS = {'bus'}
+
+
+class SyncError(Exception):
+    """The request as a whole is malformed."""
+
+
+class OperationRejected(Exception):
+    """A single queued operation cannot be applied."""
+
+
+def encode_token(watermark, after_id=None):
+    """Token for the pull position: stamps after ``watermark``, or at it with an id above ``after_id``."""
+    micros = int(watermark.timestamp() * 1_000_000)
+    return signing.dumps(micros if after_id is None else [micros, after_id], salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token):
+    """``(watermark, after_id)`` of a token, or ``None`` for a first sync."""
+    if not token:
+        return None
+    try:
+        position = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise SyncError('Invalid sync_token')
+    micros, after_id = position if isinstance(position, list) else (position, None)
+    return datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc), after_id
+
+
+def parse_client_time(value):
+    """Accept epoch milliseconds or an ISO-8601 string."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value / 1000, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError(f'Timestamp out of range: {value}')
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        raise ValueError(f'Invalid timestamp: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def wire_value(instance, field_name):
+    field = instance._meta.get_field(field_name)
+    value = getattr(instance, field.attname)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def serialize_row(instance, fields):
+    return {'id': instance.pk, 'fields': {name: wire_value(instance, name) for name in fields}}
+
+
+# ---------------------------------------------------------------------------
+# Push
+# ---------------------------------------------------------------------------
+
+def _clean_fields(model, data, writable):
+    """Validate incoming values against the model fields they target."""
+    unknown = set(data) - writable
+    if unknown:
+        raise OperationRejected(f"Fields not writable: {', '.join(sorted(unknown))}")
+    cleaned = {}
+    for name, value in data.items():
+        field = model._meta.get_field(name)
+        try:
+            cleaned[name] = field.clean(value, None)
+        except ValidationError as e:
+            raise OperationRejected(f"{name}: {'; '.join(e.messages)}")
+    return cleaned
+
+
+def _update(model, writable, op, op_time, applied_fields):
+    instance = model.objects.select_for_update().filter(pk=op.get('id')).first()
+    if instance is None:
+        raise OperationRejected('Object no longer exists')
+
+    cleaned = _clean_fields(model, op.get('fields') or {}, writable)
+    stamps = dict(
+        FieldStamp.objects.filter(
+            model=model._meta.label_lower, object_id=instance.pk, field__in=list(cleaned)
+        ).values_list('field', 'stamped_at')
+    )
+
+    applied, conflicts = [], {}
+    for name, value in cleaned.items():
+        stamped_at = stamps.get(name)
+        if stamped_at is not None and stamped_at >= op_time:
+            # A newer write already landed on the server; it wins.
+            conflicts[name] = wire_value(instance, name)
+            continue
+        setattr(instance, name, value)
+        applied.append(name)
+
+    if applied:
+        instance._change_time = op_time
+        instance.save(update_fields=applied + ['updated_at'])
+        applied_fields.update((model._meta.label_lower, instance.pk, name) for name in applied)
+
+    return instance.pk, {'applied': applied, 'conflicts': conflicts}
+
+
+def _create_onspot(op, op_time, applied_fields):
+    data = dict(op.get('fields') or {})
+    bus_id = data.pop('bus', None)
+    journey_type = data.pop('journey_type', None)
+    if not Bus.objects.filter(pk=bus_id).exists():
+        raise OperationRejected('Unknown bus')
+    if journey_type not in dict(OnSpotPassenger.JOURNEY_TYPE_CHOICES):
+        raise OperationRejected('journey_type must be ONWARD or RETURN')
+
+    cleaned = _clean_fields(OnSpotPassenger, data, ONSPOT_WRITABLE)
+    instance = OnSpotPassenger(bus_id=bus_id, journey_type=journey_type, **cleaned)
+    instance._change_time = op_time
+    instance.save()
+    # Server-computed fields such as calculated_price still reach the device on the pull.
+    applied = ['bus', 'journey_type'] + sorted(cleaned)
+    applied_fields.update(('bookings.onspotpassenger', instance.pk, name) for name in applied)
+    return instance.pk, {'applied': applied, 'conflicts': {}, 'client_ref': op.get('client_ref')}
+
+
+def _delete_onspot(op, op_time, applied_fields):
+    instance = OnSpotPassenger.objects.select_for_update().filter(pk=op.get('id')).first()
+    if instance is None:
+        return op.get('id'), {'applied': [], 'conflicts': {}}
+    stamped_at = FieldStamp.objects.filter(
+        model='bookings.onspotpassenger', object_id=instance.pk, stamped_at__gte=op_time
+    ).exclude(field=FieldStamp.DELETED).values_list('stamped_at', flat=True).first()
+    if stamped_at is not None:
+        raise OperationRejected('Passenger was edited on the server after this delete was queued')
+    pk = instance.pk
+    instance.delete()
+    return pk, {'applied': [FieldStamp.DELETED], 'conflicts': {}}
+
+
+OPERATIONS = {
+    'booking.update': lambda op, t, a: _update(Booking, BOOKING_WRITABLE, op, t, a),
+    'onspot.create': _create_onspot,
+    'onspot.update': lambda op, t, a: _update(OnSpotPassenger, ONSPOT_WRITABLE, op, t, a),
+    'onspot.delete': _delete_onspot,
+}
+
+
+def _previous_result(device_id, client_seq):
+    previous = SyncOperation.objects.filter(device_id=device_id, client_seq=client_seq).first()
+    if previous is None:
+        return None
+    return {**previous.result, 'client_seq': client_seq, 'status': previous.status, 'id': previous.object_id, 'duplicate': True}
+
+
+def operation_time(op, clock_offset, now):
+    """When ``op`` was made, shifted onto the server clock and never later than ``now``."""
+    made_at = parse_client_time(op.get('made_at'))
+    if made_at is None:
+        return now
+    try:
+        return min(made_at + clock_offset, now)
+    except OverflowError:
+        raise ValueError(f"Timestamp out of range: {op.get('made_at')}")
+
+
+def validate_operations(operations, sent_at=None):
+    """Raise ``SyncError`` for a batch that is malformed as a whole, before anything is applied."""
+    if not isinstance(operations, list):
+        raise SyncError('operations must be a list')
+    now = timezone.now()
+    clock_offset = now - sent_at if sent_at else timedelta(0)
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise SyncError(f'operations[{index}] must be an object')
+        if op.get('fields') is not None and not isinstance(op['fields'], dict):
+            raise SyncError(f'operations[{index}]: fields must be an object')
+        object_id = op.get('id')
+        if object_id is None:
+            if op.get('op') in OPERATIONS and op.get('op') != 'onspot.create':
+                raise SyncError(f'operations[{index}]: id is required')
+        elif isinstance(object_id, bool) or not isinstance(object_id, int) or not 0 < object_id <= MAX_ID:
+            raise SyncError(f'operations[{index}]: id must be a positive integer')
+        try:
+            operation_time(op, clock_offset, now)
+        except ValueError as e:
+            raise SyncError(f'operations[{index}]: {e}')
+
+
+def apply_operations(user, device_id, operations, sent_at=None):
+    """Apply queued operations in order; returns one result per operation."""
+    now = timezone.now()
+    clock_offset = now - sent_at if sent_at else timedelta(0)
+    applied_fields = set()
+    results = []
+
+    for op in operations:
+        try:
+            client_seq = int(op['client_seq'])
+        except (KeyError, TypeError, ValueError):
+            results.append({'client_seq': op.get('client_seq'), 'status': 'rejected', 'error': 'client_seq is required'})
+            continue
+
+        previous = _previous_result(device_id, client_seq)
+        if previous:
+            results.append(previous)
+            continue
+
+        name = op.get('op')
+        handler = OPERATIONS.get(name)
+        object_id, status, result = None, 'rejected', {}
+        try:
+            op_time = operation_time(op, clock_offset, now)
+            if handler is None:
+                raise OperationRejected(f'Unknown op: {name}')
+            with transaction.atomic():
+                object_id, result = handler(op, op_time, applied_fields)
+                status = 'partial' if result['conflicts'] else 'applied'
+                SyncOperation.objects.create(
+                    device_id=device_id, client_seq=client_seq, user=user,
+                    op=name, object_id=object_id, status=status, result=result,
+                )
+        except IntegrityError:
+            # A concurrent retry of the same batch got there first.
+            results.append(_previous_result(device_id, client_seq) or {'client_seq': client_seq, 'status': 'rejected', 'error': 'Conflict'})
+            continue
+        except (OperationRejected, ValueError) as e:
+            result = {'error': str(e)}
+            SyncOperation.objects.get_or_create(
+                device_id=device_id, client_seq=client_seq,
+                defaults={'user': user, 'op': name or '', 'object_id': object_id, 'status': 'rejected', 'result': result},
+            )
+
+        results.append({'client_seq': client_seq, 'status': status, 'id': object_id if status != 'rejected' else op.get('id'), **result})
+
+    return results, applied_fields
+
+
+# ---------------------------------------------------------------------------
+# Pull
+# ---------------------------------------------------------------------------
+
+def _in_scope(model, bus_ids):
+    if model is Booking:
+        return models.Q(onward_bus_id__in=bus_ids) | models.Q(return_bus_id__in=bus_ids)
+    return models.Q(bus_id__in=bus_ids)
+
+
+def snapshot(bus_ids):
+    """Full state of the scope, for a device syncing for the first time."""
+    bookings = Booking.objects.filter(_in_scope(Booking, bus_ids)).select_related('passenger')
+    booking_rows = []
+    for booking in bookings:
+        row = serialize_row(booking, BOOKING_FIELDS)
+        row['fields'].update({
+            'passenger_name': booking.passenger.name,
+            'passenger_mobile_no': booking.passenger.mobile_no,
+            'passenger_age': booking.passenger.age,
+        })
+        booking_rows.append(row)
+    onspot = OnSpotPassenger.objects.filter(_in_scope(OnSpotPassenger, bus_ids))
+    return {
+        'bookings': booking_rows,
+        'onspot_passengers': [serialize_row(p, ONSPOT_FIELDS) for p in onspot],
+    }
+
+
+def _changed_since(model, fields, scope_fields, bus_ids, skip, stamps):
+    """Group stamps by row and ship only the changed, in-scope fields."""
+    label = model._meta.label_lower
+    changed, deleted = {}, []
+    for stamp in stamps:
+        if stamp.model != label:
+            continue
+        if stamp.field == FieldStamp.DELETED:
+            deleted.append(stamp.object_id)
+            changed.pop(stamp.object_id, None)
+        elif stamp.field in fields and (label, stamp.object_id, stamp.field) not in skip:
+            changed.setdefault(stamp.object_id, set()).add(stamp.field)
+
+    rows, removed = [], []
+    in_scope = set(model.objects.filter(_in_scope(model, bus_ids), pk__in=list(changed)).values_list('pk', flat=True))
+    for instance in model.objects.filter(pk__in=list(changed)):
+        names = changed[instance.pk]
+        if instance.pk in in_scope:
+            rows.append(serialize_row(instance, sorted(names)))
+        elif names & scope_fields:
+            removed.append(instance.pk)
+    return rows, removed, deleted
+
+
+def changes_since(since, bus_ids, skip=(), after_id=None):
+    """Field-level delta since the ``(since, after_id)`` position; returns (payload, next_watermark, next_after_id, has_more)."""
+    # Keyset on (written_at, id): one save stamps all its fields with the same
+    # written_at, so a page may end inside such a group and the next resumes
+    # after the last id it shipped.
+    after = models.Q(written_at__gt=since)
+    if after_id is not None:
+        after |= models.Q(written_at=since, id__gt=after_id)
+    stamps = list(
+        FieldStamp.objects.filter(after, model__in=['bookings.booking', 'bookings.onspotpassenger'])
+        .order_by('written_at', 'id')[:MAX_CHANGES + 1]
+    )
+    has_more = len(stamps) > MAX_CHANGES
+    stamps = stamps[:MAX_CHANGES]
+
+    bookings, removed_bookings, deleted_bookings = _changed_since(
+        Booking, set(BOOKING_FIELDS), BOOKING_SCOPE_FIELDS, bus_ids, skip, stamps)
+    onspot, removed_onspot, deleted_onspot = _changed_since(
+        OnSpotPassenger, set(ONSPOT_FIELDS), ONSPOT_SCOPE_FIELDS, bus_ids, skip, stamps)
+
+    payload = {
+        'bookings': bookings,
+        'onspot_passengers': onspot,
+        'removed': {
+            'bookings': removed_bookings + deleted_bookings,
+            'onspot_passengers': removed_onspot + deleted_onspot,
+        },
+    }
+    if has_more:
+        return payload, stamps[-1].written_at, stamps[-1].id, True
+    settled = timezone.now() - SYNC_OVERLAP
+    watermark = min(stamps[-1].written_at, settled) if stamps else settled
+    if watermark <= since:
+        return payload, since, after_id, False
+    return payload, watermark, None, False
+
+
+def default_scope(user):
+    return list(Bus.objects.filter(assigned_volunteer=user).values_list('pk', flat=True))
@@ -0,0 +1,331 @@
+"""
+Push bookings to a Google Sheet, sending only rows that changed.
+
+``SheetsSync.run_once()`` reads the change log from its own
+``ChangeLogCursor`` (``sheets:bookings``) and collects the affected bookings.
+Booking, payment, passenger and bus changes are mapped to the bookings they
+show up in. Every change since the last run is merged into one set of rows,
+so a burst of edits to the same booking sends that row once. Each row is
+hashed, and only rows whose hash differs from the one recorded in
+``SheetRow`` are written, in ``values:batchUpdate`` calls of up to
+``batch_rows`` rows. A full re-read replaces the incremental one on the
+first run, after the log was pruned past the cursor, or when a payment was
+deleted (its booking is no longer known). Even then only changed rows are
+sent.
+
+Retryable failures (quota, 5xx, network) are retried with exponential
+backoff and jitter. Rows are recorded as pushed batch by batch, so a
+failed run resumes where it stopped.
+
+The client is pluggable through ``SHEETS_CLIENT``: ``GoogleSheetsClient``
+talks to the real API (needs the optional ``google-auth`` and ``requests``
+packages). ``FakeSheetsClient`` keeps the sheet in memory for tests and
+dry runs.
+"""
+
+import hashlib
+import json
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Max, Min, Prefetch, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from bookings.models import Booking, Payment
+from .changelog import ChangesExpired, head_seq, read_changes
+from .models import ChangeLogCursor, ChangeLogEntry, SheetRow
+
+SHEET = 'Bookings'
+CURSOR = 'sheets:bookings'
+WATCHED_MODELS = ['bookings.booking', 'bookings.payment', 'bookings.bus', 'passengers.passenger']
+COLUMNS = [
+    'Booking ID', 'Name', 'Gender', 'Age Criteria', 'Category', 'Mobile No', 'Aadhar Received',
+    'Onwards Date', 'Return Date', 'Pickup Point', 'Onward Bus', 'Onward Seat', 'Return Bus', 'Return Seat',
+    'Amount', 'Amount Received', 'Balance', 'Payment Method', 'Collected By', 'Payment Status',
+    'Booking Status', 'Remarks',
+]
+READ_PAGE_SIZE = 5000
+ROWS_CHUNK = 2000
+
+
+class SheetsError(Exception):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _column_letter(number):
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+LAST_COLUMN = _column_letter(len(COLUMNS))
+
+
+class FakeSheetsClient:
+    """In-memory stand-in for the Sheets values API.
+
+    ``fail_with`` is a list of exceptions raised by the next calls, in order.
+    """
+
+    RANGE = re.compile(r"^'(?P<sheet>[^']+)'!A(?P<start>\d+):[A-Z]+(?P<end>\d+)$")
+
+    def __init__(self, fail_with=None):
+        self.sheets = defaultdict(dict)
+        self.calls = []
+        self.fail_with = list(fail_with or [])
+
+    def batch_update(self, spreadsheet_id, data):
+        self.calls.append(data)
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        for item in data:
+            match = self.RANGE.match(item['range'])
+            start = int(match['start'])
+            for offset, values in enumerate(item['values']):
+                self.sheets[match['sheet']][start + offset] = list(values)
+
+    def rows(self, sheet=SHEET):
+        grid = self.sheets[sheet]
+        return [grid.get(number, []) for number in range(1, max(grid, default=0) + 1)]
+
+
+class GoogleSheetsClient:
+    """The Sheets v4 values API with service-account credentials (``SHEETS_CREDENTIALS_FILE``)."""
+
+    API_URL = 'https://sheets.googleapis.com/v4/spreadsheets'
+    SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+    def __init__(self):
+        try:
+            import requests
+            from google.auth.transport.requests import AuthorizedSession
+            from google.oauth2 import service_account
+        except ImportError:
+            raise ImproperlyConfigured('GoogleSheetsClient needs the google-auth and requests packages')
+        credentials_file = getattr(settings, 'SHEETS_CREDENTIALS_FILE', None)
+        if not credentials_file:
+            raise ImproperlyConfigured('Set SHEETS_CREDENTIALS_FILE to a service-account key file')
+        credentials = service_account.Credentials.from_service_account_file(credentials_file, scopes=self.SCOPES)
+        self.session = AuthorizedSession(credentials)
+        self.network_errors = (requests.ConnectionError, requests.Timeout)
+
+    def batch_update(self, spreadsheet_id, data):
+        try:
+            response = self.session.post(
+                f'{self.API_URL}/{spreadsheet_id}/values:batchUpdate',
+                json={'valueInputOption': 'RAW', 'data': data},
+                timeout=60,
+            )
+        except self.network_errors as e:
+            raise SheetsError(str(e), retryable=True)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SheetsError(f'Sheets API {response.status_code}', retryable=True)
+        if response.status_code >= 400:
+            raise SheetsError(f'Sheets API {response.status_code}: {response.text[:500]}')
+        return response.json()
+
+
+def get_client():
+    return import_string(getattr(settings, 'SHEETS_CLIENT', 'sync.sheets.GoogleSheetsClient'))()
+
+
+def _amount(value):
+    return float(value) if value is not None else ''
+
+
+def booking_row(booking):
+    passenger = booking.passenger
+    payments = booking.payment_set.all()
+    amount = booking.get_final_amount()
+    received = sum(payment.amount for payment in payments)
+    last_payment = payments[len(payments) - 1] if payments else None
+    return [
+        booking.id,
+        passenger.name,
+        passenger.get_gender_display(),
+        passenger.age_criteria,
+        passenger.category,
+        passenger.mobile_no,
+        'Yes' if passenger.aadhar_received else 'No',
+        str(booking.onward_journey.journey_date) if booking.onward_journey else '',
+        str(booking.return_journey.journey_date) if booking.return_journey else '',
+        booking.pickup_point.name if booking.pickup_point else '',
+        booking.onward_bus.bus_number if booking.onward_bus else '',
+        booking.onward_seat_number,
+        booking.return_bus.bus_number if booking.return_bus else '',
+        booking.return_seat_number,
+        _amount(amount),
+        _amount(received),
+        _amount(received - amount),
+        last_payment.payment_method if last_payment else '',
+        last_payment.collected_by if last_payment else '',
+        booking.payment_status,
+        booking.status,
+        booking.remarks,
+    ]
+
+
+def booking_rows(booking_ids=None):
+    """``(booking_id, row)`` for the given bookings (all when ``None``), in id order."""
+    queryset = Booking.objects.select_related(
+        'passenger', 'pickup_point', 'onward_journey', 'return_journey', 'onward_bus', 'return_bus',
+    ).prefetch_related(Prefetch('payment_set', queryset=Payment.objects.order_by('id'))).order_by('id')
+    if booking_ids is None:
+        for booking in queryset.iterator(chunk_size=ROWS_CHUNK):
+            yield booking.id, booking_row(booking)
+        return
+    booking_ids = sorted(booking_ids)
+    for start in range(0, len(booking_ids), ROWS_CHUNK):
+        for booking in queryset.filter(id__in=booking_ids[start:start + ROWS_CHUNK]):
+            yield booking.id, booking_row(booking)
+
+
+def _digest(values):
+    return hashlib.sha1(json.dumps(values, default=str).encode()).hexdigest()
+
+
+def changed_bookings(since):
+    """Ids of bookings whose row may have changed after ``since``, or ``None`` if a full re-read is needed."""
+    ids = defaultdict(set)
+    more = True
+    while more:
+        try:
+            entries, more = read_changes(since, WATCHED_MODELS, READ_PAGE_SIZE)
+        except ChangesExpired:
+            return None
+        for entry in entries:
+            if entry.model == 'bookings.payment' and entry.operation == 'delete':
+                return None
+            ids[entry.model].add(entry.object_id)
+        if entries:
+            since = entries[-1].id
+
+    bookings = set(ids['bookings.booking'])
+    if ids['bookings.payment']:
+        bookings.update(Payment.objects.filter(id__in=ids['bookings.payment']).values_list('booking_id', flat=True))
+    if ids['passengers.passenger']:
+        bookings.update(Booking.objects.filter(passenger_id__in=ids['passengers.passenger']).values_list('id', flat=True))
+    if ids['bookings.bus']:
+        bus_ids = ids['bookings.bus']
+        bookings.update(
+            Booking.objects.filter(Q(onward_bus_id__in=bus_ids) | Q(return_bus_id__in=bus_ids)).values_list('id', flat=True)
+        )
+    return bookings
+
+
+class SheetsSync:
+    def __init__(self, client, spreadsheet_id, batch_rows=500, max_attempts=5, backoff=1.0, sleep=time.sleep):
+        self.client = client
+        self.spreadsheet_id = spreadsheet_id
+        self.batch_rows = batch_rows
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sleep = sleep
+
+    def send(self, data):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return self.client.batch_update(self.spreadsheet_id, data)
+            except SheetsError as e:
+                if not e.retryable or attempt == self.max_attempts:
+                    raise
+                self.sleep(min(self.backoff * 2 ** (attempt - 1), 60) * random.uniform(0.5, 1))
+
+    def pending(self):
+        """(oldest, newest) time of the watched changes not pushed yet, or ``None``."""
+        cursor = ChangeLogCursor.objects.filter(name=CURSOR).values_list('seq', flat=True).first()
+        if cursor is None:  # never pushed: everything is pending
+            return timezone.now() - timedelta(days=1), timezone.now() - timedelta(days=1)
+        times = ChangeLogEntry.objects.filter(id__gt=cursor, model__in=WATCHED_MODELS).aggregate(
+            oldest=Min('changed_at'), newest=Max('changed_at'),
+        )
+        return (times['oldest'], times['newest']) if times['oldest'] else None
+
+    def run_once(self, full=False):
+        """Push every changed row; returns counts of what was done."""
+        cursor, first_run = ChangeLogCursor.objects.get_or_create(name=CURSOR)
+        head = head_seq()  # read before the rows, so they are at least this fresh
+        keys = None if full or first_run else changed_bookings(cursor.seq)
+
+        pushed = SheetRow.objects.filter(sheet=SHEET)
+        if keys is not None:
+            pushed = pushed.filter(key__in=keys)
+        pushed = {row.key: row for row in pushed}
+        next_row = (SheetRow.objects.filter(sheet=SHEET).aggregate(last=Max('row_number'))['last'] or 1) + 1
+
+        changes = []  # (SheetRow, values)
+        if not SheetRow.objects.filter(sheet=SHEET).exists():
+            changes.append((SheetRow(sheet=SHEET, key=0, row_number=1), COLUMNS))
+        if keys is None or keys:
+            seen = set()
+            for key, values in booking_rows(keys):
+                seen.add(key)
+                row = pushed.get(key)
+                digest = _digest(values)
+                if row is None:
+                    row = SheetRow(sheet=SHEET, key=key, row_number=next_row)
+                    next_row += 1
+                elif row.digest == digest:
+                    continue
+                row.digest = digest
+                changes.append((row, values))
+            for key, row in pushed.items():
+                if key not in seen and key != 0 and row.digest:
+                    row.digest = ''
+                    changes.append((row, [''] * len(COLUMNS)))
+
+        changes.sort(key=lambda change: change[0].row_number)
+        calls = 0
+        for start in range(0, len(changes), self.batch_rows):
+            batch = changes[start:start + self.batch_rows]
+            self.send(self._ranges(batch))
+            calls += 1
+            with transaction.atomic():
+                SheetRow.objects.bulk_create([row for row, _ in batch if row.pk is None])
+                SheetRow.objects.bulk_update([row for row, _ in batch if row.pk is not None], ['digest'])
+
+        ChangeLogCursor.objects.filter(pk=cursor.pk).update(seq=head)
+        return {'rows': len(changes), 'calls': calls, 'full': keys is None}
+
+    def _ranges(self, batch):
+        """``batchUpdate`` data with runs of consecutive rows merged into one range."""
+        data = []
+        for row, values in batch:
+            if data and data[-1]['end'] == row.row_number - 1:
+                data[-1]['end'] = row.row_number
+                data[-1]['values'].append(values)
+            else:
+                data.append({'start': row.row_number, 'end': row.row_number, 'values': [values]})
+        return [
+            {'range': f"'{SHEET}'!A{item['start']}:{LAST_COLUMN}{item['end']}", 'values': item['values']}
+            for item in data
+        ]
+
+    def run_forever(self, interval=10, settle=2, max_delay=60):
+        """Push changes every ``interval`` seconds.
+
+        A burst of edits is given ``settle`` quiet seconds to finish before it
+        is pushed, but no change waits longer than ``max_delay``.
+        """
+        while True:
+            pending = self.pending()
+            if pending:
+                oldest, newest = pending
+                now = timezone.now()
+                if (now - newest).total_seconds() >= settle or (now - oldest).total_seconds() >= max_delay:
+                    self.run_once()
+                else:
+                    self.sleep(settle)
+                continue
+            self.sleep(interval)
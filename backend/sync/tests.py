@@ -0,0 +1,217 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from bookings.models import Booking, Bus, Journey, OnSpotPassenger, Payment
+from bussewa_api.testing import seed_event
+from passengers.models import Passenger
+from . import changelog, protocol
+from .models import ChangeLogEntry, FieldStamp, SheetRow, SyncOperation
+from .sheets import COLUMNS, FakeSheetsClient, SheetsError, SheetsSync
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='vol', password='pass1234', role='volunteer')
+        journey = Journey.objects.create(journey_type='ONWARD', journey_date='2026-01-10')
+        self.bus = Bus.objects.create(bus_number='1', journey=journey, assigned_volunteer=self.user)
+        passenger = Passenger.objects.create(name='Asha', gender='F', age=30, category='Satsang')
+        self.booking = Booking.objects.create(passenger=passenger, onward_journey=journey, onward_bus=self.bus, onward_seat_number='1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, **payload):
+        payload.setdefault('device_id', 'tablet-1')
+        return self.client.post('/api/sync/', payload, format='json')
+
+    def test_first_sync_returns_snapshot_of_assigned_buses(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['full'])
+        self.assertEqual([b['id'] for b in response.data['changes']['bookings']], [self.booking.id])
+
+    def test_retried_operation_is_applied_once(self):
+        op = {'client_seq': 1, 'op': 'onspot.create', 'fields': {'bus': self.bus.id, 'journey_type': 'ONWARD', 'name': 'Ravi', 'age': 40, 'gender': 'M'}}
+        first = self.post(operations=[op]).data['results'][0]
+        second = self.post(operations=[op]).data['results'][0]
+        self.assertEqual(first['status'], 'applied')
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(second['id'], first['id'])
+        self.assertEqual(OnSpotPassenger.objects.count(), 1)
+        self.assertEqual(SyncOperation.objects.count(), 1)
+
+    def test_older_offline_edit_loses_per_field(self):
+        made_at = timezone.now() - timedelta(minutes=5)
+        FieldStamp.objects.update(stamped_at=made_at - timedelta(hours=1))
+        self.booking.refresh_from_db()
+        self.booking.onward_attendance = False
+        self.booking.save()  # server-side edit after the device went offline
+
+        result = self.post(sent_at=timezone.now().isoformat(), operations=[{
+            'client_seq': 1, 'op': 'booking.update', 'id': self.booking.id, 'made_at': made_at.isoformat(),
+            'fields': {'onward_attendance': True, 'attendance_notes': 'Boarded at stop 2'},
+        }]).data['results'][0]
+
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual(result['applied'], ['attendance_notes'])
+        self.assertEqual(result['conflicts'], {'onward_attendance': False})
+        self.booking.refresh_from_db()
+        self.assertIs(self.booking.onward_attendance, False)
+        self.assertEqual(self.booking.attendance_notes, 'Boarded at stop 2')
+
+    def test_delta_pull_ships_only_changed_fields(self):
+        past = timezone.now() - timedelta(minutes=1)
+        FieldStamp.objects.update(written_at=past)
+        token = self.post().data['sync_token']
+
+        booking = Booking.objects.get(pk=self.booking.pk)
+        booking.payment_status = 'Paid'
+        booking.save()
+        spot = OnSpotPassenger.objects.create(name='Ravi', age=40, gender='M', bus=self.bus, journey_type='ONWARD')
+        spot_id = spot.id
+        spot.delete()
+
+        changes = self.post(sync_token=token).data['changes']
+        self.assertEqual(changes['bookings'], [{'id': self.booking.id, 'fields': {'payment_status': 'Paid'}}])
+        self.assertEqual(changes['removed']['onspot_passengers'], [spot_id])
+
+    def test_pages_resume_inside_a_group_of_stamps_from_one_save(self):
+        past = timezone.now() - timedelta(minutes=1)
+        FieldStamp.objects.update(written_at=past)
+        stamped = set(FieldStamp.objects.filter(model='bookings.booking').values_list('field', flat=True)) & set(protocol.BOOKING_FIELDS)
+        self.assertGreater(len(stamped), 3)
+
+        shipped, since, after_id, has_more = set(), past - timedelta(seconds=1), None, True
+        with mock.patch.object(protocol, 'MAX_CHANGES', 3):
+            while has_more:
+                payload, since, after_id, has_more = protocol.changes_since(since, [self.bus.id], after_id=after_id)
+                for row in payload['bookings']:
+                    shipped |= set(row['fields'])
+        self.assertEqual(shipped, stamped)
+
+    def test_malformed_operations_are_refused(self):
+        self.assertEqual(self.post(operations=['booking.update']).status_code, 400)
+        response = self.post(operations=[{'client_seq': 1, 'op': 'booking.update', 'id': self.booking.id, 'made_at': 10 ** 20}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('operations[0]', response.data['error'])
+        op = {'client_seq': 1, 'op': 'booking.update', 'id': self.booking.id, 'fields': {'remarks': 'x'}}
+        for malformed in ({'fields': ['remarks']}, {'id': {'pk': 1}}, {'id': 'abc'}, {'id': None}):
+            response = self.post(operations=[{**op, **malformed}])
+            self.assertEqual(response.status_code, 400, malformed)
+        self.assertEqual(self.post(bus_ids='12').status_code, 400)
+        self.assertFalse(SyncOperation.objects.exists())
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='admin1', password='pass1234', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.passenger = Passenger.objects.create(name='Asha', gender='F', age=30, category='Satsang')
+
+    def test_writes_append_ordered_entries_with_changed_fields(self):
+        self.passenger.mobile_no = '9999999999'
+        self.passenger.save()
+        self.passenger.save()  # nothing changed, nothing logged
+        self.passenger.delete()
+
+        entries = list(ChangeLogEntry.objects.filter(model='passengers.passenger').values_list('operation', 'changed_fields'))
+        self.assertEqual([op for op, _ in entries], ['create', 'update', 'delete'])
+        self.assertEqual(entries[1][1], ['mobile_no'])
+
+    def test_changes_endpoint_pages_and_filters(self):
+        journey = Journey.objects.create(journey_type='ONWARD', journey_date='2026-01-10')
+        Bus.objects.create(bus_number='1', journey=journey)
+        Bus.objects.create(bus_number='2', journey=journey)
+
+        first = self.client.get('/api/changes/', {'models': 'bookings.bus', 'limit': 1}).data
+        self.assertTrue(first['has_more'])
+        second = self.client.get('/api/changes/', {'models': 'bookings.bus', 'since': first['next_since']}).data
+        self.assertFalse(second['has_more'])
+        self.assertEqual([r['model'] for r in first['results'] + second['results']], ['bookings.bus', 'bookings.bus'])
+
+    def test_compaction_and_retention(self):
+        for mobile in ['1', '2', '3']:
+            self.passenger.mobile_no = mobile
+            self.passenger.save()
+        removed = changelog.compact(timezone.now() + timedelta(seconds=1))
+        entry = ChangeLogEntry.objects.get(model='passengers.passenger')
+        self.assertEqual(removed, 3)
+        self.assertEqual(entry.operation, 'create')
+
+        changelog.prune(timezone.now() + timedelta(seconds=1))
+        response = self.client.get('/api/changes/', {'since': 0})
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.data['reset'])
+
+
+class SheetsSyncTests(TestCase):
+    def setUp(self):
+        self.event = seed_event(buses=2, bookings_per_bus=5)
+        self.client_fake = FakeSheetsClient()
+        self.sleeps = []
+        self.worker = SheetsSync(self.client_fake, 'sheet-id', batch_rows=4, sleep=self.sleeps.append)
+
+    def sheet_row(self, booking):
+        return self.client_fake.rows()[SheetRow.objects.get(key=booking.id).row_number - 1]
+
+    def test_first_run_pushes_header_and_every_booking_in_batches(self):
+        result = self.worker.run_once()
+        self.assertTrue(result['full'])
+        rows = self.client_fake.rows()
+        self.assertEqual(rows[0], COLUMNS)
+        self.assertEqual([row[0] for row in rows[1:]], sorted(b.id for b in self.event['bookings']))
+        self.assertEqual(len(self.client_fake.calls), 3)  # 11 rows, 4 per call
+        self.assertEqual(len(self.client_fake.calls[0]), 1)  # consecutive rows share one range
+
+    def test_only_changed_rows_are_sent_and_bursts_coalesce(self):
+        self.worker.run_once()
+        self.client_fake.calls.clear()
+        self.assertEqual(self.worker.run_once()['rows'], 0)
+        self.assertEqual(self.client_fake.calls, [])
+
+        booking = Booking.objects.get(pk=self.event['bookings'][0].pk)
+        for remarks in ['first', 'second', 'third']:
+            booking.remarks = remarks
+            booking.save()
+        Payment.objects.create(booking=booking, amount=100, payment_method='GPay', collected_by='desk')
+        booking.passenger.name = 'Renamed'
+        booking.passenger.save()
+
+        result = self.worker.run_once()
+        self.assertEqual((result['rows'], result['calls'], result['full']), (1, 1, False))
+        row = self.sheet_row(booking)
+        self.assertEqual(row[1], 'Renamed')
+        self.assertEqual(row[COLUMNS.index('Remarks')], 'third')
+        self.assertEqual(row[COLUMNS.index('Payment Method')], 'GPay')
+
+    def test_deleted_booking_is_blanked_and_new_booking_appended(self):
+        self.worker.run_once()
+        removed = Booking.objects.get(pk=self.event['bookings'][1].pk)
+        row_number = SheetRow.objects.get(key=removed.id).row_number
+        removed.delete()
+        added = Booking.objects.create(passenger=self.event['passengers'][1], onward_journey=self.event['journey'])
+
+        self.worker.run_once()
+        rows = self.client_fake.rows()
+        self.assertEqual(rows[row_number - 1], [''] * len(COLUMNS))
+        self.assertEqual(rows[-1][0], added.id)
+
+    def test_retryable_errors_back_off_and_fatal_errors_keep_the_cursor(self):
+        self.client_fake.fail_with = [SheetsError('quota', retryable=True), SheetsError('busy', retryable=True)]
+        self.worker.run_once()
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(0.5 <= self.sleeps[0] <= 1 <= self.sleeps[1] <= 2)  # doubling, with jitter
+
+        booking = Booking.objects.get(pk=self.event['bookings'][0].pk)
+        booking.remarks = 'changed'
+        booking.save()
+        self.client_fake.fail_with = [SheetsError('bad request')]
+        with self.assertRaises(SheetsError):
+            self.worker.run_once()
+        self.worker.run_once()
+        self.assertEqual(self.sheet_row(booking)[COLUMNS.index('Remarks')], 'changed')
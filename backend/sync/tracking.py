@@ -0,0 +1,155 @@
+"""
+Field-level change tracking for models that other parts of the system
+consume incrementally.
+
+Models opt in by inheriting ``TrackedModelMixin`` before ``models.Model``.
+Every save records which fields actually changed - per-field stamps in
+``FieldStamp`` (for offline sync) and one row in the ``ChangeLogEntry``
+outbox - inside the same transaction as the write. Deletions (including
+cascades) are recorded by a ``post_delete`` receiver connected in
+``SyncConfig.ready``; Django sends it inside the deletion's transaction.
+
+After recording, the ``change_recorded`` signal is sent (still inside the
+transaction) with ``instance``, ``operation``, ``fields`` and ``previous``
+- the attname -> value mapping the row was loaded with - so receivers such
+as cache invalidation can see both the old and the new state.
+
+Queryset ``update()``/``bulk_create()`` bypass ``save()`` and are not
+tracked; a bulk update that consumers must see calls
+``record_bulk_changes()`` in its transaction.
+"""
+
+from django.db import connections, router, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+change_recorded = Signal()
+
+UNTRACKED_FIELDS = ('created_at', 'updated_at')
+
+# Arbitrary key for the Postgres advisory lock that serialises change-log
+# inserts, so sequence numbers become visible to readers in commit order.
+CHANGELOG_LOCK_KEY = 0x6275_7373
+
+
+def _tracked_fields(model):
+    return [f for f in model._meta.concrete_fields if not f.primary_key and f.name not in UNTRACKED_FIELDS]
+
+
+class TrackedModelMixin:
+    """Remember the values a row was loaded with so saves know what changed."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def changed_fields(self, update_fields=None):
+        """Names of tracked fields that differ from the loaded row."""
+        fields = _tracked_fields(type(self))
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            fields = [f for f in fields if f.name in update_fields or f.attname in update_fields]
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return [f.name for f in fields]
+        return [
+            f.name for f in fields
+            if f.attname not in loaded or loaded[f.attname] != getattr(self, f.attname)
+        ]
+
+    def save(self, *args, **kwargs):
+        operation = 'create' if self._state.adding else 'update'
+        changed = self.changed_fields(kwargs.get('update_fields'))
+        previous = getattr(self, '_loaded_values', None) or {}
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if changed:
+                stamp_fields(self, changed, stamped_at=getattr(self, '_change_time', None))
+                log_change(self, operation, changed)
+                change_recorded.send(type(self), instance=self, operation=operation, fields=changed, previous=previous)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in type(self)._meta.concrete_fields}
+        self._change_time = None
+
+
+def stamp_fields(instance, fields, stamped_at=None):
+    """Upsert the per-field stamps for a write to ``instance``."""
+    from .models import FieldStamp
+
+    now = timezone.now()
+    stamped_at = min(stamped_at or now, now)
+    FieldStamp.objects.bulk_create(
+        [
+            FieldStamp(
+                model=instance._meta.label_lower,
+                object_id=instance.pk,
+                field=field,
+                stamped_at=stamped_at,
+                written_at=now,
+            )
+            for field in fields
+        ],
+        update_conflicts=True,
+        unique_fields=['model', 'object_id', 'field'],
+        update_fields=['stamped_at', 'written_at'],
+    )
+
+
+def _lock_changelog(model):
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHANGELOG_LOCK_KEY])
+
+
+def log_change(instance, operation, fields):
+    """Append one entry to the change-log outbox."""
+    from .models import ChangeLogEntry
+
+    _lock_changelog(ChangeLogEntry)
+    ChangeLogEntry.objects.create(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        operation=operation,
+        changed_fields=list(fields),
+    )
+
+
+def record_bulk_changes(model, object_ids, fields, operation='update'):
+    """Stamp and log a queryset ``update()`` (or ``bulk_create()``) of ``fields`` on ``object_ids``.
+
+    Call it inside the update's transaction. ``change_recorded`` is not
+    sent, so receivers that watch these fields must not rely on it.
+    """
+    from .models import ChangeLogEntry, FieldStamp
+
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    label = model._meta.label_lower
+    now = timezone.now()
+    FieldStamp.objects.bulk_create(
+        [
+            FieldStamp(model=label, object_id=object_id, field=field, stamped_at=now, written_at=now)
+            for object_id in object_ids for field in fields
+        ],
+        update_conflicts=True,
+        unique_fields=['model', 'object_id', 'field'],
+        update_fields=['stamped_at', 'written_at'],
+    )
+    _lock_changelog(ChangeLogEntry)
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(model=label, object_id=object_id, operation=operation, changed_fields=list(fields))
+        for object_id in object_ids
+    ])
+
+
+def record_deletion(sender, instance, **kwargs):
+    """``post_delete`` receiver; runs inside the deletion's transaction."""
+    from .models import FieldStamp
+
+    stamp_fields(instance, [FieldStamp.DELETED])
+    log_change(instance, 'delete', [])
+    previous = {f.attname: getattr(instance, f.attname) for f in sender._meta.concrete_fields}
+    change_recorded.send(sender, instance=instance, operation='delete', fields=[], previous=previous)
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('sync/', views.sync, name='sync'),
+    path('changes/', views.changes, name='changes'),
+]
@@ -0,0 +1,108 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .changelog import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, TRACKED_MODELS, ChangesExpired, head_seq, read_changes
+from .protocol import (
+    SYNC_OVERLAP, SyncError, apply_operations, changes_since, decode_token,
+    default_scope, encode_token, parse_client_time, snapshot, validate_operations,
+)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    """Upload queued offline operations and pull changes since the last sync token.
+
+    Request::
+
+        {"device_id": "...", "sync_token": "..." | null, "sent_at": <ms or ISO>,
+         "bus_ids": [..] (optional, defaults to the user's assigned buses),
+         "operations": [{"client_seq": 1, "op": "booking.update", "id": 5,
+                         "made_at": <ms or ISO>, "fields": {...}}, ...]}
+    """
+    data = request.data
+    device_id = str(data.get('device_id') or '').strip()
+    operations = data.get('operations') or []
+    if not device_id:
+        return Response({'error': 'device_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(operations, list):
+        return Response({'error': 'operations must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+    if operations and request.user.role == 'viewer':
+        return Response({'error': 'Viewers cannot upload changes'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        position = decode_token(data.get('sync_token'))
+        sent_at = parse_client_time(data.get('sent_at'))
+        validate_operations(operations, sent_at)
+        bus_ids = data.get('bus_ids') or default_scope(request.user)
+        if not isinstance(bus_ids, list):
+            raise SyncError('bus_ids must be a list')
+        bus_ids = [int(b) for b in bus_ids]
+    except (SyncError, ValueError, TypeError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    started = timezone.now()
+    results, applied_fields = apply_operations(request.user, device_id, operations, sent_at)
+
+    if position is None:
+        changes, watermark, after_id, has_more = snapshot(bus_ids), started - SYNC_OVERLAP, None, False
+        changes['removed'] = {'bookings': [], 'onspot_passengers': []}
+    else:
+        since, after_id = position
+        changes, watermark, after_id, has_more = changes_since(since, bus_ids, skip=applied_fields, after_id=after_id)
+
+    return Response({
+        'results': results,
+        'changes': changes,
+        'full': position is None,
+        'has_more': has_more,
+        'sync_token': encode_token(watermark, after_id),
+        'server_time': timezone.now().isoformat(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def changes(request):
+    """Page through the change log.
+
+    ``?since=<seq>`` (default 0), ``?models=bookings.booking,bookings.payment``
+    and ``?limit=``. Keep calling with ``next_since`` while ``has_more``. A 410
+    means the position was pruned: re-read in full, then resume from ``head``.
+    """
+    try:
+        since = int(request.query_params.get('since', 0))
+        limit = min(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'since and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    models = [m.strip().lower() for m in request.query_params.get('models', '').split(',') if m.strip()]
+    unknown = set(models) - set(TRACKED_MODELS)
+    if unknown:
+        return Response({'error': f"Untracked models: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    head = head_seq()
+    try:
+        entries, has_more = read_changes(since, models, max(limit, 1))
+    except ChangesExpired as e:
+        return Response({'error': str(e), 'reset': True, 'head': head}, status=status.HTTP_410_GONE)
+
+    return Response({
+        'results': [
+            {
+                'seq': entry.id,
+                'model': entry.model,
+                'object_id': entry.object_id,
+                'operation': entry.operation,
+                'changed_fields': entry.changed_fields,
+                'changed_at': entry.changed_at,
+            }
+            for entry in entries
+        ],
+        'next_since': entries[-1].id if entries else max(since, head),
+        'has_more': has_more,
+        'head': head,
+    })
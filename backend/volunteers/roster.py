@@ -0,0 +1,84 @@
+"""
+Volunteer roster with workload figures.
+
+Volunteers are ``authentication.User`` rows with ``role='volunteer'``; their
+work is the buses and bookings assigned to them. A page of the roster takes
+three queries whatever its size: the total, the volunteers with their
+booking counts annotated, and the buses of that page.
+
+Pages are cached in the default cache under the change-log head (every
+booking or bus write appends to it) and the user directory version (every
+user or profile write bumps it), so a cached page is never older than the
+last committed write that could change it.
+"""
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from authentication import directory
+from authentication.models import User
+from bookings.models import Bus
+from sync.changelog import head_seq
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+ACTIVE = Q(assigned_bookings__status='Active')
+UNPAID = ACTIVE & ~Q(assigned_bookings__payment_status='Paid')
+ATTENDANCE_PENDING = ACTIVE & (
+    Q(assigned_bookings__onward_bus__isnull=False, assigned_bookings__onward_attendance__isnull=True)
+    | Q(assigned_bookings__return_bus__isnull=False, assigned_bookings__return_attendance__isnull=True)
+)
+
+
+def build_roster(offset=0, limit=DEFAULT_PAGE_SIZE):
+    volunteers = User.objects.filter(role='volunteer', is_active=True)
+    count = volunteers.count()
+    page = list(
+        volunteers.select_related('profile')
+        .annotate(
+            active_bookings=Count('assigned_bookings', filter=ACTIVE),
+            unpaid_bookings=Count('assigned_bookings', filter=UNPAID),
+            attendance_pending=Count('assigned_bookings', filter=ATTENDANCE_PENDING),
+        )
+        .order_by('username')[offset:offset + limit]
+    )
+
+    buses = {volunteer.id: [] for volunteer in page}
+    for bus in Bus.objects.filter(assigned_volunteer__in=buses).values(
+        'id', 'bus_number', 'route_name', 'assigned_volunteer_id', 'journey__journey_type', 'journey__journey_date',
+    ).order_by('journey__journey_date', 'bus_number'):
+        buses[bus['assigned_volunteer_id']].append({
+            'id': bus['id'],
+            'bus_number': bus['bus_number'],
+            'route_name': bus['route_name'],
+            'journey_type': bus['journey__journey_type'],
+            'journey_date': bus['journey__journey_date'],
+        })
+
+    results = []
+    for volunteer in page:
+        try:
+            full_name = volunteer.profile.full_name
+        except User.profile.RelatedObjectDoesNotExist:
+            full_name = volunteer.get_full_name() or volunteer.username
+        results.append({
+            'id': volunteer.id,
+            'username': volunteer.username,
+            'full_name': full_name,
+            'phone': volunteer.phone,
+            'buses': buses[volunteer.id],
+            'active_bookings': volunteer.active_bookings,
+            'unpaid_bookings': volunteer.unpaid_bookings,
+            'attendance_pending': volunteer.attendance_pending,
+        })
+    return {'count': count, 'offset': offset, 'limit': limit, 'results': results}
+
+
+def get_roster(offset=0, limit=DEFAULT_PAGE_SIZE):
+    key = f'volunteer-roster:{head_seq()}:{directory.version()}:{offset}:{limit}'
+    roster = cache.get(key)
+    if roster is None:
+        roster = build_roster(offset, limit)
+        cache.set(key, roster)
+    return roster
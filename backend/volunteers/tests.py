@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import User, UserProfile
+from bookings.models import Booking
+from bussewa_api.testing import EndpointBudgetTestCase, seed_event
+
+
+class EndpointBudgetTests(EndpointBudgetTestCase):
+    def test_roster(self):
+        self.assertWithinBudget('/api/volunteers/')
+
+
+class VolunteerRosterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = seed_event(buses=2, bookings_per_bus=4)
+        self.admin = User.objects.create_user('admin', role='admin')
+        self.client.force_login(self.admin)
+
+    def get_roster(self, **params):
+        response = self.client.get('/api/volunteers/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_workload_counts(self):
+        volunteer = self.event['volunteers'][0]
+        bookings = Booking.objects.filter(assigned_volunteer=volunteer)
+        active = bookings.filter(status='Active')
+        entry = next(v for v in self.get_roster()['results'] if v['id'] == volunteer.id)
+
+        self.assertEqual(entry['full_name'], volunteer.username)
+        self.assertEqual(len(entry['buses']), 2)  # onward and return
+        self.assertEqual(entry['active_bookings'], active.count())
+        self.assertEqual(entry['unpaid_bookings'], active.exclude(payment_status='Paid').count())
+        pending = [
+            b for b in active
+            if (b.onward_bus_id and b.onward_attendance is None) or (b.return_bus_id and b.return_attendance is None)
+        ]
+        self.assertEqual(entry['attendance_pending'], len(pending))
+
+    def test_only_active_volunteers_and_pagination(self):
+        User.objects.create_user('inactive-volunteer', role='volunteer', is_active=False)
+        roster = self.get_roster(limit=1)
+        self.assertEqual(roster['count'], 2)
+        self.assertEqual(len(roster['results']), 1)
+        second = self.get_roster(limit=1, offset=1)['results']
+        self.assertNotEqual(roster['results'][0]['id'], second[0]['id'])
+        self.assertEqual(self.client.get('/api/volunteers/', {'limit': 'x'}).status_code, 400)
+
+    def test_cached_until_bookings_or_users_change(self):
+        volunteer = self.event['volunteers'][0]
+        before = next(v for v in self.get_roster()['results'] if v['id'] == volunteer.id)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_roster()
+        self.assertFalse([q for q in queries.captured_queries if 'bookings_booking' in q['sql']])
+
+        booking = Booking.objects.filter(assigned_volunteer=volunteer, status='Active').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'Cancelled'
+            booking.save()
+        after = next(v for v in self.get_roster()['results'] if v['id'] == volunteer.id)
+        self.assertEqual(after['active_bookings'], before['active_bookings'] - 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = UserProfile.objects.get(user=volunteer)
+            profile.full_name = 'Renamed'
+            profile.save()
+        after = next(v for v in self.get_roster()['results'] if v['id'] == volunteer.id)
+        self.assertEqual(after['full_name'], 'Renamed')
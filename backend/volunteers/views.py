@@ -1,15 +1,19 @@
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .models import Volunteer
+from .roster import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_roster
 
 @api_view(['GET'])
-@permission_classes([AllowAny])
+@permission_classes([IsAuthenticated])
 def list_volunteers(request):
-    # Temporary hardcoded data for testing
-    data = [
-        {'id': 1, 'name': 'John Doe'},
-        {'id': 2, 'name': 'Jane Smith'},
-        {'id': 3, 'name': 'Mike Johnson'}
-    ]
-    return Response(data)
+    """Volunteer roster with assigned buses and booking workload.
+
+    ``?offset=`` and ``?limit=`` page through volunteers ordered by username.
+    """
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+        limit = min(max(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(get_roster(offset, limit))
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { passengerAPI } from '../services/api';
+import { documentUploadAPI, passengerAPI } from '../services/api';
 
 interface PassengerFormProps {
   onSuccess?: () => void;
@@ -141,18 +141,15 @@ const PassengerForm: React.FC<PassengerFormProps> = ({ onSuccess, passengerId })
         submitData.append(key, value.toString());
       });
 
-      // Add file if selected
-      if (aadharFile) {
-        submitData.append('aadhar_document', aadharFile);
-      }
+      const response = passengerId
+        ? await passengerAPI.update(passengerId, submitData)
+        : await passengerAPI.create(submitData);
 
-      if (passengerId) {
-        await passengerAPI.update(passengerId, submitData);
-        alert('Passenger updated successfully!');
-      } else {
-        await passengerAPI.create(submitData);
-        alert('Passenger added successfully!');
+      // The document goes up in resumable chunks once the passenger exists
+      if (aadharFile) {
+        await documentUploadAPI.upload(response.data.id, aadharFile);
       }
+      alert(passengerId ? 'Passenger updated successfully!' : 'Passenger added successfully!');
 
       setFormData({
         name: '',
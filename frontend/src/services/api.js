@@ -91,4 +91,58 @@ export const volunteerAPI = {
   create: (data) => api.post('/volunteers/', data),
 };
 
+// Resumable Aadhar document upload: start, PUT chunks from the stored offset, finish
+// crypto.subtle only exists on https (and localhost) origins; elsewhere the checksum is skipped
+const sha256Hex = async (blob) => {
+  if (!globalThis.crypto?.subtle) return '';
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+export const documentUploadAPI = {
+  upload: async (passengerId, file, { retries = 5, onProgress } = {}) => {
+    const sha256 = await sha256Hex(file);
+    const { data: upload } = await api.post(`/passengers/${passengerId}/document-upload/`, {
+      filename: file.name, size: file.size, sha256,
+    });
+    let offset = upload.offset;
+    let failures = 0;
+    while (offset < file.size) {
+      const end = Math.min(offset + upload.chunk_size, file.size);
+      try {
+        const { data } = await api.put(upload.url.replace(/^\/api/, ''), file.slice(offset, end), {
+          headers: { 'Content-Type': 'application/octet-stream', 'Content-Range': `bytes ${offset}-${end - 1}/${file.size}` },
+        });
+        offset = data.offset;
+        failures = 0;
+        if (onProgress) onProgress(offset / file.size);
+      } catch (error) {
+        if (++failures > retries) throw error;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** failures));
+        // Ask where the server got to; a dropped chunk may be partly stored
+        ({ data: { offset } } = await api.get(upload.url.replace(/^\/api/, '')));
+      }
+    }
+    return api.post(`${upload.url.replace(/^\/api/, '')}finish/`, { sha256 });
+  },
+};
+
+// Document verification queue (claim a batch, then approve/reject in bulk)
+export const verificationAPI = {
+  queue: (after = 0, limit = 50, mine = false) => api.get('/verification-queue/', { params: { after, limit, mine: mine ? 1 : undefined } }),
+  claim: (limit = 20) => api.post('/verification-queue/claim/', { limit }),
+  release: (ids) => api.post('/verification-queue/release/', { ids }),
+  decide: (ids, decision, notes = '') => api.post('/verification-queue/decide/', { ids, decision, notes }),
+};
+
+// Offline sync (queued operations up, changed fields down)
+export const syncAPI = {
+  sync: (payload) => api.post('/sync/', payload),
+};
+
+// Change log (incremental reads: keep calling with next_since while has_more)
+export const changesAPI = {
+  since: (since = 0, models = []) => api.get('/changes/', { params: { since, models: models.join(',') } }),
+};
+
 export default api;
\ No newline at end of file